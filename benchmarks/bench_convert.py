@@ -0,0 +1,226 @@
+'''Throughput of CSVConverter.convert for each rule set and output format,
+on synthetic csv files, saved as json for benchmarks.compare.
+
+Each case runs in its own process, so its peak RSS is its own.
+
+Usage:
+    python -m benchmarks.bench_convert [--rows 100000] [--output bench.json]
+        [--rulesets sample_config,wide]
+        [--formats python,json,ndjson,csv,sqlite]
+        [--extra-columns 20] [--error-rate 0.01] [--repeat 3]
+'''
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+from .generators import write_csv
+from .rulesets import ROOT, ruleset_names
+
+# `python` returns the rows as dicts, the rest stream to an outfile (a
+# database for sqlite)
+FORMATS = ['python', 'json', 'ndjson', 'csv', 'sqlite']
+
+# Bumped whenever a result's fields change meaning
+RESULTS_VERSION = 1
+
+
+def peak_rss_kb():
+    '''The peak resident set size of this process, in KB'''
+    # ru_maxrss carries over the parent's peak through fork and exec on
+    # Linux, VmHWM starts again with the new program
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _convert(converter, case):
+    '''Converts the case's csv in its format, returns the rows converted'''
+    if case['format'] == 'python':
+        return len(converter.convert(case['csv']))
+
+    with tempfile.TemporaryDirectory() as directory:
+        outfile = os.path.join(directory, 'out.' + case['format'])
+        return converter.convert(
+            case['csv'], to=case['format'], outfile=outfile
+        )
+
+
+def run_case(case):
+    '''Times one conversion, in this process.
+
+    Args:
+        case (dict): The `csv`, `ruleset`, `format`, and `rows` to run,
+            and how many times to `repeat` the conversion.
+
+    Returns:
+        dict: The case with its `seconds`, `rows_per_sec`, `peak_rss_kb`,
+        and `time_to_first_row`.
+    '''
+    from csv_etl import CSVConverter, ErrorSink
+    from .rulesets import load_ruleset
+
+    with open(case['csv'], newline='') as file:
+        header = next(csv.reader(file))
+    rules = load_ruleset(case['ruleset'], header)
+    converter = CSVConverter(rules, errors=ErrorSink(max_messages=0))
+
+    start = time.perf_counter()
+    rows = converter.iter_convert(case['csv'])
+    next(rows, None)
+    time_to_first_row = time.perf_counter() - start
+    rows.close()
+
+    # the fastest of the repeats, the others were slowed by something else
+    seconds = None
+    for _ in range(case.get('repeat', 1)):
+        start = time.perf_counter()
+        count = _convert(converter, case)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    result = dict(case)
+    del result['csv']
+    result.update({
+        'name': '{}/{}'.format(case['ruleset'], case['format']),
+        'converted': count,
+        'errors': converter.errors.total,
+        'seconds': seconds,
+        # rows read, filters convert fewer than that
+        'rows_per_sec': case['rows'] / seconds if seconds else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'time_to_first_row': time_to_first_row,
+    })
+    return result
+
+
+def run_in_process(case):
+    '''Runs a case in a new python process, see run_case'''
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_convert', '--case',
+         json.dumps(case)],
+        cwd=ROOT, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def git_commit():
+    '''The commit benchmarked, None outside of a git checkout'''
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(
+    rows=100000, rulesets=None, formats=None, extra_columns=20,
+    error_rate=0.01, seed=0, repeat=1
+):
+    '''Benchmarks every rule set in every format, on one generated csv.
+
+    Returns:
+        dict: The results, with the commit and platform they came from.
+    '''
+    rulesets = rulesets or ruleset_names()
+    formats = formats or FORMATS
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.csv')
+        write_csv(
+            path, rows, extra_columns=extra_columns, error_rate=error_rate,
+            seed=seed
+        )
+
+        results = []
+        for ruleset in rulesets:
+            for to in formats:
+                results.append(run_in_process({
+                    'csv': path,
+                    'ruleset': ruleset,
+                    'format': to,
+                    'rows': rows,
+                    'extra_columns': extra_columns,
+                    'error_rate': error_rate,
+                    'repeat': repeat,
+                }))
+
+    return {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.bench_convert',
+        description=__doc__.splitlines()[0]
+    )
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--extra-columns', type=int, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='conversions per case, the fastest is kept')
+    parser.add_argument('--rulesets', default=None,
+                        help='comma separated, all by default')
+    parser.add_argument('--formats', default=None,
+                        help='comma separated, all by default')
+    parser.add_argument('--output', default=None,
+                        help='file to write the json results to')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    if options.case:
+        print(json.dumps(run_case(json.loads(options.case))))
+        return
+
+    suite = run_suite(
+        rows=options.rows,
+        rulesets=options.rulesets and options.rulesets.split(','),
+        formats=options.formats and options.formats.split(','),
+        extra_columns=options.extra_columns,
+        error_rate=options.error_rate,
+        seed=options.seed,
+        repeat=options.repeat
+    )
+
+    for result in suite['results']:
+        print('{:<32} {:>12,.0f} rows/sec {:>10,} KB {:>8.1f} ms'.format(
+            result['name'], result['rows_per_sec'] or 0,
+            result['peak_rss_kb'], result['time_to_first_row'] * 1000
+        ))
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(suite, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
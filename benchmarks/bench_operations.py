@@ -0,0 +1,82 @@
+'''Rows/sec of Rule.execute with per-row eval vs compiled operations.
+
+Usage:
+    python -m benchmarks.bench_operations [rows]
+'''
+import os
+import sys
+import time
+from datetime import datetime
+
+from csv_etl import Rule, OutputType, load_rules_from_yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(ROOT, 'examples', 'config', 'sample_config.yaml')
+
+
+class LegacyRule(Rule):
+    '''Rule that evaluates its operation strings on every call'''
+    def _perform_operations(self, value):
+        params = {}
+
+        if self.output_type == OutputType.Date:
+            params['datetime'] = datetime
+
+        for operation in self.operations:
+            params['s'] = value
+            value = eval(operation, params)
+
+        return value
+
+
+def make_rows(count):
+    '''Builds `count` rows matching the sample_config.yaml sources'''
+    rows = []
+    for i in range(count):
+        rows.append({
+            'Order Number': str(1000 + i),
+            'Year': '2018',
+            'Month': str(i % 12 + 1),
+            'Day': str(i % 28 + 1),
+            'Product Number': 'P-{}'.format(10000 + i % 50),
+            'Product Name': 'iceberg lettuce',
+            'Count': '5,250.50',
+        })
+    return rows
+
+
+def run(rules, rows):
+    '''Executes every rule on every row and returns rows/sec'''
+    start = time.perf_counter()
+    for row in rows:
+        for rule in rules:
+            rule.execute(row)
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main(count=50000):
+    rules = load_rules_from_yaml(CONFIG_PATH)
+    legacy_rules = [
+        LegacyRule(
+            source=rule.source,
+            target=rule.target,
+            type=rule.type,
+            input_type=rule.input_type,
+            output_type=rule.output_type,
+            operations=rule.operations
+        )
+        for rule in rules
+    ]
+    rows = make_rows(count)
+
+    before = run(legacy_rules, rows)
+    after = run(rules, rows)
+
+    print('rows:               {}'.format(count))
+    print('eval per row:       {:,.0f} rows/sec'.format(before))
+    print('compiled:           {:,.0f} rows/sec'.format(after))
+    print('speedup:            {:.2f}x'.format(after / before))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,66 @@
+'''Rows/sec of CSVConverter.convert per rule, with a compiled RowPlan, and
+vectorized with numpy when it is installed.
+
+Usage:
+    python -m benchmarks.bench_plan [rows]
+'''
+import csv
+import os
+import sys
+import tempfile
+import time
+
+from csv_etl import CSVConverter, load_rules_from_yaml
+from csv_etl.vectorized import require_numpy
+
+from .bench_operations import CONFIG_PATH, make_rows
+
+
+def write_csv(path, count):
+    '''Writes `count` rows matching the sample_config.yaml sources'''
+    rows = make_rows(count)
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(converter, path):
+    '''Converts the file and returns rows/sec'''
+    start = time.perf_counter()
+    count = len(converter.convert(path))
+    return count / (time.perf_counter() - start)
+
+
+def has_numpy():
+    try:
+        require_numpy()
+    except ImportError:
+        return False
+    return True
+
+
+def main(count=50000):
+    rules = load_rules_from_yaml(CONFIG_PATH)
+    vectorize = has_numpy()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.csv')
+        write_csv(path, count)
+
+        before = run(CSVConverter(rules, compiled=False), path)
+        after = run(CSVConverter(rules), path)
+        if vectorize:
+            vectorized = run(CSVConverter(rules, vectorize=True), path)
+
+    print('rows:               {}'.format(count))
+    print('per rule:           {:,.0f} rows/sec'.format(before))
+    print('compiled plan:      {:,.0f} rows/sec'.format(after))
+    print('speedup:            {:.2f}x'.format(after / before))
+    if vectorize:
+        print('vectorized:         {:,.0f} rows/sec'.format(vectorized))
+        print('speedup:            {:.2f}x'.format(vectorized / before))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,72 @@
+'''Time from starting csv-etl to its first row of output, with the rules
+parsed from the config, and loaded from the rule cache.
+
+Usage:
+    python -m benchmarks.bench_startup [runs]
+'''
+import os
+import sys
+import statistics
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+CONFIG_PATH = os.path.join(ROOT, 'tests', 'resources', 'test_config.yaml')
+
+CSV_PATH = os.path.join(ROOT, 'tests', 'resources', 'test_csv_data.csv')
+
+# Runs csv-etl from this checkout, the same as the console script
+COMMAND = [sys.executable, '-c', 'from csv_etl.cli import main; main()']
+
+
+def cli_env(cache_dir):
+    '''The environment to run csv-etl from this checkout with a rule cache
+    in cache_dir'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(ROOT)
+    env['CSV_ETL_CACHE_DIR'] = cache_dir
+    return env
+
+
+def time_to_first_row(args, env):
+    '''Runs csv-etl and returns the seconds until it prints a row'''
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        COMMAND + args, env=env, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    process.stdout.readline()
+    elapsed = time.perf_counter() - start
+
+    process.stdout.close()
+    process.wait()
+    return elapsed
+
+
+def median_time_to_first_row(args, env, runs):
+    return statistics.median(
+        time_to_first_row(args, env) for _ in range(runs)
+    )
+
+
+def main(runs=10):
+    args = [CONFIG_PATH, CSV_PATH, '--format=ndjson']
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = cli_env(cache_dir)
+        parsed = median_time_to_first_row(
+            args + ['--no-rule-cache'], env, runs
+        )
+        # the first run fills the cache
+        time_to_first_row(args, env)
+        cached = median_time_to_first_row(args, env, runs)
+
+    print('runs:               {}'.format(runs))
+    print('parsed rules:       {:.1f} ms'.format(parsed * 1000))
+    print('cached rules:       {:.1f} ms'.format(cached * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,100 @@
+'''Compares two bench_convert result files, and fails if any case got
+slower or bigger than the tolerance allows.
+
+Usage:
+    python -m benchmarks.compare baseline.json results.json [tolerance]
+
+Exits with 1 when there is a regression, so it can gate a release.
+'''
+import sys
+import json
+
+# Allowed change before a metric counts as a regression, 10% by default
+DEFAULT_TOLERANCE = 0.1
+
+# Each metric, and whether a bigger value is better
+METRICS = {
+    'rows_per_sec': True,
+    'peak_rss_kb': False,
+    'time_to_first_row': False,
+}
+
+# Metrics that only count once they change by this much, absolute times
+# this small are mostly noise
+MIN_CHANGE = {
+    'time_to_first_row': 0.005,
+}
+
+
+def _key(result):
+    return (
+        result['name'], result['rows'], result.get('extra_columns'),
+        result.get('error_rate')
+    )
+
+
+def compare(baseline, current):
+    '''Finds the metrics that regressed between two result sets.
+
+    Only cases in both are compared.
+
+    Args:
+        baseline (dict): The results to compare against.
+        current (dict): The new results.
+
+    Returns:
+        list: (name, metric, baseline value, current value, change) for
+        each metric of each case, change is the fraction it got worse by.
+    '''
+    before = {_key(result): result for result in baseline['results']}
+    changes = []
+
+    for result in current['results']:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+
+        for metric, bigger_is_better in METRICS.items():
+            old_value, value = old.get(metric), result.get(metric)
+            if not old_value or value is None:
+                continue
+
+            change = (value - old_value) / old_value
+            if bigger_is_better:
+                change = -change
+            if abs(value - old_value) < MIN_CHANGE.get(metric, 0):
+                change = 0.0
+            changes.append((result['name'], metric, old_value, value, change))
+
+    return changes
+
+
+def regressions(changes, tolerance=DEFAULT_TOLERANCE):
+    '''The changes from compare() that are worse than tolerance'''
+    return [change for change in changes if change[4] > tolerance]
+
+
+def main(args):
+    with open(args[0]) as file:
+        baseline = json.load(file)
+    with open(args[1]) as file:
+        current = json.load(file)
+    tolerance = float(args[2]) if len(args) > 2 else DEFAULT_TOLERANCE
+
+    changes = compare(baseline, current)
+    for name, metric, old_value, value, change in changes:
+        flag = 'REGRESSED' if change > tolerance else ''
+        print('{:<32} {:<18} {:>14,.3f} {:>14,.3f} {:>+7.1%} {}'.format(
+            name, metric, old_value, value, (value - old_value) / old_value,
+            flag
+        ).rstrip())
+
+    failed = regressions(changes, tolerance)
+    if failed:
+        print('{} regression(s) beyond {:.0%}'.format(len(failed), tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
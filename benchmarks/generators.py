@@ -0,0 +1,162 @@
+'''Synthetic csv files for the benchmarks, shaped like the order data the
+example configs read, with optional filler columns.
+
+Usage:
+    python -m benchmarks.generators path rows [extra_columns] [error_rate]
+'''
+import csv
+import random
+import string
+import sys
+
+# The columns examples/config/*.yaml read
+ORDER_COLUMNS = [
+    'Order Number', 'Year', 'Month', 'Day', 'Product Number', 'Product Name',
+    'Count',
+]
+
+# How the filler columns are split between kinds of value
+DEFAULT_MIX = {'numeric': 0.4, 'string': 0.4, 'date': 0.2}
+
+# Values that fail the Integer/Decimal casts, used for error_rate
+BAD_NUMBERS = ['n/a', '', '12.5.1', 'unknown']
+
+# Distinct values of each string column, so some rules repeat
+STRING_POOL_SIZE = 1000
+
+# Distinct rows generated, larger files repeat them
+ROW_BLOCK_SIZE = 10000
+
+# Rows written per writerows call
+WRITE_BATCH_SIZE = 10000
+
+
+def filler_columns(count, mix=None):
+    '''Names the filler columns, after the kind of value in each.
+
+    Args:
+        count (int): The number of filler columns.
+        mix (dict): Optional - The fraction of `numeric`, `string`, and
+            `date` columns, DEFAULT_MIX by default.
+
+    Returns:
+        list: (name, kind) for each column.
+    '''
+    mix = mix or DEFAULT_MIX
+    total = sum(mix.values())
+    columns = []
+    for kind, fraction in mix.items():
+        for _ in range(round(count * fraction / total)):
+            columns.append(('{} {}'.format(kind, len(columns)), kind))
+
+    # rounding can leave the count off by one either way
+    while len(columns) < count:
+        columns.append(('string {}'.format(len(columns)), 'string'))
+    return columns[:count]
+
+
+def _string_pool(rand, count, width):
+    letters = string.ascii_lowercase + ' '
+    return [
+        ''.join(rand.choice(letters) for _ in range(width)).strip() or 'x'
+        for _ in range(count)
+    ]
+
+
+def _random_row(rand, i, kinds, names, products, error_rate):
+    '''A row without its Order Number'''
+    row = [
+        str(2000 + i % 25),
+        str(i % 12 + 1),
+        str(i % 28 + 1),
+        products[rand.randrange(STRING_POOL_SIZE)],
+        names[rand.randrange(STRING_POOL_SIZE)],
+        '{:,.2f}'.format(rand.random() * 10000),
+    ]
+
+    for kind in kinds:
+        if kind == 'numeric':
+            row.append('{:.3f}'.format(rand.random() * 1000))
+        elif kind == 'date':
+            row.append('20{:02d}-{:02d}-{:02d}'.format(
+                rand.randrange(30), rand.randrange(1, 13),
+                rand.randrange(1, 29)
+            ))
+        else:
+            row.append(names[rand.randrange(STRING_POOL_SIZE)])
+
+    if error_rate and rand.random() < error_rate:
+        # breaks the Day or Count cast
+        position = 2 if rand.random() < 0.5 else 5
+        row[position] = rand.choice(BAD_NUMBERS)
+
+    return row
+
+
+def iter_rows(
+    count, extra_columns=0, text_width=16, mix=None, error_rate=0.0, seed=0
+):
+    '''Generates order rows, after the header.
+
+    Random rows are generated once for a block of ROW_BLOCK_SIZE and
+    repeated with new Order Numbers, random values for every row are too
+    slow for the 100M row files.
+
+    Args:
+        count (int): The number of rows.
+        extra_columns (int): Optional - Filler columns after ORDER_COLUMNS.
+        text_width (int): Optional - The length of string values.
+        mix (dict): Optional - The mix of filler columns, see
+            filler_columns.
+        error_rate (float): Optional - The fraction of rows with a value
+            the numeric rules can't cast.
+        seed (int): Optional - Seeds the values, so runs are comparable.
+
+    Yields:
+        list: The header, then each row.
+    '''
+    rand = random.Random(seed)
+    fillers = filler_columns(extra_columns, mix)
+    names = _string_pool(rand, STRING_POOL_SIZE, text_width)
+    products = ['P-{}'.format(10000 + i) for i in range(STRING_POOL_SIZE)]
+
+    yield ORDER_COLUMNS + [name for name, _ in fillers]
+
+    kinds = [kind for _, kind in fillers]
+    block = [
+        _random_row(rand, i, kinds, names, products, error_rate)
+        for i in range(min(count, ROW_BLOCK_SIZE))
+    ]
+
+    for i in range(count):
+        yield [str(1000 + i)] + block[i % ROW_BLOCK_SIZE]
+
+
+def write_csv(path, count, **options):
+    '''Writes a synthetic csv, streaming it so any row count fits in
+    memory. Takes the options of iter_rows.
+
+    Returns:
+        list: The header written.
+    '''
+    rows = iter_rows(count, **options)
+    header = next(rows)
+
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        while True:
+            batch = [row for _, row in zip(range(WRITE_BATCH_SIZE), rows)]
+            if not batch:
+                return header
+            writer.writerows(batch)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    write_csv(
+        args[0],
+        int(args[1]),
+        extra_columns=int(args[2]) if len(args) > 2 else 0,
+        error_rate=float(args[3]) if len(args) > 3 else 0.0
+    )
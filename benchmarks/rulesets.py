@@ -0,0 +1,73 @@
+'''The rule sets benchmarked, the example configs and one reading every
+column of a wide file.'''
+import glob
+import os
+
+from csv_etl import Rule, RuleType, InputType, OutputType, load_rules_from_yaml
+
+from .generators import ORDER_COLUMNS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_CONFIG_DIR = os.path.join(ROOT, 'examples', 'config')
+
+# Every order column, plus a rule per filler column
+WIDE = 'wide'
+
+
+def example_configs():
+    '''
+    Returns:
+        dict: The file path of each examples/config yaml, by name.
+    '''
+    paths = sorted(glob.glob(os.path.join(EXAMPLE_CONFIG_DIR, '*.yaml')))
+    return {
+        os.path.splitext(os.path.basename(path))[0]: path for path in paths
+    }
+
+
+def ruleset_names():
+    return list(example_configs()) + [WIDE]
+
+
+def filler_rules(header):
+    '''A rule for each column of a generated csv after ORDER_COLUMNS, by
+    the kind named in the column'''
+    rules = []
+    for column in header[len(ORDER_COLUMNS):]:
+        kind = column.split(' ')[0]
+        if kind == 'numeric':
+            rule = Rule(
+                source=column, target=column, type=RuleType.Calculation,
+                input_type=InputType.Decimal, output_type=OutputType.Decimal,
+                operations=['s * 2']
+            )
+        else:
+            operations = ['s.upper()'] if kind == 'string' else []
+            rule = Rule(
+                source=column, target=column, type=RuleType.Calculation,
+                operations=operations
+            )
+        rules.append(rule)
+    return rules
+
+
+def load_ruleset(name, header):
+    '''Loads a rule set by name.
+
+    Args:
+        name (str): An example config's name, or WIDE.
+        header (list): The header of the generated csv.
+
+    Returns:
+        list: The rules.
+    '''
+    configs = example_configs()
+    if name == WIDE:
+        return load_rules_from_yaml(configs['sample_config']) + \
+            filler_rules(header)
+
+    if name not in configs:
+        raise ValueError('Unknown rule set: {}, expected one of {}'.format(
+            name, ', '.join(ruleset_names())
+        ))
+    return load_rules_from_yaml(configs[name])
@@ -1,13 +1,43 @@
-
 __version__ = '0.1.3'
 
-from .csv_etl import CSVConverter
+from .csv_etl import CSVConverter, MissingSourcePolicy
+from .errors import ErrorSink, ErrorRecord, ErrorKind
 from .rules import (
     Rule,
     RuleType,
     InputType,
     OutputType,
     load_rules_from_yaml,
+    load_config_from_yaml,
     SourceNotFound,
-    ConversionError
+    ConversionError,
+    InvalidOperation
 )
+
+# Exports whose modules a plain conversion doesn't need, imported the
+# first time they're used, see __getattr__
+LAZY_EXPORTS = {
+    'ConversionStats': 'stats',
+    'RuleStats': 'stats',
+    'Aggregation': 'aggregate',
+    'AggregateField': 'aggregate',
+    'LookupTable': 'lookup',
+    'RowTable': 'table',
+}
+
+
+def __getattr__(name):
+    '''Imports the module of a LAZY_EXPORTS name when it is first used'''
+    if name not in LAZY_EXPORTS:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name)
+        )
+
+    from importlib import import_module
+    value = getattr(import_module('.' + LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_EXPORTS))
@@ -0,0 +1,505 @@
+import os
+import sys
+import heapq
+import pickle
+from operator import itemgetter
+from datetime import datetime
+
+from .rules import OutputType
+
+# The functions an aggregate field can use
+FUNCTIONS = ('sum', 'count', 'min', 'max', 'mean', 'distinct_count')
+
+# Functions that only work on Integer or Decimal values
+NUMERIC_FUNCTIONS = ('sum', 'mean')
+
+# Estimated memory the groups can use before they are spilled to disk
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Estimated bytes of a group besides its key and values: the dict entry,
+# the key tuple, and the state list
+GROUP_OVERHEAD = 200
+
+# Estimated bytes of a set entry besides its value
+DISTINCT_OVERHEAD = 60
+
+# Groups pickled together in a spill file
+SPILL_BLOCK_SIZE = 1000
+
+# Adds a row to its group's state, the generated names start with _a_ so
+# they can't clash with the targets
+UPDATE_FUNCTION_TEMPLATE = '''
+def _a_update(_a_groups, _a_row):
+    _a_key = ({},)
+    _a_state = _a_groups.get(_a_key)
+    if _a_state is None:
+        _a_state = _a_groups[_a_key] = _a_new(_a_key)
+{}
+'''
+
+
+def _sort_key(key):
+    '''Orders group keys holding any mix of values, numbers first.
+
+    Keys that are equal get equal sort keys, so they end up next to each
+    other when runs are merged.
+    '''
+    order = []
+    for value in key:
+        if isinstance(value, (int, float)):
+            # nan isn't ordered, and each nan is its own group anyway
+            order.append((0, value) if value == value else (1, 0))
+        elif isinstance(value, str):
+            order.append((2, value))
+        elif isinstance(value, datetime):
+            order.append((3, value))
+        elif value is None:
+            order.append((4, 0))
+        else:
+            order.append((5, repr(value)))
+    return tuple(order)
+
+
+def _sorted_groups(groups):
+    '''The groups as a list of (sort key, key, state), sorted'''
+    return sorted(
+        [(_sort_key(key), key, state) for key, state in groups.items()],
+        key=itemgetter(0)
+    )
+
+
+class AggregateField:
+    '''
+    An aggregate computed for every group
+
+    Blank values (rows whose rule failed, or missing sources) are skipped
+    by every function except a `count` without a source.
+
+    ...
+
+    Attributes
+    ----------
+    target : str
+        the key of the aggregate in each result row
+    function : str
+        one of FUNCTIONS
+    source : str
+        the rule target to aggregate, optional for `count`, which counts
+        the rows of each group without one
+    '''
+
+    def __init__(self, target, function, source=None):
+        if function not in FUNCTIONS:
+            raise ValueError(
+                'Unknown aggregate function: {}, expected one of {}'.format(
+                    function, ', '.join(FUNCTIONS)
+                )
+            )
+        if source is None and function != 'count':
+            raise ValueError(
+                'Aggregate {} needs a source for {}'.format(target, function)
+            )
+
+        self.target = target
+        self.function = function
+        self.source = source
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the field
+        '''
+        result = {'target': self.target, 'function': self.function}
+        if self.source is not None:
+            result['source'] = self.source
+        return result
+
+
+class Aggregation:
+    '''
+    A streaming hash aggregation of converted rows, grouped by some of
+    their targets
+
+    Groups are kept in a dict while they fit in memory_limit, estimated
+    from the size of their keys and distinct values. Above it they are
+    sorted and spilled to a temporary file, and the files are merged at
+    the end, so the memory needed depends on the number of groups, not
+    rows. Results come out sorted by group, numbers before strings.
+
+    ...
+
+    Attributes
+    ----------
+    group_by : list
+        the targets to group the rows by
+    fields : list
+        the AggregateField computed for each group
+    memory_limit : int
+        the estimated bytes of groups to keep in memory before spilling
+    spill_dir : str
+        optional - where to write the spill files, the system's temporary
+        directory by default
+    groups : int
+        the number of groups in the last aggregation
+    spills : int
+        the number of spill files the last aggregation wrote
+    '''
+
+    def __init__(
+        self, group_by, fields, memory_limit=DEFAULT_MEMORY_LIMIT,
+        spill_dir=None
+    ):
+        if not group_by:
+            raise ValueError('An aggregation needs at least one group_by')
+
+        self.group_by = list(group_by)
+        self.fields = fields
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.groups = 0
+        self.spills = 0
+
+    @classmethod
+    def from_dict(cls, definition):
+        '''Creates an aggregation from the `aggregate` section of a yaml
+        configuration.
+
+        Returns:
+            Aggregation: The aggregation.
+        '''
+        group_by = definition['group_by']
+        if type(group_by) is not list:
+            group_by = [group_by]
+
+        fields = [
+            AggregateField(
+                field['target'], field['function'], field.get('source')
+            )
+            for field in definition['fields']
+        ]
+        return cls(
+            group_by,
+            fields,
+            definition.get('memory_limit', DEFAULT_MEMORY_LIMIT),
+            definition.get('spill_dir')
+        )
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the aggregation
+        '''
+        result = {
+            'group_by': self.group_by,
+            'fields': [field.as_dict() for field in self.fields],
+            'memory_limit': self.memory_limit,
+        }
+        if self.spill_dir is not None:
+            result['spill_dir'] = self.spill_dir
+        return result
+
+    @property
+    def field_names(self):
+        '''list: The keys of each result row, in output order'''
+        return self.group_by + [field.target for field in self.fields]
+
+    def date_fields(self, rules):
+        '''
+        Returns:
+            list: The result keys holding dates, given the rules whose rows
+            are aggregated.
+        '''
+        dates = {
+            rule.target for rule in rules
+            if rule.output_type == OutputType.Date
+        }
+        return [target for target in self.group_by if target in dates] + [
+            field.target for field in self.fields
+            if field.function in ('min', 'max') and field.source in dates
+        ]
+
+    def field_types(self, rules):
+        '''
+        Returns:
+            dict: The OutputType of each result key, given the rules whose
+            rows are aggregated. Counts are Integer, means Decimal, and the
+            rest the type of their source.
+        '''
+        types = {rule.target: rule.output_type for rule in rules}
+        result = {target: types[target] for target in self.group_by}
+        for field in self.fields:
+            if field.function in ('count', 'distinct_count'):
+                result[field.target] = OutputType.Integer
+            elif field.function == 'mean':
+                result[field.target] = OutputType.Decimal
+            else:
+                result[field.target] = types[field.source]
+        return result
+
+    def check(self, rules):
+        '''Checks the aggregation can run on the rows of some rules.
+
+        Args:
+            rules (list): The rules whose rows are aggregated.
+
+        Raises:
+            ValueError: If a group_by or source isn't the target of a rule,
+                or `sum` or `mean` is used on a rule that doesn't output
+                Integer or Decimal values.
+        '''
+        types = {rule.target: rule.output_type for rule in rules}
+
+        for target in self.group_by:
+            if target not in types:
+                raise ValueError(
+                    'Unknown group_by: {}, not the target of a rule'
+                    .format(target)
+                )
+
+        for field in self.fields:
+            if field.source is None:
+                continue
+            if field.source not in types:
+                raise ValueError(
+                    'Unknown source for aggregate {}: {}, not the target '
+                    'of a rule'.format(field.target, field.source)
+                )
+            if field.function in NUMERIC_FUNCTIONS and types[field.source] \
+                    not in (OutputType.Integer, OutputType.Decimal):
+                raise ValueError(
+                    'Aggregate {} can only {} Integer or Decimal values, '
+                    '{} outputs {}'.format(
+                        field.target, field.function, field.source,
+                        types[field.source].value
+                    )
+                )
+
+    def _slots(self):
+        '''The position of each field's state in a group's state list,
+        mean takes two, its sum and count'''
+        slots = []
+        position = 0
+        for field in self.fields:
+            slots.append(position)
+            position += 2 if field.function == 'mean' else 1
+        return slots, position
+
+    def _compile(self, new_group, size):
+        '''Generates the function adding a row to its group's state.
+
+        Args:
+            new_group (function): Called with the key of each new group,
+                returns its initial state.
+            size (list): The estimated bytes of the groups, in size[0],
+                added to as distinct values are stored.
+
+        Returns:
+            function: Takes the groups dict and a converted row.
+        '''
+        namespace = {
+            '_a_new': new_group,
+            '_a_size': size,
+            '_a_sizeof': sys.getsizeof,
+        }
+        keys = []
+        for i, target in enumerate(self.group_by):
+            namespace['_a_g{}'.format(i)] = target
+            keys.append('_a_row[_a_g{}]'.format(i))
+
+        slots, _ = self._slots()
+        body = []
+        for i, (field, slot) in enumerate(zip(self.fields, slots)):
+            body.append('    # {} {}'.format(field.function, field.target))
+            if field.source is None:
+                body.append('    _a_state[{}] += 1'.format(slot))
+                continue
+
+            namespace['_a_s{}'.format(i)] = field.source
+            body.extend([
+                '    _a_v = _a_row[_a_s{}]'.format(i),
+                '    if _a_v is not None and _a_v != \'\':',
+            ])
+            if field.function == 'sum':
+                body.append('        _a_state[{}] += _a_v'.format(slot))
+            elif field.function == 'count':
+                body.append('        _a_state[{}] += 1'.format(slot))
+            elif field.function in ('min', 'max'):
+                compare = '<' if field.function == 'min' else '>'
+                body.extend([
+                    '        _a_m = _a_state[{}]'.format(slot),
+                    '        if _a_m is None or _a_v {} _a_m:'.format(compare),
+                    '            _a_state[{}] = _a_v'.format(slot),
+                ])
+            elif field.function == 'mean':
+                body.extend([
+                    '        _a_state[{}] += _a_v'.format(slot),
+                    '        _a_state[{}] += 1'.format(slot + 1),
+                ])
+            else:
+                body.extend([
+                    '        _a_d = _a_state[{}]'.format(slot),
+                    '        if _a_v not in _a_d:',
+                    '            _a_d.add(_a_v)',
+                    '            _a_size[0] += _a_sizeof(_a_v) + {}'.format(
+                        DISTINCT_OVERHEAD
+                    ),
+                ])
+
+        source = UPDATE_FUNCTION_TEMPLATE.format(
+            ', '.join(keys), '\n'.join(body) or '    pass'
+        )
+        exec(compile(source, '<aggregate>', 'exec'), namespace)
+        return namespace['_a_update']
+
+    def _new_state(self):
+        '''The state of a group before any rows are added'''
+        slots, size = self._slots()
+        state = [0] * size
+        for field, slot in zip(self.fields, slots):
+            if field.function in ('min', 'max'):
+                state[slot] = None
+            elif field.function == 'distinct_count':
+                state[slot] = set()
+        return state
+
+    def _combine(self, state, other, slots):
+        '''Adds the state of the same group from another run to state'''
+        for field, slot in zip(self.fields, slots):
+            value = other[slot]
+            if field.function in ('sum', 'count'):
+                state[slot] += value
+            elif field.function == 'mean':
+                state[slot] += value
+                state[slot + 1] += other[slot + 1]
+            elif field.function == 'distinct_count':
+                state[slot] |= value
+            elif value is not None:
+                current = state[slot]
+                if current is None or (
+                    value < current if field.function == 'min'
+                    else value > current
+                ):
+                    state[slot] = value
+
+    def _result(self, key, state, slots):
+        '''The result row of a group'''
+        row = dict(zip(self.group_by, key))
+        for field, slot in zip(self.fields, slots):
+            value = state[slot]
+            if field.function == 'mean':
+                count = state[slot + 1]
+                value = value / count if count else ''
+            elif field.function == 'distinct_count':
+                value = len(value)
+            elif value is None:
+                value = ''
+            row[field.target] = value
+        return row
+
+    def _spill(self, groups, directory):
+        '''Writes the groups to a new spill file, sorted by key'''
+        path = os.path.join(directory, 'run-{}'.format(self.spills))
+        items = _sorted_groups(groups)
+        with open(path, 'wb') as file:
+            for start in range(0, len(items), SPILL_BLOCK_SIZE):
+                pickle.dump(
+                    items[start:start + SPILL_BLOCK_SIZE], file,
+                    pickle.HIGHEST_PROTOCOL
+                )
+        self.spills += 1
+        return path
+
+    def _read_run(self, path):
+        '''Reads back the (sort key, key, state) of a spill file, in
+        order'''
+        with open(path, 'rb') as file:
+            while True:
+                try:
+                    block = pickle.load(file)
+                except EOFError:
+                    return
+                yield from block
+
+    def _merge(self, runs):
+        '''Merges sorted runs of (sort key, key, state), combining the
+        states of equal keys.
+
+        Yields:
+            tuple: The key and state of each group, in order.
+        '''
+        slots, _ = self._slots()
+        current = None
+        for order, key, state in heapq.merge(*runs, key=itemgetter(0)):
+            if current is not None and order == current[0] and \
+                    key == current[1]:
+                self._combine(current[2], state, slots)
+                continue
+            if current is not None:
+                yield current[1:]
+            current = (order, key, state)
+
+        if current is not None:
+            yield current[1:]
+
+    def aggregate(self, rows):
+        '''Aggregates converted rows.
+
+        Args:
+            rows (iterable): The converted rows (dicts).
+
+        Yields:
+            dict: A row per group, with the group_by values and the fields.
+        '''
+        # only imported when needed, it adds to every run's startup
+        import tempfile
+
+        template = self._new_state()
+        distinct = [
+            slot for field, slot in zip(self.fields, self._slots()[0])
+            if field.function == 'distinct_count'
+        ]
+        key_overhead = GROUP_OVERHEAD + 8 * len(template)
+        size = [0]
+
+        def new_group(key):
+            size[0] += key_overhead + sum(map(sys.getsizeof, key))
+            state = template[:]
+            for slot in distinct:
+                state[slot] = set()
+            return state
+
+        update = self._compile(new_group, size)
+        limit = self.memory_limit
+        groups = {}
+        self.groups = self.spills = 0
+        directory = None
+        runs = []
+
+        try:
+            for row in rows:
+                update(groups, row)
+                if size[0] > limit:
+                    if directory is None:
+                        directory = tempfile.TemporaryDirectory(
+                            prefix='csv-etl-aggregate-', dir=self.spill_dir
+                        )
+                    runs.append(self._spill(groups, directory.name))
+                    groups = {}
+                    size[0] = 0
+
+            in_memory = _sorted_groups(groups)
+            del groups
+            if runs:
+                merged = self._merge(
+                    [self._read_run(path) for path in runs] + [in_memory]
+                )
+            else:
+                merged = (item[1:] for item in in_memory)
+
+            slots, _ = self._slots()
+            for key, state in merged:
+                self.groups += 1
+                yield self._result(key, state, slots)
+        finally:
+            if directory is not None:
+                directory.cleanup()
@@ -0,0 +1,223 @@
+import os
+import glob
+from collections import deque
+from itertools import islice
+
+from .compression import EXTENSIONS
+from .errors import ErrorSink
+
+# File extension of the outfile for each output format
+OUTPUT_EXTENSIONS = {
+    'csv': '.csv',
+    'json': '.json',
+    'ndjson': '.ndjson',
+}
+
+# Files queued per worker, bounds how many files are in flight at once
+PENDING_FILES_PER_WORKER = 2
+
+# Set in each worker process by _init_worker
+_worker_state = {}
+
+
+class FileResult:
+    '''
+    The outcome of converting one file of a batch
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the csv file
+    outfile : str
+        the file the result was written to
+    rows : int
+        the number of rows written, None if the conversion failed
+    errors : dict
+        the ErrorSink.summary() of the file's rule errors
+    failure : str
+        why the file couldn't be converted, None if it was
+    '''
+
+    def __init__(self, path, outfile, rows=None, errors=None, failure=None):
+        self.path = path
+        self.outfile = outfile
+        self.rows = rows
+        self.errors = errors or {}
+        self.failure = failure
+
+    @property
+    def ok(self):
+        '''bool: Whether the file was converted'''
+        return self.failure is None
+
+    def __repr__(self):
+        if self.ok:
+            return 'FileResult({!r}, rows={})'.format(self.path, self.rows)
+        return 'FileResult({!r}, failure={!r})'.format(
+            self.path, self.failure
+        )
+
+
+def expand_paths(patterns):
+    '''Expands glob patterns into file paths.
+
+    `**` matches any number of directories. Patterns that match nothing
+    are kept as they are, so they are reported as failures.
+
+    Args:
+        patterns (list): File paths and glob patterns.
+
+    Returns:
+        list: The file paths, in order, without duplicates.
+    '''
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        matches = [path for path in matches if not os.path.isdir(path)]
+        paths.extend(matches or [pattern])
+
+    return list(dict.fromkeys(paths))
+
+
+def output_path(path, outdir, to):
+    '''
+    Returns:
+        str: The outfile for a csv file in outdir, its name without the
+        `.csv` and compression extensions, plus the `to` format's.
+    '''
+    name = os.path.basename(path)
+    root, extension = os.path.splitext(name)
+    if extension.lower() in EXTENSIONS:
+        name = root
+        root, extension = os.path.splitext(name)
+    if extension.lower() == '.csv':
+        name = root
+
+    return os.path.join(outdir, name + OUTPUT_EXTENSIONS[to])
+
+
+def _convert_file(converter, path, outfile, to, compact, error_dir):
+    '''Converts one file, reporting failures rather than raising them
+
+    Returns:
+        FileResult: The outcome.
+    '''
+    errors = converter.errors
+    errors.sidecar = None
+    if error_dir is not None:
+        errors.sidecar = os.path.join(
+            error_dir, os.path.basename(outfile) + '.errors.ndjson'
+        )
+
+    try:
+        rows = converter.convert(path, to=to, outfile=outfile, compact=compact)
+    except Exception as e:
+        # leaves no partial output behind
+        if os.path.exists(outfile):
+            os.remove(outfile)
+        return FileResult(
+            path, outfile, failure='{}: {}'.format(type(e).__name__, e)
+        )
+
+    return FileResult(path, outfile, rows, errors.summary())
+
+
+def _init_worker(converter, options):
+    '''Stores the converter in the worker, so rules are only sent once'''
+    _worker_state['converter'] = converter
+    _worker_state['options'] = options
+
+
+def _convert_in_worker(path, outfile):
+    return _convert_file(
+        _worker_state['converter'], path, outfile, *_worker_state['options']
+    )
+
+
+def iter_convert_batch(
+    converter, patterns, outdir, to='json', compact=False, workers=1,
+    error_dir=None, max_pending=None
+):
+    '''Converts many csv files with the same rules, across a pool of
+    worker processes
+
+    The rules are sent to each worker once, and each worker converts
+    whole files. Only `max_pending` files are queued at a time, so a long
+    list of files doesn't build up in memory. Files that fail to convert
+    are reported, not raised, and their partial outfile is removed.
+
+    Args:
+        converter (CSVConverter): The converter to run.
+        patterns (list): The csv file paths, or glob patterns.
+        outdir (str): The directory to write the outfiles to, created if
+            needed. Each is named after its csv, see output_path.
+        to (str): The output format, `csv`, `json`, or `ndjson`.
+        compact (bool): Optional - Compact json and ndjson output.
+        workers (int): Optional - The number of processes to convert with.
+        error_dir (str): Optional - A directory to write each file's rule
+            errors to, as `<outfile name>.errors.ndjson`.
+        max_pending (int): Optional - The most files queued at once,
+            PENDING_FILES_PER_WORKER per worker by default.
+
+    Yields:
+        FileResult: The outcome of each file, in the order given.
+
+    Raises:
+        ValueError: If `to` is not a known format, or two files would be
+            written to the same outfile.
+    '''
+    if to not in OUTPUT_EXTENSIONS:
+        raise ValueError('Unknown output format: {}'.format(to))
+
+    paths = expand_paths(patterns)
+    jobs = [(path, output_path(path, outdir, to)) for path in paths]
+
+    seen = {}
+    for path, outfile in jobs:
+        if outfile in seen:
+            raise ValueError('{} and {} would both be written to {}'.format(
+                seen[outfile], path, outfile
+            ))
+        seen[outfile] = path
+
+    os.makedirs(outdir, exist_ok=True)
+    if error_dir is not None:
+        os.makedirs(error_dir, exist_ok=True)
+
+    # rule errors are counted per file, and only written to error_dir,
+    # nothing is printed between the per file results
+    sink = converter.errors
+    converter.errors = ErrorSink(max_messages=0, quiet=True)
+    options = (to, compact, error_dir)
+
+    try:
+        if workers <= 1:
+            for path, outfile in jobs:
+                yield _convert_file(converter, path, outfile, *options)
+            return
+
+        # only imported when needed, it adds to every run's startup
+        from multiprocessing import Pool
+
+        # lookup indexes are built once, here, for the workers to share
+        converter._start_lookups()
+
+        with Pool(
+            workers, initializer=_init_worker, initargs=(converter, options)
+        ) as pool:
+            pending = deque()
+            jobs = iter(jobs)
+            queued = max_pending or workers * PENDING_FILES_PER_WORKER
+
+            while True:
+                for job in islice(jobs, queued - len(pending)):
+                    pending.append(pool.apply_async(_convert_in_worker, job))
+
+                if not pending:
+                    return
+
+                yield pending.popleft().get()
+    finally:
+        converter.errors = sink
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+
+class OperationCache:
+    '''
+    A bounded LRU cache of a rule's results, keyed on the raw csv value(s)
+    the rule reads
+
+    ...
+
+    Attributes
+    ----------
+    maxsize : int
+        the number of results kept, the least recently used are evicted
+    hits : int
+        the number of lookups that found a result
+    misses : int
+        the number of lookups that didn't
+    evictions : int
+        the number of results dropped to stay under maxsize
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values = OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        '''Looks up a result, marking it as recently used.
+
+        Args:
+            key: The raw csv value, or a tuple of them for list sources.
+            default: Returned when there is no result for `key`.
+        '''
+        try:
+            value = self._values[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._values.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''Stores a result, evicting the least recently used if full'''
+        self._values[key] = value
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        '''Drops every result and resets the counters'''
+        self._values.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        '''
+        Returns:
+            dict: The counters, size, and maxsize of the cache
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._values),
+            'maxsize': self.maxsize
+        }
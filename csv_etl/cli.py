@@ -1,7 +1,21 @@
+import os
+import sys
+import csv as csv_module
+
 import click
 
-from .rules import load_rules_from_yaml
+from .config_cache import default_cache_dir
+from .rules import load_config_from_yaml
 from .csv_etl import CSVConverter
+from .columnar import COLUMNAR_FORMATS, require_pyarrow
+from .errors import ErrorSink, DEFAULT_MAX_MESSAGES
+
+
+def _load_config(config, no_rule_cache):
+    '''Loads the rules and aggregation, from the rule cache unless
+    no_rule_cache is set'''
+    cache_dir = None if no_rule_cache else default_cache_dir()
+    return load_config_from_yaml(config, cache_dir=cache_dir)
 
 
 @click.command()
@@ -9,17 +23,213 @@ from .csv_etl import CSVConverter
 @click.argument('csv', type=click.Path(exists=True))
 @click.option('--outfile',
               default=None,
-              help='File path to write the result to'
+              help='File path to write the result to, compressed if it '
+                   'ends in .gz, .bz2, .xz or .zst'
               )
 @click.option('--format',
               default='json',
-              help='Format the result should be. "json" or "csv"'
-              )
-def main(config, csv, outfile, format):
-    rules = load_rules_from_yaml(config)
-    converter = CSVConverter(rules)
-    result = converter.convert(csv, to=format, outfile=outfile)
-    if outfile:
-        print('Done')
+              help='Format the result should be. "json", "ndjson", "csv", '
+                   '"sqlite" to load --outfile as a SQLite database, or '
+                   '"parquet" or "arrow" to write --outfile as columns '
+                   '(requires pyarrow)'
+              )
+@click.option('--compact',
+              is_flag=True,
+              help='Leave the whitespace out of json and ndjson results'
+              )
+@click.option('--table',
+              default=None,
+              help='Table to load with --format sqlite, named after the csv '
+                   'by default'
+              )
+@click.option('--index',
+              multiple=True,
+              help='Column(s) to index after a sqlite load, comma separated '
+                   'for a multi-column index, can be repeated'
+              )
+@click.option('--workers',
+              default=1,
+              type=int,
+              help='Number of processes to convert with'
+              )
+@click.option('--missing-source',
+              default='warn',
+              type=click.Choice(['fail', 'blank', 'warn']),
+              help='What to do when a source column is not in the csv'
+              )
+@click.option('--error-file',
+              default=None,
+              help='File path to write every error to as ndjson'
+              )
+@click.option('--max-error-messages',
+              default=DEFAULT_MAX_MESSAGES,
+              type=int,
+              help='Number of errors to print in full'
+              )
+@click.option('--incremental',
+              is_flag=True,
+              help='Only convert the rows appended since the last run, '
+                   'appending them to --outfile'
+              )
+@click.option('--no-rule-cache',
+              is_flag=True,
+              help='Parse the config again instead of using the rules '
+                   'cached from the last run'
+              )
+@click.option('--explain',
+              is_flag=True,
+              help='Print how the rules will be executed instead of '
+                   'converting'
+              )
+@click.option('--stats',
+              is_flag=True,
+              help='Print where the time went to stderr after converting'
+              )
+@click.option('--profile-rules',
+              is_flag=True,
+              help='Print the time of each rule with the stats, which '
+                   'runs the rules one at a time, more slowly'
+              )
+def main(
+    config, csv, outfile, format, compact, table, index, workers,
+    missing_source, error_file, max_error_messages, incremental,
+    no_rule_cache, explain, stats, profile_rules
+):
+    if format in COLUMNAR_FORMATS and not explain:
+        # checked before anything is loaded, not once the rows are converted
+        if not outfile:
+            raise click.UsageError(
+                '--format {} requires --outfile'.format(format)
+            )
+        try:
+            require_pyarrow(format)
+        except ImportError as e:
+            raise click.ClickException(str(e))
+
+    conversion_stats = None
+    if stats or profile_rules:
+        from .stats import ConversionStats
+        conversion_stats = ConversionStats(profile_rules=profile_rules)
+
+    rules, aggregation = _load_config(config, no_rule_cache)
+    errors = ErrorSink(max_messages=max_error_messages, sidecar=error_file)
+    converter = CSVConverter(
+        rules, missing_source=missing_source, errors=errors,
+        stats=conversion_stats, aggregation=aggregation
+    )
+    if explain:
+        with open(csv, newline='') as file:
+            header = next(csv_module.reader(file), [])
+        print(converter.explain(header))
+        return
+
+    if incremental:
+        from .incremental import APPENDABLE_FORMATS
+
+        if not outfile:
+            raise click.UsageError('--incremental requires --outfile')
+        if format not in APPENDABLE_FORMATS:
+            raise click.UsageError(
+                '--incremental requires --format {}, not {}'.format(
+                    ' or '.join(APPENDABLE_FORMATS), format
+                )
+            )
+        written = converter.convert_incremental(
+            csv, outfile, to=format, compact=compact
+        )
+        print('Done, {} new row(s)'.format(written))
+    elif format == 'sqlite':
+        if not outfile:
+            raise click.UsageError('--format sqlite requires --outfile')
+        written = converter.convert_to_sqlite(
+            csv, outfile, table=table,
+            indexes=[columns.split(',') for columns in index],
+            workers=workers
+        )
+        print('Done, {} row(s) loaded'.format(written))
+    elif format in COLUMNAR_FORMATS:
+        written = converter.convert_to_columnar(
+            csv, outfile, to=format, workers=workers
+        )
+        print('Done, {} row(s) written'.format(written))
     else:
-        print(result)
+        result = converter.convert(
+            csv, to=format, outfile=outfile, workers=workers, compact=compact
+        )
+        if outfile:
+            print('Done')
+        else:
+            print(result)
+
+    if stats or profile_rules:
+        # stderr, so the stats don't mix with a result printed to stdout
+        click.echo(converter.stats.format(), err=True)
+
+
+@click.command()
+@click.argument('config', type=click.Path(exists=True))
+@click.argument('csv', nargs=-1, required=True)
+@click.option('--outdir',
+              required=True,
+              help='Directory to write a result file per csv to'
+              )
+@click.option('--format',
+              default='json',
+              help='Format the results should be. "json", "ndjson" or "csv"'
+              )
+@click.option('--compact',
+              is_flag=True,
+              help='Leave the whitespace out of json and ndjson results'
+              )
+@click.option('--workers',
+              default=os.cpu_count() or 1,
+              type=int,
+              help='Number of files to convert at once, each in its own '
+                   'process'
+              )
+@click.option('--missing-source',
+              default='warn',
+              type=click.Choice(['fail', 'blank', 'warn']),
+              help='What to do when a source column is not in a csv'
+              )
+@click.option('--error-dir',
+              default=None,
+              help='Directory to write the errors of each csv to as ndjson'
+              )
+@click.option('--no-rule-cache',
+              is_flag=True,
+              help='Parse the config again instead of using the rules '
+                   'cached from the last run'
+              )
+def batch(
+    config, csv, outdir, format, compact, workers, missing_source, error_dir,
+    no_rule_cache
+):
+    '''Converts every CSV file or glob pattern with the same CONFIG'''
+    from .batch import iter_convert_batch
+
+    rules, aggregation = _load_config(config, no_rule_cache)
+    converter = CSVConverter(
+        rules, missing_source=missing_source, aggregation=aggregation
+    )
+
+    converted = failed = 0
+    # results are printed as each file finishes
+    results = iter_convert_batch(
+        converter, csv, outdir, to=format, compact=compact, workers=workers,
+        error_dir=error_dir
+    )
+    for result in results:
+        if result.ok:
+            converted += 1
+            print('ok      {} -> {}, {} row(s), {} error(s)'.format(
+                result.path, result.outfile, result.rows,
+                result.errors.get('total', 0)
+            ))
+        else:
+            failed += 1
+            print('failed  {}: {}'.format(result.path, result.failure))
+
+    print('{} converted, {} failed'.format(converted, failed))
+    if failed:
+        sys.exit(1)
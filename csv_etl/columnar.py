@@ -0,0 +1,184 @@
+import os
+from datetime import datetime
+
+from .rules import OutputType
+from .writers import Writer, values_getter
+
+# Imported by require_pyarrow, only columnar output needs it
+pyarrow = None
+
+# Rows per record batch, and per parquet row group, by default. Only one
+# batch of rows is held in memory at a time
+DEFAULT_ROW_GROUP_SIZE = 64 * 1024
+
+# The output formats ColumnarWriter writes
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+def require_pyarrow(to='parquet'):
+    '''Imports pyarrow, raises an ImportError if it is not installed'''
+    global pyarrow
+    if pyarrow is not None:
+        return
+
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            '{} output requires pyarrow, install it with '
+            '`pip install csv-etl[arrow]`'.format(to)
+        )
+
+
+def arrow_type(output_type):
+    '''The pyarrow type of a rule's OutputType, string when it has none'''
+    if output_type == OutputType.Integer:
+        return pyarrow.int64()
+    if output_type == OutputType.Decimal:
+        return pyarrow.float64()
+    if output_type == OutputType.Date:
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+class ColumnarWriter(Writer):
+    '''
+    Writes converted rows to a Parquet or Arrow IPC file
+
+    Rows are collected into a column per field, typed by its OutputType,
+    and written as a record batch (a row group for parquet) every
+    `batch_size` rows, so memory is bounded by the batch size. Blank values
+    in Integer, Decimal, and Date columns (failed conversions) are nulls,
+    string columns keep them as empty strings. A path is written under a
+    temporary name and moved into place by write_footer, abort removes
+    it. Requires pyarrow, which is imported when the writer is created,
+    before any row is converted.
+
+    ...
+
+    Attributes
+    ----------
+    file : str || file object
+        the file path, or binary file object, to write to
+    field_names : list
+        the targets of the rules, in order, used as the column names
+    date_fields : list
+        the targets that hold datetimes, written as date32
+    compact : bool
+        unused, the formats have no whitespace
+    to : str
+        `parquet` or `arrow` (the Arrow IPC file format)
+    field_types : dict
+        the OutputType of each field, string for fields without one
+    batch_size : int
+        the number of rows per record batch
+    schema : pyarrow.Schema
+        the schema of the file
+    '''
+
+    def __init__(
+        self, file, field_names, date_fields=(), compact=False,
+        to='parquet', field_types=None, batch_size=DEFAULT_ROW_GROUP_SIZE
+    ):
+        if to not in COLUMNAR_FORMATS:
+            raise ValueError('Unknown columnar format: {}'.format(to))
+        require_pyarrow(to)
+
+        super().__init__(file, field_names, date_fields, compact)
+        self.to = to
+        self.field_types = field_types or {}
+        self.batch_size = batch_size
+        self.schema = pyarrow.schema([
+            pyarrow.field(name, arrow_type(self.field_types.get(name)))
+            for name in field_names
+        ])
+        self._writer = None
+        self._path = None
+        self._columns = [[] for _ in field_names]
+        self._rows = 0
+        self._values = values_getter(field_names)
+        self._dates = [
+            self._columns[i] for i, name in enumerate(field_names)
+            if name in self.date_fields
+        ]
+        # '' is a failed conversion in the typed columns, but a real value
+        # in the string ones
+        self._nullable = [
+            self.field_types.get(name) not in (None, OutputType.String)
+            for name in field_names
+        ]
+
+    def write_header(self):
+        sink = self.file
+        if isinstance(sink, (str, os.PathLike)):
+            # written under another name, so a failed conversion never
+            # leaves a file that reads as a complete one
+            self._path = '{}.{}.tmp'.format(os.fspath(sink), os.getpid())
+            sink = self._path
+
+        if self.to == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(sink, self.schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(sink, self.schema)
+
+    def write_row(self, row):
+        self.write_values(self._values(row))
+
+    def write_values(self, values):
+        for column, nullable, value in zip(
+            self._columns, self._nullable, values
+        ):
+            column.append(None if nullable and value == '' else value)
+
+        self._rows += 1
+        if self._rows >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        '''Writes the collected rows as a record batch'''
+        if not self._rows:
+            return
+
+        for column in self._dates:
+            for i, value in enumerate(column):
+                if type(value) is datetime:
+                    column[i] = value.date()
+
+        batch = pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array(column, type=field.type)
+                for column, field in zip(self._columns, self.schema)
+            ],
+            schema=self.schema
+        )
+        if self.to == 'parquet':
+            # each batch is its own row group
+            self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+        for column in self._columns:
+            del column[:]
+        self._rows = 0
+
+    def write_footer(self):
+        self._flush()
+        writer, self._writer = self._writer, None
+        writer.close()
+        if self._path is not None:
+            os.replace(self._path, self.file)
+            self._path = None
+
+    def abort(self):
+        '''Discards the output after a conversion fails, leaving the
+        outfile as it was'''
+        writer, self._writer = self._writer, None
+        path, self._path = self._path, None
+        try:
+            if writer is not None:
+                writer.close()
+        finally:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
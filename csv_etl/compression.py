@@ -0,0 +1,201 @@
+import io
+import os
+import queue
+import threading
+
+# Imported by require_zstandard, like the standard library compression
+# modules by open_compressed, when a compressed file is opened
+zstandard = None
+
+# The leading bytes of each compressed format, or a tuple of the ones it
+# can start with. bz2's 'BZh' is followed by the block size, 1-9, and the
+# magic of the first block (or of the end of an empty stream), since a
+# plain csv can start with 'BZh' too
+MAGIC_NUMBERS = {
+    'gzip': b'\x1f\x8b',
+    'bz2': tuple(
+        b'BZh' + str(level).encode() + block
+        for level in range(1, 10)
+        for block in (b'1AY&SY', b'\x17rE8P\x90')
+    ),
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+MAGIC_SIZE = max(
+    len(magic)
+    for magics in MAGIC_NUMBERS.values()
+    for magic in (magics if isinstance(magics, tuple) else (magics,))
+)
+
+EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+# The gzip command's default, gzip.open's 9 is several times slower for
+# output that is barely smaller
+GZIP_COMPRESS_LEVEL = 6
+
+# Decompressed bytes read ahead by ThreadedReader, per chunk and in total
+READ_AHEAD_CHUNK_SIZE = 1024 * 1024
+READ_AHEAD_CHUNKS = 8
+
+
+def require_zstandard():
+    '''Imports zstandard, raises an ImportError if it is not installed'''
+    global zstandard
+    if zstandard is not None:
+        return
+
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        raise ImportError(
+            '.zst files require zstandard, install it with '
+            '`pip install csv-etl[zstd]`'
+        )
+
+
+def compression_from_path(path):
+    '''
+    Returns:
+        str: The compression a file's extension names, or None.
+    '''
+    if path is None:
+        return None
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def detect_compression(file, path=None):
+    '''Works out whether a binary file is compressed, from its first bytes
+    or else its extension. The file's position is left unchanged.
+
+    Args:
+        file (file object): The file, opened in binary mode.
+        path (str): Optional - The file's path.
+
+    Returns:
+        str: The compression (`gzip`, `bz2`, `xz`, or `zstd`), or None.
+    '''
+    start = None
+    if hasattr(file, 'peek'):
+        start = file.peek(MAGIC_SIZE)[:MAGIC_SIZE]
+    elif file.seekable():
+        position = file.tell()
+        start = file.read(MAGIC_SIZE)
+        file.seek(position)
+
+    if start:
+        for compression, magic in MAGIC_NUMBERS.items():
+            if start.startswith(magic):
+                return compression
+
+    return compression_from_path(path)
+
+
+def open_compressed(file, compression, mode='rb'):
+    '''Opens a compressed file.
+
+    Args:
+        file (str/file object): The file path, or a binary file object,
+            which is left open when the compressed file is closed.
+        compression (str): The compression, from detect_compression.
+        mode (str): `rb` or `wb`.
+
+    Returns:
+        file object: The binary, decompressed (or compressing) file.
+    '''
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(file, mode, compresslevel=GZIP_COMPRESS_LEVEL)
+    if compression == 'bz2':
+        import bz2
+        return bz2.open(file, mode)
+    if compression == 'xz':
+        import lzma
+        return lzma.open(file, mode)
+
+    require_zstandard()
+    return zstandard.open(file, mode)
+
+
+class ThreadedReader(io.RawIOBase):
+    '''
+    Reads a binary file ahead in a background thread
+
+    Used for decompression, which releases the GIL, so it overlaps with
+    converting the rows already read. Exceptions from the thread are
+    raised by the read they would have been returned to.
+
+    ...
+
+    Attributes
+    ----------
+    file : file object
+        the binary file being read, closed when the reader is closed
+    '''
+
+    def __init__(
+        self, file, chunk_size=READ_AHEAD_CHUNK_SIZE,
+        chunks=READ_AHEAD_CHUNKS
+    ):
+        super().__init__()
+        self.file = file
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(chunks)
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # gives up when the reader is closed before everything is read
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _read_ahead(self):
+        try:
+            while not self._stop.is_set():
+                data = self.file.read(self._chunk_size)
+                self._put(data)
+                if not data:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._pending:
+            if self._eof:
+                return 0
+
+            item = self._chunks.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self.file.close()
+        super().close()
@@ -0,0 +1,107 @@
+import os
+import marshal
+import hashlib
+from importlib.util import MAGIC_NUMBER
+
+# Overrides where default_cache_dir keeps the rule cache
+CACHE_DIR_ENV = 'CSV_ETL_CACHE_DIR'
+
+# Bumped whenever Rule.cache_entry or what is cached changes
+CACHE_FORMAT = 3
+
+
+def default_cache_dir():
+    '''
+    Returns:
+        str: $CSV_ETL_CACHE_DIR, or csv-etl in the user's cache directory
+        ($XDG_CACHE_HOME, ~/.cache by default).
+    '''
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if directory:
+        return directory
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'csv-etl')
+
+
+def _cache_path(cache_dir, file_name):
+    '''The cache file of a config, named after its absolute path'''
+    key = hashlib.sha256(os.path.abspath(file_name).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.rules')
+
+
+def _validity(file_name, mtime, data):
+    '''What has to match for a cached rule set to be used'''
+    # marshal's format and the compiled code change with python versions
+    return {
+        'format': CACHE_FORMAT,
+        'python': MAGIC_NUMBER,
+        'path': os.path.abspath(file_name),
+        'mtime': mtime,
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+
+
+def read_cached_rules(cache_dir, file_name, mtime, data):
+    '''Reads the rules cached for a config file.
+
+    Args:
+        cache_dir (str): The cache directory.
+        file_name (str): The file path of the config.
+        mtime (int): The config's modification time, in nanoseconds.
+        data (bytes): The contents of the config.
+
+    Returns:
+        tuple: The Rule.cache_entry() of each rule, and the config's
+        `aggregate` section (None without one). None if they aren't cached
+        or the config has changed since.
+    '''
+    try:
+        with open(_cache_path(cache_dir, file_name), 'rb') as file:
+            cached = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(cached, dict) or \
+            cached.get('validity') != _validity(file_name, mtime, data):
+        return None
+
+    return cached['rules'], cached['aggregate']
+
+
+def write_cached_rules(
+    cache_dir, file_name, mtime, data, entries, aggregate=None
+):
+    '''Caches the rules of a config file, for read_cached_rules.
+
+    Failing to write the cache isn't an error, the rules are just parsed
+    again next time.
+
+    Args:
+        cache_dir (str): The cache directory, created if needed.
+        file_name (str): The file path of the config.
+        mtime (int): The config's modification time, in nanoseconds.
+        data (bytes): The contents of the config.
+        entries (list): The Rule.cache_entry() of each rule.
+        aggregate (dict): Optional - The config's `aggregate` section.
+    '''
+    path = _cache_path(cache_dir, file_name)
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    cached = {
+        'validity': _validity(file_name, mtime, data),
+        'rules': entries,
+        'aggregate': aggregate,
+    }
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temporary, 'wb') as file:
+            marshal.dump(cached, file)
+        # readers see the old cache or the new one, never part of one
+        os.replace(temporary, path)
+    except (OSError, ValueError):
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
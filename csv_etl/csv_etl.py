@@ -1,28 +1,61 @@
 import io
 import csv
-import json
-from datetime import datetime
+from contextlib import closing
+from enum import Enum
+from functools import partial
+from time import perf_counter
 
-from .rules import SourceNotFound, ConversionError
+from .rules import SourceNotFound, ConversionError, OutputType, RuleType
+from .errors import ErrorSink, ErrorKind
+from .plan import RowPlan, FilterPlan, Constant
+from .readers import ProjectedReader, project
+from .sources import CSVSource
+from .vectorized import (
+    BatchPlan, DEFAULT_BATCH_SIZE, iter_batches, require_numpy
+)
+from .writers import CustomEncoder  # noqa: F401
+from .writers import WRITERS, get_writer, open_output, values_getter
+from .columnar import COLUMNAR_FORMATS
 
-ERROR_MSG_TEMPLATE = '''
-Error executing:
-    Rule: {}
-On:
-    Data: {}
-Error details:
-    {}
+MISSING_SOURCE_DETAILS = 'Unable to retrieve source data from'
 
-'''
 
+class _Missing:
+    '''Placeholder index for rules whose source columns are missing'''
+    def __reduce__(self):
+        # Unpickles as the module level MISSING, so `is` checks still work
+        return 'MISSING'
 
-class CustomEncoder(json.JSONEncoder):
-    '''Custom json encoder to handle datetime'''
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.strftime('%Y-%m-%d')
+    def __repr__(self):
+        return 'MISSING'
 
-        return json.JSONEncoder.default(self, o)  # pragma: no cover
+
+MISSING = _Missing()
+
+
+class MissingSourcePolicy(Enum):
+    '''Enum for CSVConverter.missing_source'''
+    Fail = 'fail'
+    Blank = 'blank'
+    Warn = 'warn'
+
+
+def _no_line(i):
+    return None
+
+
+def _byte_position(file):
+    '''Returns a function giving how many bytes of a text file have been
+    read, None when that can't be told (e.g. io.StringIO)'''
+    buffer = getattr(file, 'buffer', None)
+    if buffer is None:
+        return None
+
+    try:
+        buffer.tell()
+    except (OSError, ValueError):
+        return None
+    return buffer.tell
 
 
 class CSVConverter:
@@ -36,110 +69,991 @@ class CSVConverter:
     ----------
     rules : list
         the set of rules the execute when converting CSV files
+    filters : list
+        the Filter rules, split out of the rules passed in. Rows are only
+        converted when every filter keeps them
+    missing_source : MissingSourcePolicy
+        what to do when a rule's source column is not in a file's header,
+        raise SourceNotFound (`fail`), fill the target with blanks
+        (`blank`), or fill with blanks and print a warning once (`warn`)
+    compiled : bool
+        whether to compile the rules into a single RowPlan function per
+        csv header, rather than executing them one at a time
+    vectorize : bool
+        whether to convert rows in batches, running numeric rules on whole
+        columns with numpy (requires numpy)
+    batch_size : int
+        the number of rows per batch when vectorize is set
+    errors : ErrorSink
+        collects the errors of each conversion, use errors.summary() for
+        the counts after a run
+    stats : ConversionStats
+        optional - records where the time of each conversion went, None
+        (the default) records nothing
+    aggregation : Aggregation
+        optional - groups the converted rows, so each conversion returns
+        a row per group instead of a row per csv row
     '''
 
-    def __init__(self, rules):
-        self.rules = rules
+    def __init__(
+        self, rules, missing_source=MissingSourcePolicy.Warn, compiled=True,
+        vectorize=False, batch_size=DEFAULT_BATCH_SIZE, errors=None,
+        stats=None, aggregation=None
+    ):
+        if vectorize:
+            require_numpy()
+
+        self.filters = [rule for rule in rules if rule.type == RuleType.Filter]
+        self.rules = [rule for rule in rules if rule.type != RuleType.Filter]
+        self.missing_source = MissingSourcePolicy(missing_source)
+        self.compiled = compiled
+        self.vectorize = vectorize
+        self.batch_size = batch_size
+        self.errors = errors if errors is not None else ErrorSink()
+        self.stats = stats
+        self.aggregation = aggregation
+        if aggregation is not None:
+            aggregation.check(self.rules)
+        self._constants = self._fold_constants()
+        self._plans = {}
+        self._batch_plans = {}
+        self._filter_plans = {}
+        # Rows dropped by each filter in the current conversion
+        self._dropped = [0] * len(self.filters)
+        # Maps a row's position in the current batch to its csv line
+        self._line = _no_line
+
+    def __getstate__(self):
+        # Plans hold generated functions, workers build their own
+        state = self.__dict__.copy()
+        state['_plans'] = {}
+        state['_batch_plans'] = {}
+        state['_filter_plans'] = {}
+        return state
+
+    @property
+    def field_names(self):
+        '''list: The targets of the rules, in output order, or the fields
+        of the aggregation'''
+        if self.aggregation is not None:
+            return self.aggregation.field_names
+        return [rule.target for rule in self.rules]
+
+    @property
+    def date_fields(self):
+        '''list: The targets of the rules that output dates'''
+        if self.aggregation is not None:
+            return self.aggregation.date_fields(self.rules)
+        return [
+            rule.target for rule in self.rules
+            if rule.output_type == OutputType.Date
+        ]
+
+    @property
+    def field_types(self):
+        '''dict: The OutputType of each field, by target'''
+        if self.aggregation is not None:
+            return self.aggregation.field_types(self.rules)
+        return {rule.target: rule.output_type for rule in self.rules}
+
+    def cache_stats(self):
+        '''Returns the counters of the rules that memoize their results.
+
+        Rules executed in worker processes (workers > 1) count in their
+        own copies, so only conversions in this process are included.
+
+        Returns:
+            dict: OperationCache.stats() by rule target.
+        '''
+        return {
+            rule.target: rule.cache.stats()
+            for rule in self.rules if rule.cache is not None
+        }
+
+    def lookup_stats(self):
+        '''Returns how the indexes of the Lookup rules were built, and
+        their hit rates in the last conversion, see LookupTable.stats.
+
+        Returns:
+            dict: LookupTable.stats() by rule target.
+        '''
+        return {
+            rule.target: rule.lookup.stats()
+            for rule in self.rules if rule.lookup is not None
+        }
+
+    def _start_lookups(self):
+        '''Internal method to build the indexes of the Lookup rules, before
+        any worker processes start, and reset their counters'''
+        for rule in self.rules:
+            if rule.lookup is not None:
+                rule.lookup.load()
+                rule.lookup.reset_counts()
+
+    def _drain_lookups(self):
+        '''Internal method to return and reset the lookup counters, for
+        sending from workers'''
+        return [
+            rule.lookup.drain_counts()
+            for rule in self.rules if rule.lookup is not None
+        ]
+
+    def _merge_lookups(self, counts):
+        '''Internal method to add the lookup counters of a worker'''
+        tables = [
+            rule.lookup for rule in self.rules if rule.lookup is not None
+        ]
+        for table, table_counts in zip(tables, counts):
+            table.merge_counts(table_counts)
+
+    def dropped_rows(self):
+        '''Returns the number of rows each filter dropped in the last
+        conversion, rows are counted by the first filter that drops them.
 
-    def _write_to_outfile(self, data, outfile):
-        '''Internal method to write converted results to outfile.
+        Returns:
+            dict: The rows dropped by filter target.
+        '''
+        return {
+            rule.target: dropped
+            for rule, dropped in zip(self.filters, self._dropped)
+        }
+
+    def _start_dropped(self):
+        '''Internal method to reset the filter counts for a conversion'''
+        self._dropped[:] = [0] * len(self.filters)
+
+    def _drain_dropped(self):
+        '''Internal method to return and reset the filter counts, for
+        sending from workers'''
+        dropped = list(self._dropped)
+        self._start_dropped()
+        return dropped
+
+    def _writer(self, to, file, compact=False):
+        '''Internal method to create the writer for an output format.'''
+        return get_writer(
+            to, file, self.field_names, self.date_fields, compact
+        )
+
+    def _fold_constants(self):
+        '''Internal method to execute the rules that don't depend on the row.
+
+        Rules that raise a ConversionError here are left to report it on
+        each row as before. Any other error is raised, as it would be on
+        the first row.
+
+        Returns:
+            dict: The value of each constant rule, by position in self.rules.
+        '''
+        constants = {}
+
+        for i, rule in enumerate(self.rules):
+            if not rule.is_constant():
+                continue
+
+            try:
+                constants[i] = rule.constant_value()
+            except ConversionError:
+                continue
+
+        return constants
+
+    def _resolve_sources(self, header):
+        '''Internal method to map every rule's source to column positions.
+
+        Missing columns are handled once, here, using self.missing_source.
 
         Args:
-            data (str/dict): The data to be written.
-            outfile (str): The file path to write the result to.
+            header (list): The column names of the csv file.
+
+        Returns:
+            list: The index(es) for each rule, MISSING where the source
+            column(s) could not be found, and a Constant for rules folded
+            by _fold_constants.
 
+        Raises:
+            SourceNotFound: If a column is missing and the policy is `fail`.
         '''
-        file = open(outfile, 'w')
-        file.write(str(data))
-        file.close()
+        indexes = []
 
-    def _convert_to_csv(self, data):
-        '''Internal method to convert json data into csv data.
+        for i, rule in enumerate(self.rules):
+
+            try:
+                index = rule.resolve_source(header)
+                if i in self._constants:
+                    index = Constant(self._constants[i])
+                indexes.append(index)
+
+            except SourceNotFound as e:
+                if self.missing_source == MissingSourcePolicy.Fail:
+                    raise SourceNotFound(
+                        '{} for target {}'.format(e, rule.target)
+                    )
+
+                if self.missing_source == MissingSourcePolicy.Warn:
+                    self.errors.report(
+                        rule,
+                        ErrorKind.MissingSource,
+                        rule.source,
+                        MISSING_SOURCE_DETAILS,
+                        None,
+                        lambda: header
+                    )
+
+                indexes.append(MISSING)
+
+        return indexes
+
+    def _resolve_filters(self, header):
+        '''Internal method to map every filter's source to column positions.
+
+        Returns:
+            list: The index(es) for each filter.
+
+        Raises:
+            SourceNotFound: If a filter's column is missing, whatever
+                self.missing_source is, as it can't decide which rows to
+                keep.
+        '''
+        indexes = []
+        for rule in self.filters:
+            try:
+                indexes.append(rule.resolve_source(header))
+            except SourceNotFound as e:
+                raise SourceNotFound('{} for filter {}'.format(e, rule.target))
+        return indexes
+
+    def _project(self, header, indexes):
+        '''Internal method to work out the columns the rules and filters
+        read, see readers.project.
+
+        Returns:
+            tuple: The positions to read (None for every column), the
+            projected header, and the rules' indexes in it.
+        '''
+        filter_indexes = self._resolve_filters(header)
+        positions, header, projected = project(
+            header, indexes + filter_indexes
+        )
+        return positions, header, projected[:len(indexes)]
+
+    def _convert_row(self, row, header, indexes):
+        '''Internal method to execute every rule on a single row.
 
         Args:
-            data (dict): The data to be converted.
+            row (list): The values of a csv row.
+            header (list): The column names of the csv file.
+            indexes (list): The source positions from _resolve_sources.
 
+        Returns:
+            dict: The converted row.
         '''
-        csv_result = io.StringIO()
+        row_result = {}
 
-        # Create the headers
-        field_names = []
-        for rule in self.rules:
-            field_names.append(rule.target)
+        for rule, index in zip(self.rules, indexes):
+
+            if index is MISSING:
+                row_result[rule.target] = ''
+                continue
+
+            if type(index) is Constant:
+                row_result[rule.target] = index.value
+                continue
+
+            try:
+                k, v = rule.execute_row(row, index)
+                row_result[k] = v
+
+            except ConversionError as e:
+                self._report_error(rule, index, header, row, e)
+                row_result[rule.target] = ''
+
+        return row_result
+
+    def _profile_row(self, row, header, indexes, profiles):
+        '''Internal method to execute every rule on a single row, timing
+        each with its RuleStats.
+
+        Args:
+            row (list): The values of a csv row.
+            header (list): The column names of the csv file.
+            indexes (list): The source positions from _resolve_sources.
+            profiles (list): The RuleStats of each rule.
+
+        Returns:
+            dict: The converted row.
+        '''
+        row_result = {}
+
+        for rule, index, profile in zip(self.rules, indexes, profiles):
+
+            if index is MISSING:
+                row_result[rule.target] = ''
+                continue
+
+            if type(index) is Constant:
+                row_result[rule.target] = index.value
+                continue
+
+            try:
+                row_result[rule.target] = profile.execute_row(rule, row, index)
+
+            except ConversionError as e:
+                self._report_error(rule, index, header, row, e)
+                row_result[rule.target] = ''
+
+        return row_result
+
+    def _report_error(self, rule, index, header, row, error, i=0):
+        '''Internal method to send a rule's ConversionError to self.errors.
+
+        Args:
+            rule (Rule): The rule that failed.
+            index (int/list): The rule's source position(s).
+            header (list): The column names of the csv file.
+            row (list): The values of the csv row.
+            error (ConversionError): The error.
+            i (int): The position of the row in the current batch.
+        '''
+        if type(index) is list:
+            value = [row[position] for position in index]
+        else:
+            value = rule.source if index is None else row[index]
+
+        self.errors.report(
+            rule,
+            ErrorKind.Conversion,
+            value,
+            error.custom_message,
+            self._line(i),
+            lambda: dict(zip(header, row))
+        )
+
+    def _error_handler(self, header, indexes, rules=None):
+        '''Internal method to build the on_error function for plans.'''
+        rules = self.rules if rules is None else rules
+        positions = {
+            id(rule): index for rule, index in zip(rules, indexes)
+        }
+
+        def on_error(rule, row, error, i):
+            index = positions[id(rule)]
+            self._report_error(rule, index, header, row, error, i)
+
+        return on_error
+
+    def plan(self, header, indexes=None):
+        '''Compiles the rules into a RowPlan for a csv header.
+
+        Plans are cached per header, so each is only generated once.
+
+        Args:
+            header (list): The column names of the csv file.
+            indexes (list): Optional - The source positions from
+                _resolve_sources, resolved from `header` if not given.
+
+        Returns:
+            RowPlan: The compiled plan.
+        '''
+        key = tuple(header)
+        if key not in self._plans:
+            if indexes is None:
+                indexes = self._resolve_sources(header)
+
+            self._plans[key] = RowPlan(
+                self.rules,
+                indexes,
+                self._error_handler(header, indexes),
+                MISSING
+            )
+
+        return self._plans[key]
+
+    def filter_plan(self, header):
+        '''Compiles the filters into a FilterPlan for a csv header.
+
+        Plans are cached per header, so each is only generated once.
+
+        Args:
+            header (list): The column names of the csv file.
+
+        Returns:
+            FilterPlan: The compiled plan.
+
+        Raises:
+            SourceNotFound: If a filter's column is missing.
+        '''
+        key = tuple(header)
+        if key not in self._filter_plans:
+            indexes = self._resolve_filters(header)
+            self._filter_plans[key] = FilterPlan(
+                self.filters,
+                indexes,
+                self._error_handler(header, indexes, self.filters),
+                self._dropped
+            )
+
+        return self._filter_plans[key]
 
-        writer = csv.DictWriter(csv_result, field_names)
-        writer.writeheader()
+    def _keep_function(self, header, profiling=False):
+        '''Internal method to build the function deciding which rows to
+        convert, None when there are no filters.
 
-        # Write the data row by row
-        for row in data:
-            writer.writerow(row)
+        Filters are compiled into a FilterPlan, unless the rules are run
+        one at a time (compiled=False, or when profiling).
 
-        return csv_result.getvalue()
+        Args:
+            header (list): The column names of the csv file.
+            profiling (bool): Whether to time each filter with
+                self.stats.
+
+        Returns:
+            function: Takes a positional row and returns whether to keep it.
+        '''
+        if not self.filters:
+            return None
+
+        if self.compiled and not profiling:
+            return self.filter_plan(header).keep
+
+        indexes = self._resolve_filters(header)
+        on_error = self._error_handler(header, indexes, self.filters)
+        dropped = self._dropped
+        if profiling:
+            executes = [
+                partial(self.stats.rule(rule.target).execute_row, rule)
+                for rule in self.filters
+            ]
+        else:
+            executes = [rule._execute_row for rule in self.filters]
+        filters = list(zip(executes, self.filters, indexes))
+
+        def keep(row):
+            for i, (execute, rule, index) in enumerate(filters):
+                try:
+                    kept = execute(row, index)
+                except ConversionError as e:
+                    on_error(rule, row, e, 0)
+                    kept = False
+
+                if not kept:
+                    dropped[i] += 1
+                    return False
+            return True
+
+        return keep
+
+    def batch_plan(self, header, indexes=None):
+        '''Builds the BatchPlan used when vectorize is set for a csv header.
+
+        Args:
+            header (list): The column names of the csv file.
+            indexes (list): Optional - The source positions from
+                _resolve_sources, resolved from `header` if not given.
+
+        Returns:
+            BatchPlan: The batch plan.
+        '''
+        key = tuple(header)
+        if key not in self._batch_plans:
+            if indexes is None:
+                indexes = self._resolve_sources(header)
+
+            self._batch_plans[key] = BatchPlan(
+                self.rules,
+                indexes,
+                self.plan(header, indexes),
+                self._error_handler(header, indexes),
+                MISSING
+            )
+
+        return self._batch_plans[key]
+
+    def explain(self, header):
+        '''Describes how the rules will be executed for a csv header.
+
+        Lists the filters, the columns fetched and cast once per row and
+        the rules that share them, then how each rule gets its value.
+
+        Args:
+            header (list): The column names of the csv file.
+
+        Returns:
+            str: The description.
+        '''
+        plan = self.plan(header)
+        indexes = plan.indexes
+        vectorized = set()
+        if self.vectorize:
+            batch_plan = self.batch_plan(header, indexes)
+            vectorized = {id(rule.rule) for rule in batch_plan.vector_rules}
+
+        lines = []
+        if self.filters:
+            lines.append('Filters, run first:')
+            filter_plan = self.filter_plan(header)
+            for rule, index in zip(self.filters, filter_plan.indexes):
+                positions = index if type(index) is list else [index]
+                lines.append('    {}: reads {}, keeps rows where {}'.format(
+                    repr(rule.target),
+                    ', '.join(repr(header[p]) for p in positions),
+                    ' then '.join(rule.operations) or 's'
+                ))
+
+        lines.append('Fetched and cast once per row:')
+        for position, input_type, targets in plan.shared:
+            lines.append('    {} as {}, {} read(s) by {}'.format(
+                repr(header[position]),
+                input_type.value,
+                len(targets),
+                ', '.join(repr(t) for t in dict.fromkeys(targets))
+            ))
+
+        lines.append('Rules:')
+        for rule, index in zip(self.rules, indexes):
+            if index is MISSING:
+                how = 'missing source, left blank'
+            elif type(index) is Constant:
+                how = 'constant {}'.format(repr(index.value))
+            elif index is None:
+                how = 'static'
+            else:
+                positions = index if type(index) is list else [index]
+                how = 'reads {}'.format(
+                    ', '.join(repr(header[p]) for p in positions)
+                )
+                if rule.lookup is not None:
+                    how += ', looks up {} in {}'.format(
+                        repr(rule.lookup.value), rule.lookup.path
+                    )
+                if rule.cache is not None:
+                    how += ', cached (maxsize {})'.format(rule.cache.maxsize)
+                if id(rule) in vectorized:
+                    how += ', vectorized'
+
+            lines.append('    {}: {}'.format(repr(rule.target), how))
+
+        return '\n'.join(lines)
+
+    def _convert_rows(self, reader, header, indexes, line_offset=0):
+        '''Internal method to execute every rule on rows from a csv.reader.
+
+        Args:
+            reader (csv.reader): The positional rows, after the header.
+            header (list): The column names of the csv file.
+            indexes (list): The source positions from _resolve_sources.
+            line_offset (int): The lines of the file before `reader`, for
+                the line numbers of errors.
+
+        Yields:
+            dict: The converted row, for the rows every filter keeps.
+        '''
+        profiling = self.stats is not None and self.stats.profile_rules
+
+        # filters run as the rows are read, before any other rule
+        keep = self._keep_function(header, profiling)
+
+        def reader_line(i):
+            return line_offset + reader.line_num
+
+        self._line = reader_line
+
+        if self.vectorize and not profiling:
+            lines = []
+            rows = self._pad_rows(reader, len(header), lines, keep)
+            batch_plan = self.batch_plan(header, indexes)
+
+            for batch in iter_batches(rows, self.batch_size):
+                batch_lines = lines[:]
+                del lines[:]
+                self._line = lambda i: line_offset + batch_lines[i]
+                yield from batch_plan.convert_batch(batch)
+                # the filters report errors while the next batch is read
+                self._line = reader_line
+            return
+
+        rows = self._pad_rows(reader, len(header), keep=keep)
+
+        if profiling:
+            profiles = [self.stats.rule(rule.target) for rule in self.rules]
+
+            def convert_row(row):
+                return self._profile_row(row, header, indexes, profiles)
+
+        elif self.compiled:
+            convert_row = self.plan(header, indexes).convert_row
+        else:
+            def convert_row(row):
+                return self._convert_row(row, header, indexes)
+
+        for row in rows:
+            yield convert_row(row)
+
+    def _pad_rows(self, reader, width, lines=None, keep=None):
+        '''Internal method to skip blank lines and pad short rows.
+
+        This matches the rows csv.DictReader would produce. If `lines` is
+        given, the line each row ends on is appended to it. If `keep` is
+        given, only the rows it returns True for are yielded.
+        '''
+        padding = [None] * width
+
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + padding[len(row):]
+            if keep is not None and not keep(row):
+                continue
+            if lines is not None:
+                lines.append(reader.line_num)
+
+            yield row
+
+    def _write(self, rows, writer):
+        '''Internal method to stream converted rows through a writer.
 
-    def convert(self, csv_file, to=None, outfile=None):
+        Args:
+            rows (iterable): The converted rows.
+            writer (Writer): The writer to stream the rows to.
+
+        Returns:
+            int: The number of rows written.
+        '''
+        count = 0
+        stats = self.stats
+        # writers take each row as a tuple in field order, the same as the
+        # rows of a RowTable
+        values = values_getter(writer.field_names)
+        write_values = writer.write_values
+        writer.write_header()
+        if stats is None:
+            for row in rows:
+                write_values(values(row))
+                count += 1
+        else:
+            for row in rows:
+                start = perf_counter()
+                write_values(values(row))
+                stats.write_seconds += perf_counter() - start
+                count += 1
+        writer.write_footer()
+        return count
+
+    def iter_convert(self, csv_file, workers=1):
+        '''Executes rules on a given csv file, yielding one row at a time
+
+        Args:
+            csv_file: The csv to convert, a file path, bytes-like buffer,
+                or file object (which is left open).
+            workers (int): Optional - The number of processes to convert
+                with. The rows are still yielded in their original order.
+
+        Yields:
+            dict: The converted row, or with an aggregation, the row of
+            each group once every row has been converted.
+
+        Raises:
+            SourceNotFound: If a source column is missing from the header
+                and self.missing_source is `fail`.
+        '''
+        source = CSVSource(csv_file)
+        stats = self.stats
+        self.errors.start()
+        self._start_dropped()
+        if stats is not None:
+            stats.start(source.size())
+        completed = False
+        try:
+            self._start_lookups()
+            with closing(self._iter_rows(source, workers)) as rows:
+                if stats is not None:
+                    rows = stats.count(rows)
+                if self.aggregation is not None:
+                    rows = self.aggregation.aggregate(rows)
+                yield from rows
+            completed = True
+        finally:
+            self._line = _no_line
+            self.errors.finish()
+            if stats is not None:
+                stats.dropped = self.dropped_rows()
+                stats.lookups = self.lookup_stats()
+                stats.finish(completed)
+
+    def _iter_rows(self, source, workers):
+        '''Internal method to convert the rows of a CSVSource, see
+        iter_convert'''
+        if workers > 1:
+            # modules only some runs use are imported when needed,
+            # to keep the startup of small conversions short
+            from .parallel import iter_convert_parallel
+            yield from iter_convert_parallel(self, source, workers)
+            return
+
+        with source.open() as source_file:
+            reader = csv.reader(source_file)
+
+            # resolve the rules against the header once per file
+            header = next(reader, None)
+            if header is None:
+                return
+            indexes = self._resolve_sources(header)
+
+            # only read the columns the rules and filters use
+            positions, header, indexes = self._project(header, indexes)
+            if positions is not None:
+                reader = ProjectedReader(
+                    source_file, positions, reader.line_num
+                )
+
+            if self.stats is not None:
+                from .stats import TimedReader
+                reader = TimedReader(
+                    reader, self.stats, _byte_position(source_file)
+                )
+
+            # iterate row by row, and execute the rules
+            yield from self._convert_rows(reader, header, indexes)
+
+    def convert(
+        self, csv_file, to=None, outfile=None, workers=1, compact=False
+    ):
         '''Executes rules on a given csv file and returns the result
 
         Args:
-            csv_file (str): The file path of the csv file to convert.
-            to (str): What to return the output as, either `csv` or `json`.
+            csv_file: The csv to convert, a file path, bytes-like buffer,
+                or file object (which is left open). Compressed input is
+                decompressed as it is read.
+            to (str): What to return the output as, either `csv`, `json`,
+                or `ndjson` (one json object per line), or `table` for a
+                RowTable, which holds the rows in far less memory than the
+                list of dicts. Or `sqlite`, `parquet`, or `arrow` with an
+                outfile, see convert_to_sqlite and convert_to_columnar.
             outfile (str): Optional - The file path to write the result to.
+                Rows are streamed to the file as they are converted, in the
+                `to` format (`json` if not given). Compressed when the path
+                ends in `.gz`, `.bz2`, `.xz`, or `.zst`.
+            workers (int): Optional - The number of processes to convert
+                with.
+            compact (bool): Optional - Leave the indentation and spaces out
+                of `json` and `ndjson` output.
 
         Returns:
             By default, a list of python dictionaries.
-            If `to` = `csv` or `json` then a string representation of the
-            data in that format will be returned.
+            If `to` = `csv`, `json`, or `ndjson` then a string representation
+            of the data in that format will be returned.
+            If `to` = `table`, a RowTable of the rows.
+            If `outfile` is given, the number of rows written.
         '''
-        result = []
+        if to == 'sqlite':
+            if not outfile:
+                raise ValueError('sqlite output needs an outfile')
+            return self.convert_to_sqlite(csv_file, outfile, workers=workers)
 
-        # read in the csv file
-        source_file = open(csv_file)
-        reader = csv.DictReader(source_file)
+        if to in COLUMNAR_FORMATS:
+            if not outfile:
+                raise ValueError('{} output needs an outfile'.format(to))
+            return self.convert_to_columnar(
+                csv_file, outfile, to, workers=workers
+            )
 
-        # iterate row by row, and execute the rules
-        for row in reader:
+        if outfile:
+            to = to or 'json'
+            if to not in WRITERS:
+                raise ValueError('Unknown output format: {}'.format(to))
+
+        # closing the rows closes the input, even if writing them fails
+        with closing(self.iter_convert(csv_file, workers=workers)) as rows:
+
+            if outfile:
+                with open_output(outfile) as file:
+                    writer = self._writer(to, file, compact)
+                    return self._write(rows, writer)
 
-            row_result = {}
+            if to in WRITERS:
+                result = io.StringIO()
+                self._write(rows, self._writer(to, result, compact))
+                return result.getvalue()
 
-            for rule in self.rules:
+            if to == 'table':
+                from .table import RowTable
+                return RowTable.from_rows(
+                    rows, self.field_names, self.date_fields
+                )
 
+            return list(rows)
+
+    def convert_to_sqlite(
+        self, csv_file, database, table=None, indexes=(), batch_size=None,
+        workers=1
+    ):
+        '''Executes rules on a given csv file, loading the result into a
+        SQLite table
+
+        Rows go straight from the rules to the database, in batches. The
+        table is created with a column per field, typed by its OutputType,
+        replacing any table of the same name, and only appears once every
+        row is loaded.
+
+        Args:
+            csv_file: The csv to convert, see convert.
+            database (str): The file path of the database, created if
+                needed.
+            table (str): Optional - The table to load, named after the csv
+                file by default, e.g. `orders` for `orders.csv`.
+            indexes (list): Optional - The columns to index once the rows
+                are loaded, a list of columns for a multi-column index.
+            batch_size (int): Optional - The number of rows per insert.
+            workers (int): Optional - The number of processes to convert
+                with.
+
+        Returns:
+            int: The number of rows loaded.
+        '''
+        # sqlite3 is only imported for sqlite output
+        from .sqlite import (
+            SQLiteWriter, DEFAULT_INSERT_BATCH_SIZE, connect, table_name
+        )
+
+        connection = connect(database)
+        try:
+            writer = SQLiteWriter(
+                connection, self.field_names, self.date_fields,
+                table=table or table_name(csv_file),
+                field_types=self.field_types,
+                indexes=indexes,
+                batch_size=batch_size or DEFAULT_INSERT_BATCH_SIZE
+            )
+            with closing(self.iter_convert(csv_file, workers=workers)) as rows:
                 try:
-                    k, v = rule.execute(row)
-                    row_result[k] = v
-
-                except SourceNotFound:
-                    rule_data = str(rule.as_dict())
-                    row_data = str(row)
-                    error_details = 'Unable to retrieve source data from'
-                    error_msg = ERROR_MSG_TEMPLATE.format(
-                        rule_data,
-                        row_data,
-                        error_details
-                    )
-                    print(error_msg)
-                    row_result[rule.target] = ''
+                    return self._write(rows, writer)
+                except BaseException:
+                    writer.rollback()
+                    raise
+        finally:
+            connection.close()
 
-                except ConversionError as e:
-                    rule_data = str(rule.as_dict())
-                    row_data = str(row)
-                    error_details = e.custom_message
-                    error_msg = ERROR_MSG_TEMPLATE.format(
-                        rule_data,
-                        row_data,
-                        error_details
-                    )
-                    print(error_msg)
-                    row_result[rule.target] = ''
+    def convert_to_columnar(
+        self, csv_file, outfile, to='parquet', batch_size=None, workers=1
+    ):
+        '''Executes rules on a given csv file, writing the result as a
+        Parquet or Arrow IPC file
 
-            result.append(row_result)
+        Rows are collected into typed columns, from each field's
+        OutputType, and written a batch at a time, so only one batch is
+        held in memory. The file only appears at outfile once every row
+        is written, so a failed conversion leaves outfile as it was.
+        Requires pyarrow, which is checked before any row is converted.
 
-        if to == 'csv':
-            result = self._convert_to_csv(result)
+        Args:
+            csv_file: The csv to convert, see convert.
+            outfile (str): The file path to write the result to.
+            to (str): `parquet`, or `arrow` for the Arrow IPC file format.
+            batch_size (int): Optional - The number of rows per record
+                batch, and per parquet row group.
+            workers (int): Optional - The number of processes to convert
+                with.
 
-        if to == 'json':
-            result = json.dumps(result, indent=4, cls=CustomEncoder)
+        Returns:
+            int: The number of rows written.
 
-        if outfile:
-            self._write_to_outfile(result, outfile)
+        Raises:
+            ImportError: If pyarrow is not installed.
+            ValueError: If `to` is not `parquet` or `arrow`.
+        '''
+        from .columnar import ColumnarWriter, DEFAULT_ROW_GROUP_SIZE
+
+        writer = ColumnarWriter(
+            outfile, self.field_names, self.date_fields, to=to,
+            field_types=self.field_types,
+            batch_size=batch_size or DEFAULT_ROW_GROUP_SIZE
+        )
+        with closing(self.iter_convert(csv_file, workers=workers)) as rows:
+            try:
+                return self._write(rows, writer)
+            except BaseException:
+                writer.abort()
+                raise
+
+    def convert_batch(
+        self, patterns, outdir, to='json', compact=False, workers=1,
+        error_dir=None
+    ):
+        '''Executes rules on many csv files, writing each to outdir
+
+        Files are converted whole, `workers` at a time, with the rules
+        loaded once. A file that fails doesn't stop the others.
+
+        Args:
+            patterns (list): The csv file paths, or glob patterns.
+            outdir (str): The directory to write the results to, one file
+                per csv named after it, e.g. `orders.csv` to `orders.json`.
+            to (str): The output format, `csv`, `json`, or `ndjson`.
+            compact (bool): Optional - Leave the indentation and spaces out
+                of `json` and `ndjson` output.
+            workers (int): Optional - The number of processes to convert
+                with.
+            error_dir (str): Optional - A directory to write each file's
+                errors to as ndjson.
+
+        Returns:
+            list: A FileResult for each file, in order.
+        '''
+        from .batch import iter_convert_batch
+        return list(iter_convert_batch(
+            self, patterns, outdir, to, compact, workers, error_dir
+        ))
+
+    def convert_incremental(
+        self, csv_file, outfile, to='csv', compact=False, checkpoint_file=None
+    ):
+        '''Converts only the rows appended to a csv since the last run
+
+        The rows are appended to outfile, and a checkpoint of how far the
+        conversion got is saved next to it, so the next run (or a run
+        after a crash) carries on from there. If the csv's header or
+        earlier rows, or the rules, have changed since the checkpoint,
+        the outfile is rebuilt from the start.
+
+        Args:
+            csv_file (str): The file path of the csv, uncompressed.
+            outfile (str): The file path to append the result to.
+            to (str): The output format, `csv` or `ndjson`, which can be
+                appended to.
+            compact (bool): Optional - Leave the spaces out of `ndjson`
+                output.
+            checkpoint_file (str): Optional - Where to save the checkpoint,
+                `outfile + '.checkpoint'` by default.
+
+        Returns:
+            int: The number of rows written by this run.
+
+        Raises:
+            ValueError: If `to` can't be appended to, a file is
+                compressed, or the rows are aggregated.
+        '''
+        if self.aggregation is not None:
+            raise ValueError('Aggregated conversions can\'t be incremental')
 
-        source_file.close()
-        return result
+        from .incremental import convert_incremental
+        stats = self.stats
+        self.errors.start()
+        self._start_dropped()
+        if stats is not None:
+            stats.start()
+        written = None
+        try:
+            self._start_lookups()
+            written = convert_incremental(
+                self, csv_file, outfile, to, compact, checkpoint_file
+            )
+            return written
+        finally:
+            self._line = _no_line
+            self.errors.finish()
+            if stats is not None:
+                stats.rows = written or 0
+                stats.dropped = self.dropped_rows()
+                stats.lookups = self.lookup_stats()
+                stats.finish(written is not None)
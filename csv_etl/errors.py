@@ -0,0 +1,283 @@
+import json
+from enum import Enum
+
+ERROR_MSG_TEMPLATE = '''
+Error executing:
+    Rule: {}
+On:
+    Data: {}
+Error details:
+    {}
+
+'''
+
+SUPPRESSED_MSG_TEMPLATE = '''
+{} more error(s) not shown, {} error(s) in total
+'''
+
+# Errors printed in full by default, the rest are only counted
+DEFAULT_MAX_MESSAGES = 10
+
+# Error records buffered before they are written to the sidecar file
+DEFAULT_SIDECAR_BATCH_SIZE = 1000
+
+
+class ErrorKind(Enum):
+    '''Enum for ErrorRecord.kind'''
+    Conversion = 'conversion'
+    MissingSource = 'missing_source'
+
+
+class ErrorRecord:
+    '''
+    A single error from a conversion
+
+    ...
+
+    Attributes
+    ----------
+    line : int
+        the line of the csv file the row ends on, None for header errors
+    target : str
+        the target of the rule that failed
+    value : str || list
+        the raw csv value(s) the rule read, or the rule's source for
+        missing source errors
+    kind : ErrorKind
+        the kind of error
+    details : str
+        a description of the error
+    '''
+
+    def __init__(self, line, target, value, kind, details):
+        self.line = line
+        self.target = target
+        self.value = value
+        self.kind = kind
+        self.details = details
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the error
+        '''
+        return {
+            'line': self.line,
+            'target': self.target,
+            'value': self.value,
+            'kind': self.kind.value,
+            'details': self.details
+        }
+
+
+def format_error(rule, data, details):
+    '''Formats the full error message printed for a failed rule.
+
+    Args:
+        rule (Rule): The rule that failed.
+        data: The row (or header) the rule failed on.
+        details (str): A description of the error.
+    '''
+    return ERROR_MSG_TEMPLATE.format(str(rule.as_dict()), str(data), details)
+
+
+class ErrorCollector:
+    '''
+    Collects error records without printing or writing them, so they can
+    be handed to an ErrorSink later (e.g. from a worker process)
+
+    ...
+
+    Attributes
+    ----------
+    max_messages : int
+        the number of records to keep the formatted message for
+    records : list
+        the collected (ErrorRecord, message) pairs, message is None once
+        max_messages have been kept
+    '''
+
+    def __init__(self, max_messages=DEFAULT_MAX_MESSAGES):
+        self.max_messages = max_messages
+        self.records = []
+        self._messages = 0
+
+    def report(self, rule, kind, value, details, line, data):
+        '''Records an error.
+
+        Args:
+            rule (Rule): The rule that failed.
+            kind (ErrorKind): The kind of error.
+            value: The raw value(s) the rule read.
+            details (str): A description of the error.
+            line (int): The line of the csv file, None for the header.
+            data: A function returning the row (or header) the rule failed
+                on, only called when the full message is needed.
+        '''
+        message = None
+        if self.max_messages is None or self._messages < self.max_messages:
+            message = format_error(rule, data(), details)
+            self._messages += 1
+
+        record = ErrorRecord(line, rule.target, value, kind, details)
+        self.records.append((record, message))
+
+    def drain(self):
+        '''Returns and clears the collected records'''
+        records = self.records
+        self.records = []
+        self._messages = 0
+        return records
+
+
+class ErrorSink:
+    '''
+    Counts, prints, and optionally saves the errors of a conversion
+
+    Only the first max_messages errors are formatted and printed, the rest
+    are counted. Every error can be written as a line of json to a sidecar
+    file, in batches.
+
+    ...
+
+    Attributes
+    ----------
+    max_messages : int
+        the number of errors printed in full, None to print them all
+    sidecar : str
+        optional - the file path to write every error record to as ndjson
+    batch_size : int
+        the number of records buffered before writing them to the sidecar
+    quiet : bool
+        whether to print nothing, not even the number of errors not
+        printed, for callers that report the counts themselves
+    total : int
+        the number of errors in the last conversion
+    counts : dict
+        the number of errors per rule target
+    kinds : dict
+        the number of errors per ErrorKind value
+    printed : int
+        the number of errors printed in full
+    '''
+
+    def __init__(
+        self, max_messages=DEFAULT_MAX_MESSAGES, sidecar=None,
+        batch_size=DEFAULT_SIDECAR_BATCH_SIZE, quiet=False
+    ):
+        self.max_messages = max_messages
+        self.sidecar = sidecar
+        self.batch_size = batch_size
+        self.quiet = quiet
+        self._file = None
+        self._reset()
+
+    def __getstate__(self):
+        # Open sidecar files stay with the process that opened them
+        state = self.__dict__.copy()
+        state['_file'] = None
+        state['_buffer'] = []
+        return state
+
+    def _reset(self):
+        self.total = 0
+        self.counts = {}
+        self.kinds = {}
+        self.printed = 0
+        self._buffer = []
+
+    def start(self):
+        '''Resets the counters, and truncates the sidecar file'''
+        self.close()
+        self._reset()
+        if self.sidecar:
+            self._file = open(self.sidecar, 'w')
+
+    def _should_print(self):
+        if self.quiet:
+            return False
+        return self.max_messages is None or self.printed < self.max_messages
+
+    def add(self, record, message=None):
+        '''Adds an error record.
+
+        Args:
+            record (ErrorRecord): The error.
+            message (str): Optional - The full message to print, if the
+                max_messages cap hasn't been reached.
+        '''
+        self.total += 1
+        self.counts[record.target] = self.counts.get(record.target, 0) + 1
+        kind = record.kind.value
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+
+        if message is not None and self._should_print():
+            print(message)
+            self.printed += 1
+
+        if self._file is not None:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+
+    def report(self, rule, kind, value, details, line, data):
+        '''Records an error, printing it in full if under max_messages.
+
+        Takes the same arguments as ErrorCollector.report.
+        '''
+        message = None
+        if self._should_print():
+            message = format_error(rule, data(), details)
+
+        self.add(ErrorRecord(line, rule.target, value, kind, details), message)
+
+    def merge(self, records, line_offset=0):
+        '''Adds the records from an ErrorCollector.
+
+        Args:
+            records (list): The (ErrorRecord, message) pairs.
+            line_offset (int): Added to each record's line.
+        '''
+        for record, message in records:
+            if record.line is not None:
+                record.line += line_offset
+            self.add(record, message)
+
+    def flush(self):
+        '''Writes the buffered records to the sidecar file'''
+        if self._file is None or not self._buffer:
+            return
+
+        lines = [
+            json.dumps(record.as_dict(), default=str) + '\n'
+            for record in self._buffer
+        ]
+        self._file.write(''.join(lines))
+        self._file.flush()
+        self._buffer = []
+
+    def close(self):
+        '''Flushes and closes the sidecar file'''
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        '''Ends a conversion, noting how many errors weren't printed'''
+        self.close()
+        suppressed = self.total - self.printed
+        if suppressed and not self.quiet:
+            print(SUPPRESSED_MSG_TEMPLATE.format(suppressed, self.total))
+
+    def summary(self):
+        '''
+        Returns:
+            dict: The error counts of the last conversion
+        '''
+        return {
+            'total': self.total,
+            'printed': self.printed,
+            'by_target': dict(self.counts),
+            'by_kind': dict(self.kinds)
+        }
@@ -0,0 +1,307 @@
+import io
+import os
+import csv
+import json
+import mmap
+import hashlib
+
+from .compression import compression_from_path
+from .parallel import BOUNDARY_READ_SIZE, CHUNK_SIZE, read_header
+from .parallel import iter_row_ranges
+from .readers import ProjectedReader
+from .sources import BufferReader, text_reader
+from .writers import get_writer, values_getter
+
+# Output formats that can be appended to
+APPENDABLE_FORMATS = ('csv', 'ndjson')
+
+# Bytes before the checkpoint offset that must be unchanged to resume
+TAIL_SIZE = 4096
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def rules_hash(converter, to, compact):
+    '''Hashes everything that decides the output of a conversion'''
+    rules = []
+    lookups = []
+    for rule in converter.filters + converter.rules:
+        definition = rule.as_dict()
+        # caching doesn't change the output
+        definition.pop('cache_size', None)
+        rules.append(definition)
+        if rule.lookup is not None:
+            # a changed reference csv changes the looked up values, by its
+            # path, modification time, and size like its SQLite index
+            lookups.append(rule.lookup._fingerprint())
+
+    settings = {
+        'rules': rules,
+        'lookups': lookups,
+        'missing_source': converter.missing_source.value,
+        'to': to,
+        'compact': compact,
+    }
+    return _hash(json.dumps(settings, sort_keys=True, default=str).encode())
+
+
+def complete_rows_end(file, start):
+    '''Finds the end of the last complete row of a csv.
+
+    A row is only complete once its newline has been written, so a row
+    still being appended is left for the next run.
+
+    Args:
+        file (file object): The csv file, opened in binary mode.
+        start (int): The offset of a row to start from.
+
+    Returns:
+        int: The offset just past the last newline outside a quoted field.
+    '''
+    file.seek(start)
+    offset = start
+    end = start
+    quoted = False
+
+    while True:
+        data = file.read(BOUNDARY_READ_SIZE)
+        if not data:
+            return end
+
+        position = 0
+        while True:
+            newline = data.find(b'\n', position)
+            if newline == -1:
+                quoted ^= data.count(b'"', position) % 2 == 1
+                break
+
+            quoted ^= data.count(b'"', position, newline) % 2 == 1
+            position = newline + 1
+            if not quoted:
+                end = offset + position
+
+        offset += len(data)
+
+
+class Checkpoint:
+    '''
+    How far an incremental conversion has got, saved next to its outfile
+
+    ...
+
+    Attributes
+    ----------
+    offset : int
+        the offset in the csv after the last converted row
+    rows : int
+        the number of rows converted
+    lines : int
+        the number of lines of the csv read, including the header
+    output_offset : int
+        the size of the outfile after the last converted row
+    header_hash : str
+        the sha256 of the csv's header
+    rules_hash : str
+        the sha256 of the rules and output settings, from rules_hash
+    tail_hash : str
+        the sha256 of the TAIL_SIZE bytes of csv before offset
+    '''
+
+    FIELDS = (
+        'offset', 'rows', 'lines', 'output_offset', 'header_hash',
+        'rules_hash', 'tail_hash'
+    )
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Returns:
+            Checkpoint: The saved checkpoint, None if there isn't a valid
+            one at path.
+        '''
+        try:
+            with open(path) as file:
+                fields = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(fields, dict):
+            return None
+        return cls(**fields)
+
+    def save(self, path):
+        '''Writes the checkpoint, replacing the old one in one step'''
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({field: getattr(self, field) for field in self.FIELDS},
+                      file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+
+def _tail_hash(buffer, header_end, offset):
+    return _hash(buffer[max(header_end, offset - TAIL_SIZE):offset])
+
+
+def _can_resume(checkpoint, buffer, header_end, header_hash, ruleset,
+                outfile):
+    '''Whether a checkpoint still matches the csv, rules, and outfile'''
+    if checkpoint is None:
+        return False
+
+    if checkpoint.header_hash != header_hash or \
+            checkpoint.rules_hash != ruleset:
+        return False
+
+    offset = checkpoint.offset
+    if type(offset) is not int or not header_end <= offset <= len(buffer):
+        return False
+
+    # the rows already converted must still be the start of the file
+    if checkpoint.tail_hash != _tail_hash(buffer, header_end, offset):
+        return False
+
+    try:
+        return os.path.getsize(outfile) >= checkpoint.output_offset
+    except (OSError, TypeError):
+        return False
+
+
+def _save(checkpoint, path, output, buffer, header_end):
+    '''Saves a checkpoint once the rows before it are on disk'''
+    output.flush()
+    os.fsync(output.fileno())
+    checkpoint.output_offset = os.fstat(output.fileno()).st_size
+    checkpoint.tail_hash = _tail_hash(buffer, header_end, checkpoint.offset)
+    checkpoint.save(path)
+
+
+def convert_incremental(
+    converter, csv_file, outfile, to='csv', compact=False,
+    checkpoint_file=None, chunk_size=CHUNK_SIZE
+):
+    '''Converts the rows appended to a csv since the last run, appending
+    them to the outfile.
+
+    A Checkpoint is saved after every chunk of rows, so a run that stops
+    part way resumes from its last chunk. The outfile is rebuilt from the
+    start when there is no usable checkpoint, or the csv's header, the
+    rows before the checkpoint, or the rules have changed.
+
+    Args:
+        converter (CSVConverter): The converter to run.
+        csv_file (str): The file path of the csv, uncompressed.
+        outfile (str): The file path of the output, uncompressed.
+        to (str): The output format, `csv` or `ndjson`.
+        compact (bool): Optional - Compact ndjson output.
+        checkpoint_file (str): Optional - Where to save the checkpoint,
+            the outfile's path + CHECKPOINT_SUFFIX by default.
+        chunk_size (int): The approximate number of bytes of csv converted
+            between checkpoints.
+
+    Returns:
+        int: The number of rows written by this run.
+
+    Raises:
+        ValueError: For formats that can't be appended to, or compressed
+            files.
+    '''
+    if to not in APPENDABLE_FORMATS:
+        raise ValueError(
+            'Incremental output must be one of {}, not {}'
+            .format(', '.join(APPENDABLE_FORMATS), to)
+        )
+
+    for path in (csv_file, outfile):
+        if compression_from_path(path) is not None:
+            raise ValueError(
+                'Incremental conversion needs uncompressed files: {}'
+                .format(path)
+            )
+
+    checkpoint_file = checkpoint_file or outfile + CHECKPOINT_SUFFIX
+
+    with open(csv_file, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return 0
+        # rows appended while converting are left for the next run
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with buffer:
+        header, header_end, header_lines = read_header(buffer)
+        if header is None:
+            return 0
+
+        header_hash = _hash(buffer[:header_end])
+        ruleset = rules_hash(converter, to, compact)
+        checkpoint = Checkpoint.load(checkpoint_file)
+
+        if not _can_resume(
+            checkpoint, buffer, header_end, header_hash, ruleset, outfile
+        ):
+            checkpoint = Checkpoint(
+                offset=header_end,
+                rows=0,
+                lines=header_lines,
+                output_offset=0,
+                header_hash=header_hash,
+                rules_hash=ruleset,
+            )
+
+        indexes = converter._resolve_sources(header)
+        positions, header, indexes = converter._project(header, indexes)
+        end = complete_rows_end(buffer, checkpoint.offset)
+
+        # drops anything a crashed run wrote after its last checkpoint
+        with open(outfile, 'a'):
+            pass
+        os.truncate(outfile, checkpoint.output_offset)
+
+        with open(outfile, 'a', newline='') as output:
+            writer = get_writer(
+                to, output, converter.field_names, converter.date_fields,
+                compact
+            )
+            if checkpoint.output_offset == 0:
+                writer.write_header()
+            values = values_getter(writer.field_names)
+
+            written = 0
+            with io.BufferedReader(BufferReader(buffer, 0, end)) as rows:
+                ranges = iter_row_ranges(rows, checkpoint.offset, chunk_size)
+
+                for start, stop in ranges:
+                    with text_reader(buffer, start, stop) as text:
+                        if positions is None:
+                            reader = csv.reader(text)
+                        else:
+                            reader = ProjectedReader(text, positions)
+
+                        count = 0
+                        for row in converter._convert_rows(
+                            reader, header, indexes, checkpoint.lines
+                        ):
+                            writer.write_values(values(row))
+                            count += 1
+
+                    checkpoint.offset = stop
+                    checkpoint.rows += count
+                    checkpoint.lines += reader.line_num
+                    _save(checkpoint, checkpoint_file, output, buffer,
+                          header_end)
+                    written += count
+
+            # saves the header of a rebuild with no rows yet
+            if checkpoint.tail_hash is None:
+                _save(checkpoint, checkpoint_file, output, buffer, header_end)
+
+    return written
@@ -0,0 +1,401 @@
+import os
+import sys
+import csv
+import hashlib
+from itertools import chain
+from time import perf_counter
+
+from .cache import OperationCache
+from .rules import SourceNotFound, NOT_CACHED, NOT_FOUND
+from .sources import CSVSource
+
+# Estimated memory the index can use before it is moved to SQLite
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Results kept in front of a SQLite index, by default
+DEFAULT_CACHE_SIZE = 100000
+
+# Estimated bytes of a dict entry besides its key and value
+ENTRY_OVERHEAD = 100
+
+
+def _sizeof(key):
+    '''The estimated bytes of a key, including the values of a tuple'''
+    if type(key) is tuple:
+        return sys.getsizeof(key) + sum(map(sys.getsizeof, key))
+    return sys.getsizeof(key)
+
+
+class LookupTable:
+    '''
+    A reference csv indexed by a key column, for Lookup rules
+
+    The index is built the first time it is needed, by reading the whole
+    file into a dict. If its estimated size passes memory_limit, the rows
+    are moved to a SQLite database instead, with an LRU cache of results
+    in front of it. Keys are compared as strings. Worker processes started
+    by fork share the index of the process that built it.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the file path of the reference csv, which can be compressed
+    key : str || list
+        the column(s) of the reference csv to match the rule's value with,
+        a list to match a list of values
+    value : str
+        the column whose value the rule outputs
+    default
+        optional - the value for keys with no match, which are otherwise
+        a ConversionError
+    memory_limit : int
+        the estimated bytes the index can use in memory
+    index_dir : str
+        optional - a directory to keep SQLite indexes in, reused while
+        the reference csv is unchanged. They are temporary otherwise
+    cache_size : int
+        the number of results cached in front of a SQLite index
+    backend : str
+        `memory` or `sqlite`, None until the index is built
+    rows : int
+        the number of rows in the index
+    build_seconds : float
+        the time it took to build the index, or to open a reused one
+    lookups : int
+        the keys looked up since the counters were reset
+    hits : int
+        the lookups that found a match
+    cache : OperationCache
+        the results cached in front of a SQLite index, None for memory
+    '''
+
+    def __init__(
+        self, path, key, value, default=NOT_FOUND,
+        memory_limit=DEFAULT_MEMORY_LIMIT, index_dir=None,
+        cache_size=DEFAULT_CACHE_SIZE
+    ):
+        self.path = path
+        self.key = key
+        self.value = value
+        self.default = default
+        self.memory_limit = memory_limit
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+        self.backend = None
+        self.rows = 0
+        self.build_seconds = 0.0
+        self.lookups = 0
+        self.hits = 0
+        self.cache = None
+        self._index = None
+        self._db_path = None
+        self._directory = None
+        self._connection = None
+        self._pid = None
+
+    @classmethod
+    def from_dict(cls, definition, base_dir=None):
+        '''Creates a table from the `lookup` section of a yaml rule.
+
+        Args:
+            definition (dict): The `file`, `key`, and `value`, and
+                optionally `default`, `memory_limit`, `index_dir`, and
+                `cache_size`.
+            base_dir (str): Optional - The directory relative paths are
+                relative to, the yaml file's.
+
+        Returns:
+            LookupTable: The table, not yet loaded.
+        '''
+        path = definition['file']
+        index_dir = definition.get('index_dir')
+        if base_dir is not None:
+            path = os.path.normpath(os.path.join(base_dir, path))
+            if index_dir is not None:
+                index_dir = os.path.normpath(os.path.join(base_dir, index_dir))
+
+        return cls(
+            path,
+            definition['key'],
+            definition['value'],
+            definition.get('default', NOT_FOUND),
+            definition.get('memory_limit', DEFAULT_MEMORY_LIMIT),
+            index_dir,
+            definition.get('cache_size', DEFAULT_CACHE_SIZE)
+        )
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the table
+        '''
+        result = {
+            'file': self.path,
+            'key': self.key,
+            'value': self.value,
+            'memory_limit': self.memory_limit,
+            'index_dir': self.index_dir,
+            'cache_size': self.cache_size,
+        }
+        if self.default is not NOT_FOUND:
+            result['default'] = self.default
+        return result
+
+    def __getstate__(self):
+        # SQLite connections can't be sent to other processes, they open
+        # their own, and the temporary directory is only removed by this one
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_directory'] = None
+        state['_pid'] = None
+        return state
+
+    def _columns(self, header):
+        '''The positions of the key column(s) and the value column'''
+        keys = self.key if type(self.key) is list else [self.key]
+        positions = {name: i for i, name in enumerate(header)}
+        missing = [
+            name for name in keys + [self.value] if name not in positions
+        ]
+        if missing:
+            raise SourceNotFound(
+                'Lookup column(s) not found in {}: {}'.format(
+                    self.path, missing
+                )
+            )
+        return [positions[name] for name in keys], positions[self.value]
+
+    def _entries(self, reader, key_positions, value_position):
+        '''The (key, value) of each reference row'''
+        width = max(key_positions + [value_position]) + 1
+        padding = [''] * width
+        single = type(self.key) is not list
+        key_position = key_positions[0]
+
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + padding[len(row):]
+            if single:
+                yield row[key_position], row[value_position]
+            else:
+                yield (
+                    tuple([row[p] for p in key_positions]),
+                    row[value_position]
+                )
+
+    def _fingerprint(self):
+        '''Names the SQLite index of the reference csv as it is now'''
+        stat = os.stat(self.path)
+        parts = [
+            os.path.abspath(self.path), stat.st_mtime_ns, stat.st_size,
+            self.key, self.value
+        ]
+        return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+    def load(self):
+        '''Builds the index, if it hasn't been already.
+
+        Raises:
+            SourceNotFound: If the key or value column is missing from the
+                reference csv.
+        '''
+        if self.backend is not None:
+            return
+
+        start = perf_counter()
+        if self.index_dir is not None:
+            self._db_path = os.path.join(
+                self.index_dir, 'lookup-{}.sqlite'.format(self._fingerprint())
+            )
+            if os.path.exists(self._db_path):
+                self._open_sqlite()
+                self.build_seconds = perf_counter() - start
+                return
+
+        with CSVSource(self.path).open() as file:
+            reader = csv.reader(file)
+            key_positions, value_position = self._columns(
+                next(reader, None) or []
+            )
+            entries = self._entries(reader, key_positions, value_position)
+
+            index = {}
+            size = 0
+            limit = self.memory_limit
+            for key, value in entries:
+                index[key] = value
+                size += _sizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+                if size > limit:
+                    # the rest of the rows are streamed straight to disk
+                    self._build_sqlite(chain(index.items(), entries))
+                    break
+            else:
+                self.backend = 'memory'
+                self._index = index
+                self.rows = len(index)
+
+        self.build_seconds = perf_counter() - start
+
+    def _build_sqlite(self, entries):
+        '''Writes the index to a SQLite database, and opens it'''
+        import sqlite3
+
+        if self._db_path is None:
+            import tempfile
+            self._directory = tempfile.TemporaryDirectory(
+                prefix='csv-etl-lookup-'
+            )
+            self._db_path = os.path.join(self._directory.name, 'lookup.sqlite')
+        else:
+            os.makedirs(self.index_dir, exist_ok=True)
+
+        columns = self._key_columns()
+        if type(self.key) is list:
+            rows = (key + (value,) for key, value in entries)
+        else:
+            rows = entries
+
+        # built under another name, so a half written index is never used
+        building = '{}.{}.tmp'.format(self._db_path, os.getpid())
+        connection = sqlite3.connect(building)
+        try:
+            connection.execute('PRAGMA journal_mode = OFF')
+            connection.execute('PRAGMA synchronous = OFF')
+            connection.execute(
+                'CREATE TABLE lookup ({}, value TEXT, PRIMARY KEY ({})) '
+                'WITHOUT ROWID'.format(
+                    ', '.join(column + ' TEXT' for column in columns),
+                    ', '.join(columns)
+                )
+            )
+            # later rows win, the same as the dict
+            connection.executemany(
+                'INSERT OR REPLACE INTO lookup VALUES ({})'.format(
+                    ', '.join('?' * (len(columns) + 1))
+                ),
+                rows
+            )
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(building, self._db_path)
+        self._open_sqlite()
+
+    def _key_columns(self):
+        '''The names of the key columns in the SQLite table'''
+        width = len(self.key) if type(self.key) is list else 1
+        return ['k{}'.format(i) for i in range(width)]
+
+    def _open_sqlite(self):
+        '''Opens the SQLite index at self._db_path for lookups'''
+        import sqlite3
+
+        self._connection = sqlite3.connect(self._db_path)
+        self._connection.execute('PRAGMA query_only = ON')
+        self._pid = os.getpid()
+        self._select = 'SELECT value FROM lookup WHERE {}'.format(
+            ' AND '.join(column + ' = ?' for column in self._key_columns())
+        )
+        if self.backend is None:
+            self.backend = 'sqlite'
+            self.rows = self._connection.execute(
+                'SELECT COUNT(*) FROM lookup'
+            ).fetchone()[0]
+        if self.cache is None:
+            self.cache = OperationCache(self.cache_size)
+
+    def _query(self, key):
+        '''Looks a key up in the SQLite index'''
+        if self._pid != os.getpid():
+            # connections can't be shared with a forked process
+            self._open_sqlite()
+
+        params = key if type(key) is tuple else (key,)
+        row = self._connection.execute(self._select, params).fetchone()
+        return NOT_FOUND if row is None else row[0]
+
+    def get(self, key):
+        '''Looks up the value of a key.
+
+        Args:
+            key: The rule's value after its operations, a list for a list
+                of key columns. Compared as strings.
+
+        Returns:
+            The value column of the matching row, or the default when there
+            is none, NOT_FOUND without a default.
+        '''
+        if self.backend is None:
+            self.load()
+
+        if type(key) is list:
+            key = tuple([str(k) for k in key])
+        elif type(key) is not str:
+            key = str(key)
+
+        self.lookups += 1
+        if self._index is not None:
+            value = self._index.get(key, NOT_FOUND)
+        else:
+            value = self.cache.get(key, NOT_CACHED)
+            if value is NOT_CACHED:
+                value = self._query(key)
+                self.cache.put(key, value)
+
+        if value is NOT_FOUND:
+            return self.default
+
+        self.hits += 1
+        return value
+
+    def reset_counts(self):
+        '''Resets lookups and hits, for a new conversion'''
+        self.lookups = 0
+        self.hits = 0
+
+    def drain_counts(self):
+        '''Returns and resets (lookups, hits), for sending from workers'''
+        counts = (self.lookups, self.hits)
+        self.reset_counts()
+        return counts
+
+    def merge_counts(self, counts):
+        '''Adds the (lookups, hits) drained from a worker'''
+        self.lookups += counts[0]
+        self.hits += counts[1]
+
+    def stats(self):
+        '''
+        Returns:
+            dict: The backend, rows, and build time of the index, and the
+            lookups, hits, and hit rate since the counters were reset
+        '''
+        result = {
+            'backend': self.backend,
+            'rows': self.rows,
+            'build_seconds': self.build_seconds,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+        }
+        if self.cache is not None:
+            result['cache'] = self.cache.stats()
+        return result
+
+    def close(self):
+        '''Closes the SQLite index and removes it if it was temporary, the
+        index is built again if the table is used after'''
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._directory is not None:
+            self._directory.cleanup()
+            self._directory = None
+            self._db_path = None
+        self.backend = None
+        self._index = None
+        self.cache = None
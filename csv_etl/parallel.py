@@ -0,0 +1,208 @@
+import csv
+from collections import deque
+from itertools import islice
+
+from .errors import ErrorCollector
+from .readers import ProjectedReader
+from .sources import CSVSource, map_buffer, text_reader
+
+# Approximate number of bytes of csv handed to a worker at a time
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Bytes read at a time while looking for the end of a row
+BOUNDARY_READ_SIZE = 64 * 1024
+
+# Chunks queued per worker, bounds how many converted chunks are in memory
+PENDING_CHUNKS_PER_WORKER = 2
+
+# Set in each worker process by _init_worker
+_worker_state = {}
+
+
+def _find_row_end(file, offset, quoted=False):
+    '''Finds the end of the csv row that `file` is currently positioned in.
+
+    A newline only ends a row when it is outside of a quoted field. With
+    doubled quotes as the escape, that is whenever an even number of
+    quotes has been seen since the start of the row.
+
+    Args:
+        file (file object): A binary file positioned at `offset`.
+        offset (int): The current position of `file`.
+        quoted (bool): Whether `offset` is inside a quoted field.
+
+    Returns:
+        int: The offset just past the row's newline, or the end of the file.
+    '''
+    while True:
+        data = file.read(BOUNDARY_READ_SIZE)
+        if not data:
+            return offset
+
+        position = 0
+        while True:
+            newline = data.find(b'\n', position)
+            if newline == -1:
+                quoted ^= data.count(b'"', position) % 2 == 1
+                break
+
+            quoted ^= data.count(b'"', position, newline) % 2 == 1
+            position = newline + 1
+            if not quoted:
+                file.seek(offset + position)
+                return offset + position
+
+        offset += len(data)
+
+
+def iter_row_ranges(file, start, chunk_size=CHUNK_SIZE):
+    '''Splits a csv file into byte ranges that start and end on rows.
+
+    Args:
+        file (file object): The csv file, opened in binary mode.
+        start (int): The offset of the first row, after the header.
+        chunk_size (int): The approximate size of each range.
+
+    Yields:
+        tuple: The (start, end) offsets of each range.
+    '''
+    file.seek(start)
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            return
+
+        quoted = data.count(b'"') % 2 == 1
+        end = _find_row_end(file, start + len(data), quoted)
+
+        yield start, end
+        start = end
+
+
+def read_header(file):
+    '''Reads the header row of a csv file.
+
+    Args:
+        file (file object): The csv file, opened in binary mode.
+
+    Returns:
+        tuple: The header fields (None for an empty file), the offset of
+        the first row after the header, and the number of lines it spans.
+    '''
+    file.seek(0)
+    end = _find_row_end(file, 0)
+    file.seek(0)
+    reader = csv.reader(text_reader(file.read(end)))
+    header = next(reader, None)
+    return header, end, reader.line_num
+
+
+def _init_worker(converter, data, header, indexes, positions):
+    '''Stores the converter in the worker, so rules are only sent once'''
+    # Errors are sent back with each chunk, and printed by the parent
+    converter.errors = ErrorCollector(converter.errors.max_messages)
+    _worker_state['converter'] = converter
+    # every chunk is read straight from one mapping of the file
+    _worker_state['buffer'] = map_buffer(data)
+    _worker_state['header'] = header
+    _worker_state['indexes'] = indexes
+    _worker_state['positions'] = positions
+
+
+def _convert_range(start, end):
+    '''Converts the rows between two offsets of the csv file
+
+    Returns:
+        tuple: The converted rows, the error records, the number of lines
+        in the range, the RuleStats of the range when profiling, the rows
+        each filter dropped, and the (lookups, hits) of each Lookup rule.
+    '''
+    converter = _worker_state['converter']
+    positions = _worker_state['positions']
+
+    with text_reader(_worker_state['buffer'], start, end) as file:
+        if positions is None:
+            reader = csv.reader(file)
+        else:
+            reader = ProjectedReader(file, positions)
+        rows = list(converter._convert_rows(
+            reader,
+            _worker_state['header'],
+            _worker_state['indexes']
+        ))
+
+    rules = None
+    if converter.stats is not None:
+        rules = converter.stats.drain_rules()
+
+    return (
+        rows, converter.errors.drain(), reader.line_num, rules,
+        converter._drain_dropped(), converter._drain_lookups()
+    )
+
+
+def iter_convert_parallel(converter, source, workers, chunk_size=CHUNK_SIZE):
+    '''Executes rules on a csv file across a pool of worker processes
+
+    The file is split into chunks on row boundaries, and each chunk is
+    converted by a worker. Rows are yielded in their original order.
+    Files are memory-mapped, by the parent to find the chunks and by each
+    worker to read them.
+
+    Args:
+        converter (CSVConverter): The converter to run in each worker.
+        source: The csv to convert, a CSVSource or anything it takes.
+        workers (int): The number of worker processes.
+        chunk_size (int): The approximate size in bytes of each chunk.
+
+    Yields:
+        dict: The converted row.
+    '''
+    # only imported when needed, it adds to every run's startup
+    from multiprocessing import Pool
+
+    source = CSVSource(source)
+    with source.open_buffer() as file:
+        header, start, line = read_header(file)
+        if header is None:
+            return
+
+        # Missing sources are reported once here, not in every worker
+        indexes = converter._resolve_sources(header)
+        positions, header, indexes = converter._project(header, indexes)
+        stats = converter.stats
+
+        with Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                converter, source.portable(), header, indexes, positions
+            )
+        ) as pool:
+            pending = deque()
+            ranges = iter_row_ranges(file, start, chunk_size)
+            queued = workers * PENDING_CHUNKS_PER_WORKER
+
+            while True:
+                # keep the pool busy, with a bounded number of chunks queued
+                for row_range in islice(ranges, queued - len(pending)):
+                    pending.append((
+                        row_range[1],
+                        pool.apply_async(_convert_range, row_range)
+                    ))
+
+                if not pending:
+                    return
+
+                end, result = pending.popleft()
+                rows, errors, lines, rules, dropped, lookups = result.get()
+                converter.errors.merge(errors, line)
+                for i, count in enumerate(dropped):
+                    converter._dropped[i] += count
+                converter._merge_lookups(lookups)
+                line += lines
+                if stats is not None:
+                    stats.advance(end)
+                    if rules:
+                        stats.merge_rules(rules)
+                yield from rows
@@ -0,0 +1,432 @@
+from datetime import datetime
+
+from .rules import (
+    RuleType, OutputType, ConversionError, NOT_CACHED, _code_names
+)
+
+# Every name the generated code defines starts with this prefix, operations
+# that use such a name are called instead of being inlined
+RESERVED_PREFIX = '_c_'
+
+PLAN_FUNCTION_TEMPLATE = '''
+def _c_convert_row(_c_row, _c_columns=None, _c_i=0):
+{}
+    return {{{}}}
+'''
+
+FILTER_FUNCTION_TEMPLATE = '''
+def _c_keep(_c_row):
+{}
+    return True
+'''
+
+
+def _can_inline(rule):
+    '''Whether a rule's operations can be pasted into the plan function.
+
+    Inlined operations share one namespace, so they must not touch the
+    generated names, and only Date rules may see `datetime`.
+    '''
+    for operation in rule.operations:
+        names = _code_names(compile(operation, '<operation>', 'eval'))
+
+        if any(name.startswith(RESERVED_PREFIX) for name in names):
+            return False
+
+        if 'datetime' in names and rule.output_type != OutputType.Date:
+            return False
+
+    return True
+
+
+def _emit_cast(lines, var, type_value, rule_name, indent):
+    '''Appends the statements that do Rule._cast_type on `var`'''
+    pad = ' ' * indent
+
+    if type_value == 'String':
+        lines.append('{}{} = str({})'.format(pad, var, var))
+
+    if type_value in ('Integer', 'Decimal'):
+        cast = 'int' if type_value == 'Integer' else 'float'
+        lines.extend([
+            '{}if type({}) is str:'.format(pad, var),
+            '{}    {} = {}.replace(\',\', \'\')'.format(pad, var, var),
+            '{}try:'.format(pad),
+            '{}    {} = {}({})'.format(pad, var, cast, var),
+            '{}except ValueError as _c_e:'.format(pad),
+            '{}    raise _c_ConversionError({}, {}, \'output\', str(_c_e))'
+            .format(pad, rule_name, var),
+        ])
+
+
+def _emit_shared_cast(lines, var, position, type_value):
+    '''Appends the statements that fetch and cast a column for every rule
+    that reads it as type_value.
+
+    A failed cast leaves a _Failed in `var`, each rule raises its own
+    ConversionError from it when it runs.
+    '''
+    lines.append('    {} = _c_row[{}]'.format(var, position))
+    if type_value == 'String':
+        lines.append('    {} = str({})'.format(var, var))
+
+    if type_value in ('Integer', 'Decimal'):
+        cast = 'int' if type_value == 'Integer' else 'float'
+        lines.extend([
+            '    if type({}) is str:'.format(var),
+            '        {} = {}.replace(\',\', \'\')'.format(var, var),
+            '    try:',
+            '        {} = {}({})'.format(var, cast, var),
+            '    except ValueError as _c_e:',
+            '        {} = _c_Failed({}, str(_c_e))'.format(var, var),
+        ])
+
+
+def _emit_shared_check(lines, var, type_value, rule_name, indent):
+    '''Appends the statements that raise a rule's error for a failed cast'''
+    if type_value not in ('Integer', 'Decimal'):
+        return
+
+    pad = ' ' * indent
+    lines.extend([
+        '{}if type({}) is _c_Failed:'.format(pad, var),
+        '{}    raise _c_ConversionError({}, {}.value, \'output\', {}.message)'
+        .format(pad, rule_name, var, var),
+    ])
+
+
+class _Failed:
+    '''A shared cast that raised, with the value and error message'''
+
+    def __init__(self, value, message):
+        self.value = value
+        self.message = message
+
+
+class Precomputed:
+    '''
+    Index for a rule whose values are computed outside of the plan
+
+    The plan reads the rule's value from `columns[position][i]`, where
+    `columns` and `i` are passed to RowPlan.convert_row with the row.
+    '''
+
+    def __init__(self, position):
+        self.position = position
+
+
+class Constant:
+    '''
+    Index for a rule whose value is the same for every row
+
+    The value is computed once by CSVConverter, and the plan puts it in
+    each converted row as is.
+    '''
+
+    def __init__(self, value):
+        self.value = value
+
+
+class RowPlan:
+    '''
+    A rule set compiled into a single function for one csv header
+
+    The generated function does the same fetches, casts, and operations
+    as Rule.execute_row for every rule, without the per rule dispatch.
+    Each (column, input_type) pair is fetched and cast once per row, and
+    shared by every rule that reads it.
+
+    ...
+
+    Attributes
+    ----------
+    rules : list
+        the rules the plan executes
+    indexes : list
+        the source positions of each rule, from CSVConverter._resolve_sources
+    shared : list
+        the (position, InputType, targets) of every shared cast, where
+        targets has the target of each rule reading it, once per read
+    source : str
+        the generated python source of the plan function
+    convert_row : function
+        takes a positional csv row (list) and returns the converted dict,
+        optionally with the `columns` and row number `i` of a batch for
+        Precomputed rules
+    '''
+
+    def __init__(self, rules, indexes, on_error, missing):
+        '''
+        Args:
+            rules (list): The rules to compile.
+            indexes (list): The source positions of each rule.
+            on_error (function): Called with (rule, row, ConversionError,
+                i) when a rule fails, where i is the row's position in the
+                batch. The target is then left blank.
+            missing: The index placeholder for rules with missing sources.
+        '''
+        self.rules = rules
+        self.indexes = indexes
+
+        namespace = {
+            '_c_ConversionError': ConversionError,
+            '_c_on_error': on_error,
+            '_c_NOT_CACHED': NOT_CACHED,
+            '_c_Failed': _Failed,
+            'datetime': datetime,
+        }
+        body = []
+        items = []
+
+        shared = self._share_casts(rules, indexes, missing)
+        self.shared = []
+        for (position, input_type), (var, targets) in shared.items():
+            self.shared.append((position, input_type, targets))
+            _emit_shared_cast(body, var, position, input_type.value)
+
+        for i, (rule, index) in enumerate(zip(rules, indexes)):
+            value = '_c_v{}'.format(i)
+            target = '_c_t{}'.format(i)
+            namespace[target] = rule.target
+            items.append('{}: {}'.format(target, value))
+
+            if index is missing:
+                body.append('    {} = \'\''.format(value))
+                continue
+
+            if isinstance(index, Constant):
+                # referenced straight from the dict display
+                namespace[value] = index.value
+                continue
+
+            if isinstance(index, Precomputed):
+                body.append('    {} = _c_columns[{}][_c_i]'.format(
+                    value, index.position
+                ))
+                continue
+
+            rule_name = '_c_r{}'.format(i)
+            namespace[rule_name] = rule
+            lines = self._emit_rule(rule, index, i, namespace, shared)
+            if rule.cache is not None:
+                lines = self._emit_cached(rule, index, i, lines, namespace)
+            body.extend(lines)
+
+        source = PLAN_FUNCTION_TEMPLATE.format(
+            '\n'.join(body) or '    pass',
+            ', '.join(items)
+        )
+        exec(compile(source, '<plan>', 'exec'), namespace)
+
+        self.source = source
+        self.convert_row = namespace['_c_convert_row']
+
+    def _share_casts(self, rules, indexes, missing):
+        '''Finds the (column, input_type) pairs read by the rules.
+
+        Cached rules are left out, their cache is keyed on the raw values
+        so they only cast on a miss.
+
+        Returns:
+            dict: (variable name, targets) by (position, InputType), in the
+            order they are first read.
+        '''
+        shared = {}
+
+        for rule, index in zip(rules, indexes):
+            if rule.type == RuleType.Static or rule.cache is not None:
+                continue
+            if index is missing or type(index) not in (int, list):
+                continue
+
+            for position in (index if type(index) is list else [index]):
+                key = (position, rule.input_type)
+                if key not in shared:
+                    shared[key] = ('_c_x{}'.format(len(shared)), [])
+                shared[key][1].append(rule.target)
+
+        return shared
+
+    def _emit_rule(self, rule, index, i, namespace, shared):
+        '''Generates the statements for a single rule'''
+        value = '_c_v{}'.format(i)
+        rule_name = '_c_r{}'.format(i)
+        input_type = rule.input_type.value
+        lines = ['    # {}'.format(repr(rule.target)), '    try:']
+
+        # fetch
+        if rule.type == RuleType.Static:
+            namespace['_c_source{}'.format(i)] = rule.source
+            lines.append('        s = _c_source{}'.format(i))
+
+        elif type(index) is list:
+            names = []
+            for j, position in enumerate(index):
+                key = (position, rule.input_type)
+                if key in shared:
+                    name = shared[key][0]
+                    if name not in names:
+                        _emit_shared_check(
+                            lines, name, input_type, rule_name, 8
+                        )
+                else:
+                    name = '_c_s{}_{}'.format(i, j)
+                    lines.append(
+                        '        {} = _c_row[{}]'.format(name, position)
+                    )
+                    _emit_cast(lines, name, input_type, rule_name, 8)
+                names.append(name)
+            lines.append('        s = [{}]'.format(', '.join(names)))
+
+        elif (index, rule.input_type) in shared:
+            name = shared[(index, rule.input_type)][0]
+            _emit_shared_check(lines, name, input_type, rule_name, 8)
+            lines.append('        s = {}'.format(name))
+
+        else:
+            lines.append('        s = _c_row[{}]'.format(index))
+            _emit_cast(lines, 's', input_type, rule_name, 8)
+
+        # operations
+        if rule.operations and _can_inline(rule):
+            for operation in rule.operations:
+                lines.append('        s = (\n{}\n        )'.format(operation))
+
+        elif rule.operations:
+            lines.append('        s = {}._perform_operations(s)'.format(
+                rule_name
+            ))
+
+        if rule.type == RuleType.Lookup:
+            lines.append('        s = {}._lookup(s)'.format(rule_name))
+
+        # output cast, skipped when the input cast already produced it
+        output_type = rule.output_type.value
+        already_cast = (
+            rule.type == RuleType.Calculation and
+            not rule.operations and
+            input_type == output_type
+        )
+        if not already_cast:
+            _emit_cast(lines, 's', output_type, rule_name, 8)
+        lines.append('        {} = s'.format(value))
+        if rule.cache is not None:
+            lines.append('        _c_cache{}.put(_c_k, s)'.format(i))
+        lines.extend([
+            '    except _c_ConversionError as _c_e:',
+            '        _c_on_error({}, _c_row, _c_e, _c_i)'.format(rule_name),
+            '        {} = \'\''.format(value),
+        ])
+        return lines
+
+    def _emit_cached(self, rule, index, i, lines, namespace):
+        '''Wraps a rule's statements in a lookup of its OperationCache'''
+        value = '_c_v{}'.format(i)
+        namespace['_c_cache{}'.format(i)] = rule.cache
+
+        if type(index) is list:
+            key = '({},)'.format(', '.join(
+                '_c_row[{}]'.format(position) for position in index
+            ))
+        else:
+            key = '_c_row[{}]'.format(index)
+
+        cached = [
+            lines[0],
+            '    _c_k = {}'.format(key),
+            '    {} = _c_cache{}.get(_c_k, _c_NOT_CACHED)'.format(value, i),
+            '    if {} is _c_NOT_CACHED:'.format(value),
+        ]
+        return cached + ['    ' + line for line in lines[1:]]
+
+
+class FilterPlan:
+    '''
+    Filter rules compiled into a single predicate for one csv header
+
+    Filters run before any other rule, in order, and each one only fetches
+    and casts the columns it reads. The first filter to reject a row stops
+    the rest from running. A filter that raises a ConversionError rejects
+    the row, after reporting the error.
+
+    ...
+
+    Attributes
+    ----------
+    filters : list
+        the Filter rules
+    indexes : list
+        the source positions of each filter
+    source : str
+        the generated python source of the predicate
+    keep : function
+        takes a positional csv row (list) and returns whether to convert it
+    '''
+
+    def __init__(self, filters, indexes, on_error, dropped):
+        '''
+        Args:
+            filters (list): The Filter rules to compile.
+            indexes (list): The source positions of each filter.
+            on_error (function): Called with (rule, row, ConversionError,
+                0) when a filter fails.
+            dropped (list): The rows rejected by each filter, counted in
+                place.
+        '''
+        self.filters = filters
+        self.indexes = indexes
+
+        namespace = {
+            '_c_ConversionError': ConversionError,
+            '_c_on_error': on_error,
+            '_c_dropped': dropped,
+            'datetime': datetime,
+        }
+        body = []
+
+        for i, (rule, index) in enumerate(zip(filters, indexes)):
+            rule_name = '_c_f{}'.format(i)
+            namespace[rule_name] = rule
+            input_type = rule.input_type.value
+            body.extend(['    # {}'.format(repr(rule.target)), '    try:'])
+
+            # fetch, only the filter's own columns
+            if type(index) is list:
+                names = []
+                for j, position in enumerate(index):
+                    name = '_c_s{}_{}'.format(i, j)
+                    body.append(
+                        '        {} = _c_row[{}]'.format(name, position)
+                    )
+                    _emit_cast(body, name, input_type, rule_name, 8)
+                    names.append(name)
+                body.append('        s = [{}]'.format(', '.join(names)))
+            else:
+                body.append('        s = _c_row[{}]'.format(index))
+                _emit_cast(body, 's', input_type, rule_name, 8)
+
+            # predicate
+            if rule.operations and _can_inline(rule):
+                for operation in rule.operations:
+                    body.append('        s = (\n{}\n        )'.format(
+                        operation
+                    ))
+            elif rule.operations:
+                body.append('        s = {}._perform_operations(s)'.format(
+                    rule_name
+                ))
+
+            body.extend([
+                '    except _c_ConversionError as _c_e:',
+                '        _c_on_error({}, _c_row, _c_e, 0)'.format(rule_name),
+                '        s = False',
+                '    if not s:',
+                '        _c_dropped[{}] += 1'.format(i),
+                '        return False',
+            ])
+
+        source = FILTER_FUNCTION_TEMPLATE.format('\n'.join(body) or '    pass')
+        exec(compile(source, '<filters>', 'exec'), namespace)
+
+        self.source = source
+        self.keep = namespace['_c_keep']
@@ -0,0 +1,125 @@
+import csv
+from operator import itemgetter
+
+# Columns are only projected when the rules read at most this fraction of
+# them, above it csv.reader's C loop is faster than skipping fields
+PROJECTION_MAX_FRACTION = 0.5
+
+
+class _LineFeed:
+    '''Hands csv.reader one line at a time, then the lines after it'''
+    __slots__ = ('lines', 'pending')
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.pending = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.pending
+        if line is None:
+            # the rest of a quoted field that spans lines
+            return next(self.lines)
+        self.pending = None
+        return line
+
+
+def project(header, indexes):
+    '''Works out which columns of a csv the rules need.
+
+    Args:
+        header (list): The column names of the csv file.
+        indexes (list): The source positions of each rule.
+
+    Returns:
+        tuple: The positions to read (None when every column should be
+        read), the header of the projected rows, and the indexes of each
+        rule in the projected rows.
+    '''
+    positions = set()
+    for index in indexes:
+        if type(index) is int:
+            positions.add(index)
+        elif type(index) is list:
+            positions.update(index)
+
+    if not positions or \
+            len(positions) > len(header) * PROJECTION_MAX_FRACTION:
+        return None, header, indexes
+
+    positions = sorted(positions)
+    projected = {position: i for i, position in enumerate(positions)}
+
+    projected_indexes = []
+    for index in indexes:
+        if type(index) is int:
+            index = projected[index]
+        elif type(index) is list:
+            index = [projected[position] for position in index]
+        projected_indexes.append(index)
+
+    return positions, [header[p] for p in positions], projected_indexes
+
+
+class ProjectedReader:
+    '''
+    Reads only some of the columns of a csv, in place of a csv.reader
+
+    Lines without quotes are split with str.split, stopping after the last
+    column needed, so the columns after it are never split out. Lines with
+    quotes are read with csv.reader. Rows that are too short are padded
+    with None, and blank lines come out as empty rows like csv.reader.
+
+    ...
+
+    Attributes
+    ----------
+    positions : list
+        the positions of the columns to read, in order
+    line_num : int
+        the number of lines read, including `line_num` passed in
+    '''
+
+    def __init__(self, file, positions, line_num=0):
+        self.positions = positions
+        self.line_num = line_num
+        self._lines = iter(file)
+
+    def __iter__(self):
+        positions = self.positions
+        last = positions[-1]
+        if len(positions) == 1:
+            def getter(fields):
+                return (fields[last],)
+        else:
+            getter = itemgetter(*positions)
+        padding = [None] * (last + 1)
+
+        lines = self._lines
+        feed = _LineFeed(lines)
+        reader = csv.reader(feed)
+        line_num = self.line_num
+
+        for line in lines:
+            if '"' in line:
+                consumed = reader.line_num
+                feed.pending = line
+                fields = next(reader)
+                line_num += reader.line_num - consumed
+
+            else:
+                line_num += 1
+                line = line.rstrip('\r\n')
+                if not line:
+                    self.line_num = line_num
+                    yield []
+                    continue
+                fields = line.split(',', last + 1)
+
+            if len(fields) <= last:
+                fields = fields + padding[len(fields):]
+
+            self.line_num = line_num
+            yield getter(fields)
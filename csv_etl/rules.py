@@ -1,7 +1,9 @@
+import os
 from datetime import datetime
 from enum import Enum
 
-import yaml
+from .cache import OperationCache
+from .config_cache import read_cached_rules, write_cached_rules
 
 
 CONVERSION_ERROR_TEMPLATE = '''
@@ -11,6 +13,46 @@ Unable to convert:
     to: {}
 '''
 
+INVALID_OPERATION_TEMPLATE = '''
+Invalid operation:
+    target: {}
+    operation: {}
+    error: {}
+'''
+
+# Marks a cache miss, None is a valid result
+NOT_CACHED = object()
+
+# Fused operations are generated as a single function so a chain of
+# operations costs one call per row instead of one eval per operation
+OPERATIONS_FUNCTION_TEMPLATE = '''
+def _operations(s):
+{}
+    return s
+'''
+
+
+class _NotFound:
+    '''Marks a key with no match in a LookupTable'''
+    def __reduce__(self):
+        # Unpickles as the module level NOT_FOUND, so `is` checks still work
+        return 'NOT_FOUND'
+
+    def __repr__(self):
+        return 'NOT_FOUND'
+
+
+NOT_FOUND = _NotFound()
+
+
+def _code_names(code):
+    '''Collects every global/attribute name used by a code object'''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_names'):
+            names |= _code_names(const)
+    return names
+
 
 class InputType(Enum):
     '''Enum for Rule.input_type'''
@@ -31,6 +73,8 @@ class RuleType(Enum):
     '''Enum for Rule.type'''
     Static = 'Static'
     Calculation = 'Calculation'
+    Filter = 'Filter'
+    Lookup = 'Lookup'
 
 
 class SourceNotFound(Exception):
@@ -38,25 +82,45 @@ class SourceNotFound(Exception):
     pass
 
 
+class InvalidOperation(ValueError):
+    '''Custom Exception for operations that fail to compile'''
+    def __init__(self, target, operation, message):
+        self.target = target
+        self.operation = operation
+        self.message = message
+
+        self.custom_message = INVALID_OPERATION_TEMPLATE.format(
+            target, operation, message
+        )
+
+        super().__init__(self.custom_message)
+
+
 class ConversionError(ValueError):
     '''Custom Exception for errors with type casting int/float'''
     def __init__(self, rule, value, during, message):
         self.rule = rule
         self.value = value
+        self.during = during
         self.message = message
 
-        value_type = type(value)
+        super().__init__(self.message)
 
-        to_type = rule.input_type.value
-        if during == 'output':
-            to_type = rule.output_type.value
+    @property
+    def custom_message(self):
+        '''str: The formatted details, only built when they're needed'''
+        to_type = self.rule.input_type.value
+        if self.during == 'output':
+            to_type = self.rule.output_type.value
+        if self.during == 'lookup':
+            to_type = '{} in {}'.format(
+                self.rule.lookup.value, self.rule.lookup.path
+            )
 
-        self.custom_message = CONVERSION_ERROR_TEMPLATE.format(
-            self.value, value_type, to_type
+        return CONVERSION_ERROR_TEMPLATE.format(
+            self.value, type(self.value), to_type
         )
 
-        super().__init__(self.message)
-
 
 class Rule:
     '''
@@ -71,18 +135,31 @@ class Rule:
     target : str
         the key to use for the resulting data set
     type : RuleType
-        the rule type
+        the rule type, `Filter` rules don't output a value, rows are only
+        converted when their operations return something truthy. `Lookup`
+        rules output the value their operations' result maps to in a
+        reference csv
     input_type: InputType
         the data type the rule should read the value from the source as
     output_type : OutputType
         the python data type you want the value to conform to
     operations : list
-        the operations you want performed on the variable
+        the operations you want performed on the variable, compiled into
+        a single function whenever they are assigned
+    cache_size : int
+        optional - the number of results to memoize, keyed on the raw
+        csv value(s) the rule reads. Only for `Calculation` rules whose
+        operations are pure, None or 0 turns it off
+    cache : OperationCache
+        the memoized results and their hit/miss/eviction counters, None
+        when cache_size is off
+    lookup : LookupTable
+        the reference csv of a `Lookup` rule, None for other rules
     '''
     def __init__(
         self, source=None, target=None, type=RuleType.Static,
         input_type=InputType.String, output_type=OutputType.String,
-        operations=[]
+        operations=[], cache_size=None, lookup=None
     ):
         self.source = source
         self.target = target
@@ -90,6 +167,103 @@ class Rule:
         self.input_type = input_type
         self.output_type = output_type
         self.operations = operations
+        self.lookup = lookup
+        self.cache_size = cache_size
+
+    @property
+    def cache_size(self):
+        return self._cache_size
+
+    @cache_size.setter
+    def cache_size(self, cache_size):
+        self._cache_size = cache_size
+        # Static rules already have a fixed value, there is nothing to save.
+        # Lookup rules are left to their LookupTable's index and cache, so
+        # it counts every lookup
+        if cache_size and self.type == RuleType.Calculation:
+            self.cache = OperationCache(cache_size)
+        else:
+            self.cache = None
+
+    @property
+    def output_type(self):
+        return self._output_type
+
+    @output_type.setter
+    def output_type(self, output_type):
+        self._output_type = output_type
+        # datetime is only made available to Date rules
+        if hasattr(self, '_operations'):
+            self._compile_operations()
+
+    @property
+    def operations(self):
+        return self._operations
+
+    @operations.setter
+    def operations(self, operations):
+        self._operations = operations
+        self._compile_operations()
+
+    def _compile_operations(self, code=None):
+        '''
+        Compiles self.operations into a single function taking `s`
+
+        Args:
+            code (code object): Optional - The code compiled before for the
+                same operations, see from_cache_entry.
+
+        Raises:
+            InvalidOperation
+        '''
+        if code is not None:
+            self._load_operations(code)
+            return
+
+        lines = []
+        for operation in self._operations:
+            # Validate each operation on its own so errors point at it
+            try:
+                compile(operation, '<operation>', 'eval')
+            except SyntaxError as e:
+                raise InvalidOperation(self.target, operation, e.msg)
+
+            lines.append('    s = (\n{}\n)'.format(operation))
+
+        if not lines:
+            self._operations_code = None
+            self._operations_function = None
+            return
+
+        source = OPERATIONS_FUNCTION_TEMPLATE.format('\n'.join(lines))
+        code = compile(source, '<rule {}>'.format(self.target), 'exec')
+        self._load_operations(code)
+
+    def _load_operations(self, code):
+        '''Executes the compiled operations to define their function'''
+        params = {}
+
+        # make datetime available
+        if self._output_type == OutputType.Date:
+            params['datetime'] = datetime
+
+        exec(code, params)
+        self._operations_code = code
+        self._operations_function = params['_operations']
+
+    def __getstate__(self):
+        # The compiled operations can't be pickled, they are rebuilt instead
+        # and each copy of the rule starts with an empty cache
+        state = self.__dict__.copy()
+        del state['_operations_code']
+        del state['_operations_function']
+        del state['cache']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile_operations()
+        self.cache_size = self._cache_size
 
     def _cast_type(self, value, type_value):
         '''
@@ -119,20 +293,38 @@ class Rule:
 
     def _perform_operations(self, value):
         '''
-        Runs self.operations through eval statments with the extracted value(s)
+        Runs the compiled self.operations with the extracted value(s)
         '''
-        params = {}
+        if self._operations_function is None:
+            return value
 
-        # make datetime available
-        if self.output_type == OutputType.Date:
-            params['datetime'] = datetime
+        # Each operation reassigns `s` inside the fused function
+        # This is what allows multiple operations to be performed
+        return self._operations_function(value)
+
+    def _lookup(self, value):
+        '''
+        Maps a value through self.lookup
 
-        for operation in self.operations:
-            # Reassign the value being fed into the operations everytime
-            # This is what allows multiple operations to be performed
-            params['s'] = value
-            value = eval(operation, params)
+        Raises:
+            ConversionError: If there is no match and no default.
+        '''
+        result = self.lookup.get(value)
+        if result is NOT_FOUND:
+            raise ConversionError(
+                self, value, 'lookup',
+                'No match in {}'.format(self.lookup.path)
+            )
+        return result
 
+    def _cached(self, key, execute, *args):
+        '''
+        Returns the memoized result for key, or stores execute(*args)
+        '''
+        value = self.cache.get(key, NOT_CACHED)
+        if value is NOT_CACHED:
+            value = execute(*args)
+            self.cache.put(key, value)
         return value
 
     def _fetch_value(self, key, data):
@@ -146,6 +338,117 @@ class Rule:
         else:
             raise SourceNotFound
 
+    def is_constant(self):
+        '''Whether the rule's result is the same for every row.
+
+        True for Static rules, and for String Calculation rules whose first
+        operation doesn't use `s`. Rules that cast their input to a number
+        aren't, since the cast can still fail on some rows.
+        '''
+        if self.type == RuleType.Static:
+            return True
+
+        if self.input_type != InputType.String or not self.operations:
+            return False
+
+        code = compile(self.operations[0], '<operation>', 'eval')
+        return 's' not in _code_names(code)
+
+    def constant_value(self):
+        '''Executes a rule where is_constant() is True, without a row
+
+        Returns:
+            The value the rule produces for every row.
+
+        Raises:
+            ConversionError
+        '''
+        value = self.source if self.type == RuleType.Static else None
+        value = self._perform_operations(value)
+        if self.type == RuleType.Lookup:
+            value = self._lookup(value)
+        return self._cast_type(value, self.output_type.value)
+
+    def resolve_source(self, header):
+        '''Finds the position(s) of self.source in a csv header
+
+        Args:
+            header (list): The column names of the csv file.
+
+        Returns:
+            The index of the source column, a list of indexes if self.source
+            is a list, or None for static rules.
+
+        Raises:
+            SourceNotFound
+        '''
+        if self.type == RuleType.Static:
+            return None
+
+        # Later duplicate columns win, the same as csv.DictReader
+        positions = {name: i for i, name in enumerate(header)}
+
+        sources = self.source if type(self.source) is list else [self.source]
+        missing = [key for key in sources if key not in positions]
+        if missing:
+            raise SourceNotFound(
+                'Source column(s) not found: {}'.format(missing)
+            )
+
+        if type(self.source) is list:
+            return [positions[key] for key in self.source]
+
+        return positions[self.source]
+
+    def execute_row(self, row, index):
+        '''Executes the rule on a positional csv row
+
+        Args:
+            row (list): The values of a csv row.
+            index (int/list): The position(s) from Rule.resolve_source.
+
+        Returns:
+            Tuple: A tuple with the first element being Rule.target,
+            and with the second element being the type set by Rule.output_type
+
+        Raises:
+            ConversionError
+        '''
+        if self.cache is None:
+            return self.target, self._execute_row(row, index)
+
+        if type(index) is list:
+            key = tuple([row[i] for i in index])
+        else:
+            key = row[index]
+
+        return self.target, self._cached(key, self._execute_row, row, index)
+
+    def _execute_row(self, row, index):
+        '''
+        Fetches, casts, and operates on the value(s) of a positional row
+        '''
+        input_type = self.input_type.value
+
+        if self.type == RuleType.Static:
+            value = self.source
+
+        elif type(index) is list:
+            value = [self._cast_type(row[i], input_type) for i in index]
+
+        else:
+            value = self._cast_type(row[index], input_type)
+
+        value = self._perform_operations(value)
+
+        if self.type == RuleType.Filter:
+            return bool(value)
+
+        if self.type == RuleType.Lookup:
+            value = self._lookup(value)
+
+        return self._cast_type(value, self.output_type.value)
+
     def execute(self, data):
         '''Executes the rule on a given set of data
 
@@ -161,17 +464,35 @@ class Rule:
 
             ConversionError
         '''
+        if self.cache is not None:
+            sources = self.source if type(self.source) is list else None
+            try:
+                if sources is None:
+                    key = data[self.source]
+                else:
+                    key = tuple([data[k] for k in sources])
+            except KeyError:
+                # raises SourceNotFound
+                return self.target, self._execute(data)
+
+            return self.target, self._cached(key, self._execute, data)
+
+        return self.target, self._execute(data)
 
+    def _execute(self, data):
+        '''
+        Fetches, casts, and operates on the value(s) of a dict row
+        '''
         # value is going to just be self.source
         if self.type == RuleType.Static:
             value = self.source
 
         # fetch the value from self.source
-        if self.type == RuleType.Calculation and type(self.source) is str:
+        if self.type != RuleType.Static and type(self.source) is str:
             value = self._fetch_value(self.source, data)
 
         # fetch all of the values and store them in a list
-        if self.type == RuleType.Calculation and type(self.source) is list:
+        if self.type != RuleType.Static and type(self.source) is list:
 
             value = list(
                 map(lambda k: self._fetch_value(k, data), self.source)
@@ -179,7 +500,13 @@ class Rule:
 
         value = self._perform_operations(value)
 
-        return self.target, self._cast_type(value, self.output_type.value)
+        if self.type == RuleType.Filter:
+            return bool(value)
+
+        if self.type == RuleType.Lookup:
+            value = self._lookup(value)
+
+        return self._cast_type(value, self.output_type.value)
 
     def as_dict(self):
         '''
@@ -194,31 +521,129 @@ class Rule:
             'source': self.source,
             'operations': self.operations
         }
+        if self.cache_size:
+            result['cache_size'] = self.cache_size
+        if self.lookup is not None:
+            result['lookup'] = self.lookup.as_dict()
         return result
 
+    def cache_entry(self):
+        '''
+        Returns:
+            dict: as_dict() with the compiled operations, for saving in the
+            rule cache with marshal
+        '''
+        entry = self.as_dict()
+        entry['operations'] = list(self.operations)
+        entry['cache_size'] = self.cache_size
+        entry['code'] = self._operations_code
+        return entry
+
+    @classmethod
+    def from_cache_entry(cls, entry):
+        '''Creates a rule from cache_entry(), without compiling its
+        operations again
 
-def load_rules_from_yaml(file_name):
+        Returns:
+            Rule: The rule.
+        '''
+        rule = cls.__new__(cls)
+        rule.source = entry['source']
+        rule.target = entry['target']
+        rule.type = RuleType(entry['type'])
+        rule.input_type = InputType(entry['input_type'])
+        rule._output_type = OutputType(entry['output_type'])
+        rule._operations = entry['operations']
+        rule._compile_operations(entry['code'])
+        rule.lookup = _load_lookup(entry.get('lookup'))
+        rule.cache_size = entry.get('cache_size')
+        return rule
+
+
+def _yaml_loader(yaml):
+    '''The loader for yaml.full_load, using libyaml when it is available'''
+    if getattr(yaml, '__with_libyaml__', False):
+        return yaml.CFullLoader
+    return yaml.FullLoader
+
+
+def load_rules_from_yaml(file_name, cache_dir=None):
     '''Generates a list of rules given a yaml configuration.
 
     Args:
         file_name (str): The file path of the file to use.
+        cache_dir (str): Optional - A directory to cache the parsed and
+            compiled rules in. The cache is used while the file's path,
+            mtime, and contents are unchanged.
+
+    A `cache_size` at the top level of the configuration applies to every
+    rule that doesn't set its own, a rule can turn it off with
+    `cache_size: 0`. `Filter` rules don't need an `output_type`. `Lookup`
+    rules have a `lookup` section, see LookupTable.from_dict, whose paths
+    are relative to the yaml file.
 
     Returns:
         list: A list of rules based on the given configuration.
+
+    Raises:
+        InvalidOperation: If an operation is not a valid python expression.
+    '''
+    return load_config_from_yaml(file_name, cache_dir)[0]
+
+
+def load_config_from_yaml(file_name, cache_dir=None):
+    '''Loads the rules and the aggregation of a yaml configuration.
+
+    See load_rules_from_yaml for the rules, the `aggregate` section is
+    loaded with Aggregation.from_dict.
+
+    Returns:
+        tuple: The rules, and the Aggregation (None without an `aggregate`
+        section).
+
+    Raises:
+        InvalidOperation: If an operation is not a valid python expression.
+
+        ValueError: If the aggregate section uses an unknown function.
     '''
 
-    file = open(file_name)
-    definition = yaml.full_load(file)
-    file.close()
+    with open(file_name, 'rb') as file:
+        data = file.read()
+        mtime = os.fstat(file.fileno()).st_mtime_ns
+
+    if cache_dir is not None:
+        cached = read_cached_rules(cache_dir, file_name, mtime, data)
+        if cached is not None:
+            entries, aggregate = cached
+            return (
+                [Rule.from_cache_entry(entry) for entry in entries],
+                _load_aggregation(aggregate)
+            )
+
+    # yaml is only imported when there's a file to parse, it's slow to
+    # import compared to converting a small file
+    import yaml
+    definition = yaml.load(data, Loader=_yaml_loader(yaml))
+
+    default_cache_size = definition.get('cache_size')
+    base_dir = os.path.dirname(os.path.abspath(file_name))
 
     rules = []
     for rule in definition['rules']:
         target = rule['target']
         rule_type = RuleType(rule['type'])
         input_type = InputType(rule['input_type'])
-        output_type = OutputType(rule['output_type'])
+        if rule_type == RuleType.Filter:
+            # filters keep or drop rows, they have no value to output
+            output_type = OutputType(rule.get('output_type', 'String'))
+        else:
+            output_type = OutputType(rule['output_type'])
         source = rule['source']
         operations = rule['operations'] if 'operations' in rule else []
+        cache_size = rule.get('cache_size', default_cache_size)
+        lookup = None
+        if rule_type == RuleType.Lookup:
+            lookup = _load_lookup(rule['lookup'], base_dir)
 
         rule = Rule(
             source=source,
@@ -226,8 +651,40 @@ def load_rules_from_yaml(file_name):
             type=rule_type,
             input_type=input_type,
             output_type=output_type,
-            operations=operations
+            operations=operations,
+            cache_size=cache_size,
+            lookup=lookup
         )
         rules.append(rule)
 
-    return rules
+    aggregate = definition.get('aggregate')
+    aggregation = _load_aggregation(aggregate)
+
+    if cache_dir is not None:
+        write_cached_rules(
+            cache_dir, file_name, mtime, data,
+            [rule.cache_entry() for rule in rules],
+            aggregate
+        )
+
+    return rules, aggregation
+
+
+def _load_aggregation(aggregate):
+    '''The Aggregation of an `aggregate` section, None without one'''
+    if aggregate is None:
+        return None
+
+    # imported here, the aggregate module imports this one
+    from .aggregate import Aggregation
+    return Aggregation.from_dict(aggregate)
+
+
+def _load_lookup(definition, base_dir=None):
+    '''The LookupTable of a `lookup` section, None without one'''
+    if definition is None:
+        return None
+
+    # imported here, the lookup module imports this one
+    from .lookup import LookupTable
+    return LookupTable.from_dict(definition, base_dir)
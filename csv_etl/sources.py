@@ -0,0 +1,276 @@
+import io
+import os
+import mmap
+import locale
+from contextlib import contextmanager, ExitStack
+
+from .compression import ThreadedReader, detect_compression, open_compressed
+
+
+class BufferReader(io.RawIOBase):
+    '''
+    A read only binary stream over part of a buffer, without copying it
+
+    ...
+
+    Attributes
+    ----------
+    buffer : bytes-like
+        any object supporting the buffer protocol, e.g. bytes, memoryview,
+        or mmap
+    start : int
+        the offset of the first byte to read
+    end : int
+        the offset to stop reading at, None for the end of the buffer
+    '''
+
+    def __init__(self, buffer, start=0, end=None):
+        super().__init__()
+        self._buffer_view = memoryview(buffer).cast('B')
+        self._view = self._buffer_view[start:end]
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, b):
+        data = self._view[self._position:self._position + len(b)]
+        size = len(data)
+        b[:size] = data
+        self._position += size
+        return size
+
+    def close(self):
+        # views have to be released before an mmap can be closed
+        if not self.closed:
+            self._view.release()
+            self._buffer_view.release()
+        super().close()
+
+
+def text_reader(buffer, start=0, end=None):
+    '''Decodes part of a buffer the same way `open(csv_file, newline='')`
+    would, reading it straight from the buffer.
+
+    Args:
+        buffer (bytes-like): The csv data.
+        start (int): Optional - The offset to start reading from.
+        end (int): Optional - The offset to stop reading at.
+
+    Returns:
+        io.TextIOWrapper: The text file.
+    '''
+    raw = io.BufferedReader(BufferReader(buffer, start, end))
+    return io.TextIOWrapper(raw, newline='')
+
+
+def map_buffer(data):
+    '''Gets the buffer handed to worker processes by CSVSource.portable.
+
+    Files are memory-mapped, and the mapping stays open for the life of
+    the process.
+
+    Args:
+        data (str/bytes): A file path, or the csv data.
+
+    Returns:
+        bytes-like: The csv data.
+    '''
+    if not isinstance(data, str):
+        return data
+
+    with open(data, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CSVSource:
+    '''
+    The input of a conversion, a file path, a bytes-like buffer, or a file
+    object
+
+    Compressed input (gzip, bz2, xz, and zstd with zstandard installed) is
+    found by its magic bytes or file extension, and decompressed while it
+    is read. File objects passed in are never closed, everything opened
+    here is closed when the `with` block using it ends, exceptions
+    included.
+
+    ...
+
+    Attributes
+    ----------
+    source : str || os.PathLike || bytes-like || file object
+        the csv data or where to read it from
+    threaded : bool
+        whether to decompress in a background thread, ahead of the rows
+        being converted
+    '''
+
+    def __init__(self, source, threaded=True):
+        if isinstance(source, CSVSource):
+            threaded = source.threaded
+            source = source.source
+
+        if not isinstance(
+            source, (str, os.PathLike, bytes, bytearray, memoryview)
+        ) and not hasattr(source, 'read'):
+            raise TypeError(
+                'Expected a file path, bytes, or a file object, got {}'
+                .format(type(source).__name__)
+            )
+
+        self.source = source
+        self.threaded = threaded
+        self._data = None
+
+    @property
+    def path(self):
+        '''str: The file path of the source, None if it isn't a file'''
+        if isinstance(self.source, (str, os.PathLike)):
+            return os.fspath(self.source)
+        return None
+
+    def size(self):
+        '''
+        Returns:
+            int: The number of bytes of csv, None for file objects and
+            compressed files, whose size isn't known until they are read.
+        '''
+        if self._is_buffer():
+            return memoryview(self.source).nbytes
+
+        if self.path is None:
+            return None
+
+        with open(self.path, 'rb') as file:
+            if detect_compression(file, self.path) is not None:
+                return None
+            return os.fstat(file.fileno()).st_size
+
+    def _is_buffer(self):
+        return isinstance(self.source, (bytes, bytearray, memoryview))
+
+    def _is_text(self):
+        return isinstance(self.source, io.TextIOBase) or \
+            isinstance(self.source.read(0), str)
+
+    def _open_binary(self, stack):
+        '''Opens the source as a binary file, closed by `stack`.
+
+        Returns:
+            file object: The file, None for text file objects.
+        '''
+        if self.path is not None:
+            return stack.enter_context(open(self.path, 'rb'))
+
+        if self._is_buffer():
+            return stack.enter_context(
+                io.BufferedReader(BufferReader(self.source))
+            )
+
+        if self._is_text():
+            return None
+
+        # the caller's file, left open
+        return self.source
+
+    @contextmanager
+    def open(self):
+        '''Opens the source as a text file, for reading row by row
+
+        Yields:
+            file object: The csv text, with newline=''.
+        '''
+        with ExitStack() as stack:
+            file = self._open_binary(stack)
+            if file is None:
+                yield self.source
+                return
+
+            compression = detect_compression(file, self.path)
+            if compression is not None:
+                file = stack.enter_context(open_compressed(file, compression))
+                if self.threaded:
+                    file = stack.enter_context(
+                        io.BufferedReader(ThreadedReader(file))
+                    )
+
+            text = io.TextIOWrapper(file, newline='')
+            try:
+                yield text
+            finally:
+                if file is self.source:
+                    # leaves the caller's file open
+                    text.detach()
+                else:
+                    text.close()
+
+    @contextmanager
+    def open_buffer(self):
+        '''Opens the whole source as a seekable binary file, for splitting
+        it into row ranges.
+
+        Files are memory-mapped and buffers are read in place. File objects
+        and compressed input are read into memory, decompressed.
+
+        Yields:
+            file object: The csv bytes.
+        '''
+        with ExitStack() as stack:
+            file = self._open_binary(stack)
+
+            if file is None:
+                data = self.source.read()
+                self._data = data.encode(locale.getpreferredencoding(False))
+
+            else:
+                compression = detect_compression(file, self.path)
+                if compression is not None:
+                    with open_compressed(file, compression) as decompressed:
+                        self._data = decompressed.read()
+
+                elif self.path is None and not self._is_buffer():
+                    self._data = file.read()
+
+            if self._data is not None:
+                yield stack.enter_context(
+                    io.BufferedReader(BufferReader(self._data))
+                )
+
+            elif self.path is None or os.fstat(file.fileno()).st_size == 0:
+                yield file
+
+            else:
+                yield stack.enter_context(mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                ))
+
+    def portable(self):
+        '''
+        Returns:
+            str/bytes: What to send to worker processes for map_buffer, the
+            file path for uncompressed files, otherwise the csv data. Only
+            valid after open_buffer.
+        '''
+        if self._data is not None:
+            return self._data
+
+        if self.path is not None:
+            return self.path
+
+        return bytes(self.source)
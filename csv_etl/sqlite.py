@@ -0,0 +1,184 @@
+import os
+import sqlite3
+from datetime import datetime
+
+from .rules import OutputType
+from .writers import Writer, format_date, values_getter
+
+# Rows inserted per executemany call, by default
+DEFAULT_INSERT_BATCH_SIZE = 10000
+
+# The column type of each rule output type, dates are stored as
+# YYYY-MM-DD text, the same as the json output
+COLUMN_TYPES = {
+    OutputType.String: 'TEXT',
+    OutputType.Integer: 'INTEGER',
+    OutputType.Decimal: 'REAL',
+    OutputType.Date: 'TEXT',
+}
+
+# Settings for loading a database in bulk. The rollback journal is kept in
+# memory, so a failed conversion can still be rolled back, but nothing is
+# synced to disk until the load commits
+BULK_LOAD_PRAGMAS = (
+    'PRAGMA journal_mode = MEMORY',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',
+)
+
+
+def quote_name(name):
+    '''Quotes a table, column, or index name for SQLite'''
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def table_name(csv_file):
+    '''The default table for a csv, named after its file, e.g. `orders` for
+    `data/orders.csv.gz`, and `rows` for buffers and file objects'''
+    if not isinstance(csv_file, (str, os.PathLike)):
+        return 'rows'
+
+    name = os.path.basename(os.fspath(csv_file))
+    return name.split('.', 1)[0] or 'rows'
+
+
+def connect(path):
+    '''Opens a database for a bulk load.
+
+    Args:
+        path (str): The file path of the database, created if needed.
+
+    Returns:
+        sqlite3.Connection: The connection, with transactions started and
+        committed explicitly.
+    '''
+    connection = sqlite3.connect(path, isolation_level=None)
+    for pragma in BULK_LOAD_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+class SQLiteWriter(Writer):
+    '''
+    Loads converted rows into a SQLite table
+
+    The table is created from the fields, each column typed by its
+    OutputType, replacing any table of the same name. Rows are inserted
+    with executemany `batch_size` at a time, and the whole load is one
+    transaction, so the table only appears once every row is in. Indexes
+    are built after the rows are inserted, which is faster than keeping
+    them up to date row by row. Blank values in Integer, Decimal, and Date
+    columns (failed conversions) are stored as NULL, String columns keep
+    them as empty strings.
+
+    ...
+
+    Attributes
+    ----------
+    file : sqlite3.Connection
+        the database to load the rows into, from connect
+    field_names : list
+        the targets of the rules, in order, used as the column names
+    date_fields : list
+        the targets that hold datetimes, stored as YYYY-MM-DD
+    compact : bool
+        unused, there is no whitespace to leave out
+    table : str
+        the name of the table to create
+    field_types : dict
+        the OutputType of each field, TEXT for fields without one
+    indexes : list
+        the columns to index, a list of columns for a multi-column index
+    batch_size : int
+        the number of rows inserted per executemany call
+    '''
+
+    def __init__(
+        self, file, field_names, date_fields=(), compact=False,
+        table='rows', field_types=None, indexes=(),
+        batch_size=DEFAULT_INSERT_BATCH_SIZE
+    ):
+        super().__init__(file, field_names, date_fields, compact)
+        self.table = table
+        self.field_types = field_types or {}
+        self.indexes = list(indexes)
+        self.batch_size = batch_size
+        self._batch = []
+        self._values = values_getter(field_names)
+        self._dates = [
+            i for i, name in enumerate(field_names) if name in date_fields
+        ]
+        # '' is a failed cast in the typed columns, but a real value in
+        # the TEXT ones
+        self._nullable = [
+            i for i, name in enumerate(field_names)
+            if self.field_types.get(name) not in (None, OutputType.String)
+        ]
+
+        for index in self.indexes:
+            columns = index if type(index) is list else [index]
+            unknown = [name for name in columns if name not in field_names]
+            if unknown:
+                raise ValueError(
+                    'Unknown index column(s): {}'.format(unknown)
+                )
+
+    def _columns(self):
+        return ', '.join(
+            '{} {}'.format(
+                quote_name(name),
+                COLUMN_TYPES.get(self.field_types.get(name), 'TEXT')
+            )
+            for name in self.field_names
+        )
+
+    def write_header(self):
+        table = quote_name(self.table)
+        self.file.execute('BEGIN')
+        self.file.execute('DROP TABLE IF EXISTS {}'.format(table))
+        self.file.execute('CREATE TABLE {} ({})'.format(
+            table, self._columns()
+        ))
+        self._insert = 'INSERT INTO {} VALUES ({})'.format(
+            table, ', '.join('?' * len(self.field_names))
+        )
+
+    def write_row(self, row):
+        self.write_values(self._values(row))
+
+    def write_values(self, values):
+        values = list(values)
+        for i in self._nullable:
+            if values[i] == '':
+                values[i] = None
+        for i in self._dates:
+            if type(values[i]) is datetime:
+                values[i] = format_date(values[i])
+
+        self._batch.append(values)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        '''Inserts the batched rows'''
+        if self._batch:
+            self.file.executemany(self._insert, self._batch)
+            self._batch = []
+
+    def write_footer(self):
+        self._flush()
+        for index in self.indexes:
+            columns = index if type(index) is list else [index]
+            self.file.execute('CREATE INDEX {} ON {} ({})'.format(
+                quote_name('{}_{}'.format(self.table, '_'.join(columns))),
+                quote_name(self.table),
+                ', '.join(quote_name(name) for name in columns)
+            ))
+        self.file.execute('COMMIT')
+
+    def rollback(self):
+        '''Undoes the load, after a conversion fails'''
+        self._batch = []
+        if self.file.in_transaction:
+            self.file.execute('ROLLBACK')
@@ -0,0 +1,459 @@
+import random
+from time import perf_counter
+
+from .rules import RuleType, NOT_CACHED
+
+# Call times kept per rule for its percentiles, sampled evenly once full
+RULE_SAMPLE_SIZE = 10000
+
+# The steps of a rule that are timed
+PHASES = ('fetch', 'cast', 'operations', 'output_cast')
+
+# Rows read between checks of how many bytes have been read
+PROGRESS_CHECK_ROWS = 1000
+
+# Bytes read between progress callbacks, by default
+DEFAULT_PROGRESS_BYTES = 64 * 1024 * 1024
+
+
+def _percentile(ordered, fraction):
+    '''The value a fraction of the way through a sorted list'''
+    if not ordered:
+        return None
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class RuleStats:
+    '''
+    The time a rule took and the errors it raised, while profiling
+
+    ...
+
+    Attributes
+    ----------
+    target : str
+        the target of the rule
+    calls : int
+        the number of rows the rule was executed on
+    seconds : float
+        the total time of those calls
+    phases : dict
+        the seconds spent in each of PHASES, results from the rule's cache
+        aren't included. A Lookup rule's lookups count as operations
+    cache_hits : int
+        the calls answered by the rule's cache
+    errors : dict
+        the number of exceptions raised, by exception class name
+    samples : list
+        up to RULE_SAMPLE_SIZE call times, for percentiles
+    '''
+
+    def __init__(self, target):
+        self.target = target
+        self.calls = 0
+        self.seconds = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.cache_hits = 0
+        self.errors = {}
+        self.samples = []
+        self._random = random.Random(0)
+
+    def _record(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        if len(self.samples) < RULE_SAMPLE_SIZE:
+            self.samples.append(seconds)
+            return
+
+        # reservoir sampling keeps every call equally likely to be kept
+        position = self._random.randrange(self.calls)
+        if position < RULE_SAMPLE_SIZE:
+            self.samples[position] = seconds
+
+    def execute_row(self, rule, row, index):
+        '''Executes Rule.execute_row, timing each step.
+
+        Args:
+            rule (Rule): The rule.
+            row (list): The values of a csv row.
+            index (int/list): The position(s) from Rule.resolve_source.
+
+        Returns:
+            The rule's value for the row.
+
+        Raises:
+            ConversionError
+        '''
+        start = perf_counter()
+        key = None
+        if rule.cache is not None:
+            if type(index) is list:
+                key = tuple([row[i] for i in index])
+            else:
+                key = row[index]
+
+            value = rule.cache.get(key, NOT_CACHED)
+            if value is not NOT_CACHED:
+                self.cache_hits += 1
+                self._record(perf_counter() - start)
+                return value
+
+        phases = self.phases
+        input_type = rule.input_type.value
+        try:
+            if rule.type == RuleType.Static:
+                value = rule.source
+                fetched = cast = perf_counter()
+            elif type(index) is list:
+                value = [row[i] for i in index]
+                fetched = perf_counter()
+                value = [rule._cast_type(v, input_type) for v in value]
+                cast = perf_counter()
+            else:
+                value = row[index]
+                fetched = perf_counter()
+                value = rule._cast_type(value, input_type)
+                cast = perf_counter()
+            phases['fetch'] += fetched - start
+            phases['cast'] += cast - fetched
+
+            value = rule._perform_operations(value)
+            if rule.type == RuleType.Lookup:
+                value = rule._lookup(value)
+            operated = perf_counter()
+            phases['operations'] += operated - cast
+
+            if rule.type == RuleType.Filter:
+                value = bool(value)
+            else:
+                value = rule._cast_type(value, rule.output_type.value)
+            end = perf_counter()
+            phases['output_cast'] += end - operated
+
+        except Exception as e:
+            name = type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self._record(perf_counter() - start)
+            raise
+
+        if rule.cache is not None:
+            rule.cache.put(key, value)
+
+        self._record(end - start)
+        return value
+
+    def merge(self, other):
+        '''Adds the counts of another RuleStats for the same rule'''
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.cache_hits += other.cache_hits
+        for phase, seconds in other.phases.items():
+            self.phases[phase] += seconds
+        for name, count in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + count
+
+        samples = self.samples + other.samples
+        if len(samples) > RULE_SAMPLE_SIZE:
+            samples = self._random.sample(samples, RULE_SAMPLE_SIZE)
+        self.samples = samples
+
+    def percentiles(self):
+        '''
+        Returns:
+            dict: The p50, p95, and p99 call times, in seconds
+        '''
+        ordered = sorted(self.samples)
+        return {
+            'p50': _percentile(ordered, 0.5),
+            'p95': _percentile(ordered, 0.95),
+            'p99': _percentile(ordered, 0.99),
+        }
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the stats
+        '''
+        result = {
+            'target': self.target,
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'phases': dict(self.phases),
+            'cache_hits': self.cache_hits,
+            'errors': dict(self.errors),
+        }
+        result.update(self.percentiles())
+        return result
+
+
+class TimedReader:
+    '''
+    Wraps a csv reader, adding the time spent reading rows to a
+    ConversionStats and reporting progress as the file is read
+
+    ...
+
+    Attributes
+    ----------
+    reader : csv.reader || ProjectedReader
+        the reader of positional rows
+    stats : ConversionStats
+        the stats to add to
+    position : function
+        optional - returns the number of bytes of the file read so far
+    '''
+
+    def __init__(self, reader, stats, position=None):
+        self.reader = reader
+        self.stats = stats
+        self.position = position
+        # ProjectedReader is iterable, but not an iterator itself
+        self._rows = iter(reader)
+        self._count = 0
+
+    @property
+    def line_num(self):
+        return self.reader.line_num
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = perf_counter()
+        try:
+            return next(self._rows)
+        finally:
+            self.stats.read_seconds += perf_counter() - start
+
+            self._count += 1
+            if self.position and self._count % PROGRESS_CHECK_ROWS == 0:
+                self.stats.advance(self.position())
+
+
+class ConversionStats:
+    '''
+    Where the time of a conversion went, and optionally each rule's
+
+    Profiling rules executes them one at a time, rather than with the
+    compiled or vectorized plans, so conversions are slower with it on.
+    With workers > 1, reading and converting rows happens in the workers,
+    so their time is counted as transform_seconds, and the rule stats are
+    collected from each worker.
+
+    ...
+
+    Attributes
+    ----------
+    profile_rules : bool
+        whether to time each rule, see RuleStats
+    progress : function
+        optional - called with these stats every `progress_bytes` bytes of
+        csv read, and once the conversion finishes
+    progress_bytes : int
+        the number of bytes read between progress calls
+    rows : int
+        the number of rows converted
+    bytes_read : int
+        how much of the csv has been read
+    total_bytes : int
+        the size of the csv, None when it isn't known (compressed input
+        and file objects)
+    read_seconds : float
+        the time spent reading and parsing csv rows
+    write_seconds : float
+        the time spent writing converted rows
+    seconds : float
+        the time the whole conversion took
+    rules : dict
+        the RuleStats of each rule by target, when profile_rules is set
+    dropped : dict
+        the rows each filter dropped by target, see
+        CSVConverter.dropped_rows
+    lookups : dict
+        the index build time and hit rate of each Lookup rule by target,
+        see CSVConverter.lookup_stats
+    '''
+
+    def __init__(
+        self, profile_rules=False, progress=None,
+        progress_bytes=DEFAULT_PROGRESS_BYTES
+    ):
+        self.profile_rules = profile_rules
+        self.progress = progress
+        self.progress_bytes = progress_bytes
+        self._reset()
+
+    def __getstate__(self):
+        # Progress is reported by the process that started the conversion
+        state = self.__dict__.copy()
+        state['progress'] = None
+        return state
+
+    def _reset(self):
+        self.rows = 0
+        self.bytes_read = 0
+        self.total_bytes = None
+        self.read_seconds = 0.0
+        self.write_seconds = 0.0
+        self.seconds = 0.0
+        self.rules = {}
+        self.dropped = {}
+        self.lookups = {}
+        self._start = None
+        self._next_progress = self.progress_bytes
+
+    def start(self, total_bytes=None):
+        '''Resets the stats for a new conversion'''
+        self._reset()
+        self.total_bytes = total_bytes
+        self._start = perf_counter()
+
+    def finish(self, completed=True):
+        '''Records the conversion's time, and reports its final progress.
+
+        Args:
+            completed (bool): Whether the whole csv was read, rather than
+                the conversion failing or being stopped early.
+        '''
+        if self._start is None:
+            return
+        if completed and self.total_bytes is not None:
+            self.bytes_read = self.total_bytes
+        self.seconds = perf_counter() - self._start
+        self._start = None
+        if self.progress is not None:
+            self.progress(self)
+
+    @property
+    def elapsed(self):
+        '''float: The seconds since the conversion started, so far'''
+        if self._start is None:
+            return self.seconds
+        return perf_counter() - self._start
+
+    @property
+    def transform_seconds(self):
+        '''float: The time that wasn't spent reading or writing'''
+        return max(self.elapsed - self.read_seconds - self.write_seconds, 0.0)
+
+    @property
+    def rows_per_sec(self):
+        '''float: The rows converted per second, so far'''
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed else 0.0
+
+    def advance(self, bytes_read):
+        '''Records how much of the csv has been read, calling progress
+        each time another progress_bytes have been'''
+        if bytes_read is None:
+            return
+        self.bytes_read = bytes_read
+        if self.progress is not None and bytes_read >= self._next_progress:
+            self._next_progress = bytes_read + self.progress_bytes
+            self.progress(self)
+
+    def count(self, rows):
+        '''Counts the converted rows as they are yielded'''
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def rule(self, target):
+        '''
+        Returns:
+            RuleStats: The stats of a rule, created on first use.
+        '''
+        stats = self.rules.get(target)
+        if stats is None:
+            stats = self.rules[target] = RuleStats(target)
+        return stats
+
+    def drain_rules(self):
+        '''Returns and clears the rule stats, for sending from workers'''
+        rules = self.rules
+        self.rules = {}
+        return rules
+
+    def merge_rules(self, rules):
+        '''Adds the rule stats drained from a worker'''
+        for target, stats in rules.items():
+            self.rule(target).merge(stats)
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: A dictionary representation of the stats
+        '''
+        return {
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'seconds': self.elapsed,
+            'read_seconds': self.read_seconds,
+            'transform_seconds': self.transform_seconds,
+            'write_seconds': self.write_seconds,
+            'rows_per_sec': self.rows_per_sec,
+            'rules': [stats.as_dict() for stats in self.rules.values()],
+            'dropped': dict(self.dropped),
+            'lookups': dict(self.lookups),
+        }
+
+    def format(self):
+        '''
+        Returns:
+            str: The stats as a table, the slowest rules first.
+        '''
+        elapsed = self.elapsed or 1.0
+        lines = ['{:,} rows in {:.3f}s, {:,.0f} rows/sec'.format(
+            self.rows, self.elapsed, self.rows_per_sec
+        )]
+        for name, seconds in [
+            ('read', self.read_seconds),
+            ('transform', self.transform_seconds),
+            ('write', self.write_seconds),
+        ]:
+            lines.append('    {:<10} {:>9.3f}s {:>6.1%}'.format(
+                name, seconds, seconds / elapsed
+            ))
+        for target, dropped in self.dropped.items():
+            lines.append('    filter {} dropped {:,} row(s)'.format(
+                repr(target), dropped
+            ))
+        for target, lookup in self.lookups.items():
+            lines.append(
+                '    lookup {} {:,} lookup(s), {:.1%} hits, {} index of '
+                '{:,} row(s) built in {:.3f}s'.format(
+                    repr(target), lookup['lookups'], lookup['hit_rate'],
+                    lookup['backend'], lookup['rows'],
+                    lookup['build_seconds']
+                )
+            )
+
+        if not self.rules:
+            return '\n'.join(lines)
+
+        lines.append('{:<20} {:>9} {:>7} {:>9} {:>8} {:>8} {:>8}{}'.format(
+            'rule', 'calls', 'errors', 'total', 'p50', 'p95', 'p99',
+            ''.join(' {:>11}'.format(phase) for phase in PHASES)
+        ))
+        ordered = sorted(
+            self.rules.values(), key=lambda stats: stats.seconds,
+            reverse=True
+        )
+        for stats in ordered:
+            percentiles = stats.percentiles()
+            lines.append(
+                '{:<20} {:>9,} {:>7,} {:>8.3f}s {}{}'.format(
+                    str(stats.target)[:20], stats.calls,
+                    sum(stats.errors.values()), stats.seconds,
+                    ' '.join(
+                        '{:>6.1f}us'.format((percentiles[p] or 0) * 1e6)
+                        for p in ('p50', 'p95', 'p99')
+                    ),
+                    ''.join(
+                        ' {:>10.3f}s'.format(stats.phases[phase])
+                        for phase in PHASES
+                    )
+                )
+            )
+        return '\n'.join(lines)
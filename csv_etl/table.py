@@ -0,0 +1,189 @@
+import io
+
+from .writers import WRITERS, get_writer, open_output, values_getter
+
+
+class RowTable:
+    '''
+    Converted rows kept as tuples, with one list of field names for all
+    of them
+
+    A dict per row repeats every target and carries a hash table, which
+    is most of the memory of a large result. A RowTable holds the same
+    values in a tuple per row instead, and builds the dicts only when
+    they are asked for.
+
+    table[i] is the dict of row i, table[i:j] a RowTable of those rows,
+    table['Target'] the list of a column's values, and table[['A', 'B']]
+    a RowTable of just those columns. Iterating yields a dict per row.
+
+    ...
+
+    Attributes
+    ----------
+    field_names : list
+        the targets of the rules, in order, shared by every row
+    rows : list
+        a tuple of values per row, in the order of field_names
+    date_fields : list
+        the targets that hold datetimes, for writing the rows
+    '''
+
+    def __init__(self, field_names, rows=None, date_fields=()):
+        self.field_names = list(field_names)
+        self.rows = [] if rows is None else rows
+        self.date_fields = [
+            name for name in date_fields if name in self.field_names
+        ]
+        # a repeated target keeps its first position, like a dict
+        self._positions = {}
+        for i, name in enumerate(self.field_names):
+            self._positions.setdefault(name, i)
+
+    @classmethod
+    def from_rows(cls, rows, field_names, date_fields=()):
+        '''Builds a table from converted rows as they are yielded.
+
+        Args:
+            rows (iterable): The converted dicts, each freed once its
+                values are copied out.
+            field_names (list): The targets of the rules, in order.
+            date_fields (list): Optional - The targets that hold datetimes.
+
+        Returns:
+            RowTable: The table of the rows.
+        '''
+        values = values_getter(field_names)
+        return cls(field_names, [values(row) for row in rows], date_fields)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        names = self.field_names
+        for values in self.rows:
+            yield dict(zip(names, values))
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return self.column(item)
+        if isinstance(item, slice):
+            return RowTable(
+                self.field_names, self.rows[item], self.date_fields
+            )
+        if isinstance(item, (list, tuple)):
+            return self.select(item)
+        return dict(zip(self.field_names, self.rows[item]))
+
+    def __eq__(self, other):
+        if isinstance(other, RowTable):
+            return (
+                self.field_names == other.field_names
+                and self.rows == other.rows
+            )
+        if isinstance(other, list):
+            return self.to_dicts() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return '<RowTable {} row(s) x {} field(s)>'.format(
+            len(self.rows), len(self.field_names)
+        )
+
+    def _position(self, name):
+        '''The position of a field in each row'''
+        try:
+            return self._positions[name]
+        except KeyError:
+            raise KeyError('Unknown field: {}'.format(name)) from None
+
+    def column(self, name):
+        '''Returns every row's value of a field.
+
+        Args:
+            name (str): The target of the field.
+
+        Returns:
+            list: The values, in row order.
+
+        Raises:
+            KeyError: If there is no such field.
+        '''
+        position = self._position(name)
+        return [values[position] for values in self.rows]
+
+    def select(self, names):
+        '''Returns a table of just some fields.
+
+        Args:
+            names (list): The targets of the fields, in the order wanted.
+
+        Returns:
+            RowTable: A new table with those fields.
+
+        Raises:
+            KeyError: If a field doesn't exist.
+        '''
+        positions = [self._position(name) for name in names]
+        values = values_getter(positions)
+        return RowTable(
+            names, [values(row) for row in self.rows], self.date_fields
+        )
+
+    def to_dicts(self):
+        '''
+        Returns:
+            list: A dict per row, the same as `convert` without a format
+        '''
+        return list(self)
+
+    def write_to(self, writer):
+        '''Streams the rows through a writer, without making a dict for
+        writers that take the values directly.
+
+        Args:
+            writer (Writer): The writer, for this table's field_names.
+
+        Returns:
+            int: The number of rows written.
+        '''
+        writer.write_header()
+        write_values = writer.write_values
+        for values in self.rows:
+            write_values(values)
+        writer.write_footer()
+        return len(self.rows)
+
+    def write(self, to='json', outfile=None, compact=False):
+        '''Writes the rows in an output format, the same as `convert` with
+        that format would have.
+
+        Args:
+            to (str): The output format, `csv`, `json`, or `ndjson`.
+            outfile (str): Optional - The file path to write the rows to,
+                compressed if its extension is `.gz`, `.bz2`, `.xz`, or
+                `.zst`.
+            compact (bool): Optional - Leave the indentation and spaces out
+                of `json` and `ndjson` output.
+
+        Returns:
+            The rows as a string in that format, or if `outfile` is given,
+            the number of rows written.
+
+        Raises:
+            ValueError: If `to` is not a known output format.
+        '''
+        if to not in WRITERS:
+            raise ValueError('Unknown output format: {}'.format(to))
+
+        if outfile:
+            with open_output(outfile) as file:
+                return self.write_to(get_writer(
+                    to, file, self.field_names, self.date_fields, compact
+                ))
+
+        result = io.StringIO()
+        self.write_to(get_writer(
+            to, result, self.field_names, self.date_fields, compact
+        ))
+        return result.getvalue()
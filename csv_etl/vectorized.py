@@ -0,0 +1,391 @@
+import ast
+import operator
+from itertools import islice
+from operator import itemgetter
+
+from .rules import RuleType, InputType, OutputType
+from .plan import RowPlan, Precomputed
+
+# Imported by require_numpy, numpy takes longer to import than most
+# conversions of a small file
+numpy = None
+
+# Rows converted per batch when vectorize=True
+DEFAULT_BATCH_SIZE = 10000
+
+# Integers above this can't be held exactly by a float64
+MAX_EXACT = 2 ** 53
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+NUMERIC_TYPES = ('Integer', 'Decimal')
+
+
+def require_numpy():
+    '''Imports numpy, raises an ImportError if it is not installed'''
+    global numpy
+    if numpy is not None:
+        return
+
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        raise ImportError(
+            'vectorize=True requires numpy, install it with '
+            '`pip install csv-etl[numpy]`'
+        )
+
+
+def _constant_index(node):
+    '''Returns the int of an `s[i]` subscript, or None if it isn't one'''
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        sign = -1
+        node = node.operand
+
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return sign * node.value
+
+    return None
+
+
+def _supported(node, sources):
+    '''Whether an operation's expression can run on numpy columns.
+
+    Only `+ - * /` and unary `+ -` on numbers and `s` are allowed, where
+    `s` is a column for single sources and `s[i]` for list sources.
+
+    Args:
+        node (ast.AST): The expression node.
+        sources (int): The length of `s` for list sources, otherwise None.
+    '''
+    if isinstance(node, ast.BinOp):
+        return (
+            type(node.op) in BINARY_OPERATORS and
+            _supported(node.left, sources) and
+            _supported(node.right, sources)
+        )
+
+    if isinstance(node, ast.UnaryOp):
+        return (
+            type(node.op) in UNARY_OPERATORS and
+            _supported(node.operand, sources)
+        )
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return type(value) in (int, float) and abs(value) < MAX_EXACT
+
+    if isinstance(node, ast.Name):
+        return node.id == 's' and sources is None
+
+    if isinstance(node, ast.Subscript):
+        index = _constant_index(node.slice)
+        return (
+            sources is not None and
+            isinstance(node.value, ast.Name) and
+            node.value.id == 's' and
+            index is not None and
+            -sources <= index < sources
+        )
+
+    return False
+
+
+def parse_operations(rule, index):
+    '''Parses a rule's operations if the rule can be vectorized.
+
+    Args:
+        rule (Rule): The rule.
+        index (int/list): The rule's source position(s).
+
+    Returns:
+        list: The expression trees of the operations, or None if the rule
+        has to be executed row by row.
+    '''
+    if rule.type != RuleType.Calculation or type(index) not in (int, list):
+        return None
+
+    if rule.input_type.value not in NUMERIC_TYPES:
+        return None
+
+    if rule.output_type.value not in NUMERIC_TYPES:
+        return None
+
+    sources = len(index) if type(index) is list else None
+    if sources is not None and not rule.operations:
+        return None
+
+    trees = []
+    for operation in rule.operations:
+        tree = ast.parse(operation, mode='eval').body
+        if not _supported(tree, sources):
+            return None
+        trees.append(tree)
+        # after the first operation `s` is a single value
+        sources = None
+
+    return trees
+
+
+def _cast_column(values, type_value):
+    '''Does Rule._cast_type on a column of csv values.
+
+    Returns:
+        tuple: A float64 array of the values, and a boolean array of the
+        rows that failed to cast or can't be represented exactly.
+    '''
+    cast = int if type_value == 'Integer' else float
+    bad = numpy.zeros(len(values), dtype=bool)
+
+    # joining is a cheap way to find out if any value needs its commas
+    # stripped, it fails on padded None values
+    try:
+        stripped = values if ',' not in '\n'.join(values) else None
+    except TypeError:
+        stripped = None
+    if stripped is None:
+        stripped = [
+            v.replace(',', '') if type(v) is str else v for v in values
+        ]
+
+    try:
+        parsed = list(map(cast, stripped))
+    except (ValueError, TypeError):
+        parsed = []
+        for i, value in enumerate(stripped):
+            try:
+                parsed.append(cast(value))
+            except (ValueError, TypeError):
+                parsed.append(0)
+                bad[i] = True
+
+    try:
+        column = numpy.array(parsed, dtype=numpy.float64)
+    except OverflowError:
+        column = numpy.array(
+            [v if abs(v) < MAX_EXACT else MAX_EXACT for v in parsed],
+            dtype=numpy.float64
+        )
+
+    if cast is int:
+        bad |= numpy.abs(column) >= MAX_EXACT
+
+    return column, bad
+
+
+def _evaluate(node, s, is_int, bad):
+    '''Evaluates an operation on numpy columns.
+
+    Python ints are modelled as float64, which is exact while they stay
+    below MAX_EXACT. Rows where they don't are flagged in `bad`.
+
+    Returns:
+        tuple: The resulting column, and whether python would produce ints.
+    '''
+    if isinstance(node, ast.BinOp):
+        left, left_int = _evaluate(node.left, s, is_int, bad)
+        right, right_int = _evaluate(node.right, s, is_int, bad)
+        value = BINARY_OPERATORS[type(node.op)](left, right)
+        value_int = left_int and right_int and not isinstance(node.op, ast.Div)
+
+    elif isinstance(node, ast.UnaryOp):
+        operand, value_int = _evaluate(node.operand, s, is_int, bad)
+        value = UNARY_OPERATORS[type(node.op)](operand)
+
+    elif isinstance(node, ast.Constant):
+        return float(node.value), type(node.value) is int
+
+    elif isinstance(node, ast.Name):
+        return s, is_int
+
+    else:
+        return s[_constant_index(node.slice)], is_int
+
+    if value_int:
+        # python ints have no negative zero
+        value = value + 0.0
+        bad |= numpy.abs(value) >= MAX_EXACT
+
+    return value, value_int
+
+
+class VectorRule:
+    '''
+    A rule executed on whole columns of a batch with numpy
+
+    ...
+
+    Attributes
+    ----------
+    rule : Rule
+        the rule being executed
+    index : int || list
+        the source position(s) of the rule
+    trees : list
+        the parsed expressions of the rule's operations
+    '''
+
+    def __init__(self, rule, index, trees):
+        self.rule = rule
+        self.index = index
+        self.trees = trees
+
+    def _fetch(self, position, columns, casts, bad):
+        '''Casts a csv column, once per batch for every rule that uses it'''
+        key = (position, self.rule.input_type)
+        if key not in casts:
+            casts[key] = _cast_column(
+                columns[position], self.rule.input_type.value
+            )
+
+        column, failed = casts[key]
+        bad |= failed
+        return column
+
+    def execute(self, columns, casts, bad):
+        '''Executes the rule on a batch.
+
+        Args:
+            columns (dict): The raw csv values of the batch by position.
+            casts (dict): The columns already cast in this batch, by
+                position and input type.
+            bad (numpy.ndarray): Flags for rows that must be converted row
+                by row, updated in place.
+
+        Returns:
+            list: The converted values, only valid where `bad` is False.
+        '''
+        is_int = self.rule.input_type == InputType.Integer
+
+        if type(self.index) is list:
+            s = [
+                self._fetch(position, columns, casts, bad)
+                for position in self.index
+            ]
+        else:
+            s = self._fetch(self.index, columns, casts, bad)
+
+        with numpy.errstate(all='ignore'):
+            for tree in self.trees:
+                s, is_int = _evaluate(tree, s, is_int, bad)
+
+            s = numpy.broadcast_to(s, bad.shape)
+            # python raises, or keeps infinities and nan, row by row instead
+            bad |= ~numpy.isfinite(s)
+
+            if self.rule.output_type == OutputType.Integer:
+                bad |= numpy.abs(s) >= MAX_EXACT
+                s = numpy.trunc(numpy.where(bad, 0, s))
+                return s.astype(numpy.int64).tolist()
+
+        return s.tolist()
+
+
+class BatchPlan:
+    '''
+    A rule set executed on batches of rows, with numeric rules on numpy
+    columns and the rest through a RowPlan
+
+    Rows where a vectorized rule fails, or can't be computed exactly, are
+    converted with the full RowPlan instead, so the output and errors are
+    the same as converting row by row.
+
+    ...
+
+    Attributes
+    ----------
+    vector_rules : list
+        the rules executed on columns, as VectorRules
+    row_plan : RowPlan
+        the plan for every rule, reading the vectorized rules' values
+        from the batch columns
+    full_plan : RowPlan
+        the plan for every rule, used for rows that fail
+    positions : list
+        the csv columns read by the vectorized rules
+    '''
+
+    def __init__(self, rules, indexes, full_plan, on_error, missing):
+        require_numpy()
+        self.full_plan = full_plan
+        self.vector_rules = []
+
+        plan_indexes = []
+        for rule, index in zip(rules, indexes):
+            trees = None
+            if index is not missing:
+                trees = parse_operations(rule, index)
+
+            if trees is None:
+                plan_indexes.append(index)
+            else:
+                plan_indexes.append(Precomputed(len(self.vector_rules)))
+                self.vector_rules.append(VectorRule(rule, index, trees))
+
+        self.row_plan = RowPlan(rules, plan_indexes, on_error, missing)
+
+        positions = set()
+        for vector_rule in self.vector_rules:
+            index = vector_rule.index
+            positions.update(index if type(index) is list else [index])
+        self.positions = sorted(positions)
+
+    def _columns(self, rows):
+        '''Transposes the positions used by vectorized rules into columns'''
+        if len(self.positions) == 1:
+            position = self.positions[0]
+            return {position: [row[position] for row in rows]}
+
+        values = zip(*map(itemgetter(*self.positions), rows))
+        return dict(zip(self.positions, values))
+
+    def convert_batch(self, rows):
+        '''Converts a batch of positional csv rows.
+
+        Args:
+            rows (list): The padded csv rows.
+
+        Returns:
+            list: The converted rows, in order.
+        '''
+        row_plan = self.row_plan.convert_row
+
+        if not self.vector_rules:
+            return list(map(row_plan, rows))
+
+        columns = self._columns(rows)
+        casts = {}
+        bad = numpy.zeros(len(rows), dtype=bool)
+        results = [
+            rule.execute(columns, casts, bad) for rule in self.vector_rules
+        ]
+
+        if not bad.any():
+            return [row_plan(row, results, i) for i, row in enumerate(rows)]
+
+        full_plan = self.full_plan.convert_row
+        return [
+            full_plan(row, None, i) if failed else row_plan(row, results, i)
+            for i, (row, failed) in enumerate(zip(rows, bad.tolist()))
+        ]
+
+
+def iter_batches(rows, batch_size):
+    '''Groups rows into lists of up to batch_size rows'''
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
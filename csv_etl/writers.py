@@ -0,0 +1,371 @@
+import io
+import csv
+import json
+from datetime import datetime
+from math import inf as INFINITY
+from operator import itemgetter
+from json.encoder import c_make_encoder, encode_basestring_ascii
+
+from .compression import compression_from_path, open_compressed
+
+# Buffer size used when streaming rows to an outfile
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# json separators without the spaces, for compact output
+COMPACT_SEPARATORS = (',', ':')
+
+# json.dumps' own separators when there's no indent
+DEFAULT_SEPARATORS = (', ', ': ')
+
+
+def format_date(value):
+    '''Formats a datetime the same way as CustomEncoder'''
+    # isoformat is much faster, but strftime doesn't zero pad years < 1000
+    if value.year >= 1000:
+        return value.date().isoformat()
+    return value.strftime('%Y-%m-%d')
+
+
+def values_getter(field_names):
+    '''Makes a function that returns a row's values as a tuple, in the
+    order of field_names'''
+    if len(field_names) == 1:
+        name = field_names[0]
+        return lambda row: (row[name],)
+    if not field_names:
+        return lambda row: ()
+    return itemgetter(*field_names)
+
+
+class CustomEncoder(json.JSONEncoder):
+    '''Custom json encoder to handle datetime'''
+    def default(self, o):
+        if isinstance(o, datetime):
+            return format_date(o)
+
+        return json.JSONEncoder.default(self, o)  # pragma: no cover
+
+
+class Writer:
+    '''
+    Base class for streaming converted rows to a file object
+
+    ...
+
+    Attributes
+    ----------
+    file : file object
+        the text file object to write to
+    field_names : list
+        the targets of the rules, in order
+    date_fields : list
+        the targets that hold datetimes (from OutputType.Date rules)
+    compact : bool
+        whether to leave out optional whitespace, for formats that have any
+    '''
+
+    def __init__(self, file, field_names, date_fields=(), compact=False):
+        self.file = file
+        self.field_names = field_names
+        self.date_fields = list(date_fields)
+        self.compact = compact
+
+    def write_header(self):
+        '''Writes anything that comes before the first row'''
+        pass
+
+    def write_row(self, row):
+        '''Writes a single converted row'''
+        raise NotImplementedError  # pragma: no cover
+
+    def write_values(self, values):
+        '''Writes a single converted row given as a tuple of its values, in
+        the order of field_names, e.g. from a RowTable'''
+        self.write_row(dict(zip(self.field_names, values)))
+
+    def write_footer(self):
+        '''Writes anything that comes after the last row'''
+        pass
+
+
+class CSVWriter(Writer):
+    '''Streams converted rows to a file object as csv'''
+
+    def __init__(self, file, field_names, date_fields=(), compact=False):
+        super().__init__(file, field_names, date_fields, compact)
+        self._writer = csv.DictWriter(file, field_names)
+
+    def write_header(self):
+        self._writer.writeheader()
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+    def write_values(self, values):
+        # already in field order, so DictWriter's lookups are skipped
+        self._writer.writer.writerow(values)
+
+
+def _encode_float(value):
+    '''Encodes a float the same way as json.dumps'''
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+# How json.dumps encodes each scalar type. Values of any other type (lists
+# and dicts from operations) are encoded as a dict of the row instead
+VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+
+def make_values_encoder(field_names, separators, indent=None):
+    '''Makes a function that encodes a row's values, in the order of
+    field_names, as the json object json.dumps would make of the row's
+    dict, without making the dict.
+
+    Args:
+        field_names (list): The keys of the object.
+        separators (tuple): The (item, key) separators.
+        indent (int): Optional - The indentation of the keys.
+
+    Returns:
+        function: Takes a tuple of values and returns the json string, or
+        None when a value isn't a scalar json.dumps would encode on its
+        own. None if the keys can't be encoded this way (repeated keys, or
+        keys that aren't strings).
+    '''
+    if len(set(field_names)) != len(field_names) or not all(
+        type(name) is str for name in field_names
+    ):
+        return None
+    if not field_names:
+        return lambda values: '{}'
+
+    item_separator, key_separator = separators
+    if indent is None:
+        start, end = '{', '}'
+    else:
+        item_separator = item_separator.rstrip() + '\n' + ' ' * indent
+        start, end = '{\n' + ' ' * indent, '\n}'
+    # the object with a %s for each value, filled in with one % per row
+    template = start + item_separator.join(
+        encode_basestring_ascii(name).replace('%', '%%') + key_separator
+        + '%s'
+        for name in field_names
+    ) + end
+    encoders = VALUE_ENCODERS
+
+    def encode(values):
+        try:
+            return template % tuple([
+                encoders[type(value)](value) for value in values
+            ])
+        except KeyError:
+            return None
+
+    return encode
+
+
+def make_row_encoder(separators):
+    '''Makes a function that encodes a row to json without indentation.
+
+    JSONEncoder.encode sets up the C encoder again on every call, which
+    costs more than encoding a small row, so it is set up once here.
+
+    Args:
+        separators (tuple): The (item, key) separators.
+
+    Returns:
+        function: Takes a row and returns the json string.
+    '''
+    encoder = CustomEncoder(separators=separators, check_circular=False)
+    if c_make_encoder is None:  # pragma: no cover
+        return encoder.encode
+
+    iterencode = c_make_encoder(
+        None, encoder.default, encode_basestring_ascii, None,
+        separators[1], separators[0], False, False, True
+    )
+
+    def encode(row):
+        return ''.join(iterencode(row, 0))
+
+    return encode
+
+
+class _JSONRowsWriter(Writer):
+    '''
+    Base class for the json writers
+
+    Datetimes in date_fields are formatted before encoding, so the rows
+    can go through the C json encoder rather than CustomEncoder.default.
+    '''
+
+    def _prepare(self, row):
+        '''Returns the row with its datetimes formatted, copied if needed'''
+        copied = False
+        for field in self.date_fields:
+            value = row.get(field)
+            if type(value) is datetime:
+                if not copied:
+                    row = dict(row)
+                    copied = True
+                row[field] = format_date(value)
+        return row
+
+    def _prepare_values(self, values):
+        '''Returns the values with their datetimes formatted, by position'''
+        if not self._date_positions:
+            return values
+
+        values = list(values)
+        for i in self._date_positions:
+            if type(values[i]) is datetime:
+                values[i] = format_date(values[i])
+        return values
+
+    def _values_encoder(self, separators, indent=None):
+        '''Sets up encoding rows from their values, see make_values_encoder'''
+        self._date_positions = [
+            i for i, name in enumerate(self.field_names)
+            if name in self.date_fields
+        ]
+        self._encode_values = make_values_encoder(
+            self.field_names, separators, indent
+        )
+
+    def _encode_tuple(self, values):
+        '''Encodes a row given as a tuple of its values, making a dict of
+        it only for values the values encoder can't take'''
+        values = self._prepare_values(values)
+        if self._encode_values is not None:
+            encoded = self._encode_values(values)
+            if encoded is not None:
+                return encoded
+        return self._encode(dict(zip(self.field_names, values)))
+
+
+class JSONWriter(_JSONRowsWriter):
+    '''
+    Streams converted rows to a file object as a json array
+
+    The output is identical to `json.dumps(rows, indent=4)`, or with
+    compact set, to `json.dumps(rows, separators=(',', ':'))`, but only one
+    row is encoded at a time.
+    '''
+
+    def __init__(self, file, field_names, date_fields=(), compact=False):
+        super().__init__(file, field_names, date_fields, compact)
+        if compact:
+            self._encode = make_row_encoder(COMPACT_SEPARATORS)
+            self._values_encoder(COMPACT_SEPARATORS)
+        else:
+            self._encode = CustomEncoder(indent=4).encode
+            self._values_encoder(DEFAULT_SEPARATORS, indent=4)
+        self._count = 0
+
+    def write_header(self):
+        self.file.write('[')
+
+    def write_row(self, row):
+        self._write_encoded(self._encode(self._prepare(row)))
+
+    def write_values(self, values):
+        self._write_encoded(self._encode_tuple(values))
+
+    def _write_encoded(self, encoded):
+        '''Writes an encoded row into the array'''
+        if self._count:
+            self.file.write(',')
+        self._count += 1
+
+        if self.compact:
+            self.file.write(encoded)
+            return
+
+        # Nest the encoded row one level into the array
+        self.file.write('\n    ')
+        self.file.write(encoded.replace('\n', '\n    '))
+
+    def write_footer(self):
+        if self._count and not self.compact:
+            self.file.write('\n')
+        self.file.write(']')
+
+
+class NDJSONWriter(_JSONRowsWriter):
+    '''Streams converted rows to a file object as newline delimited json'''
+
+    def __init__(self, file, field_names, date_fields=(), compact=False):
+        super().__init__(file, field_names, date_fields, compact)
+        separators = COMPACT_SEPARATORS if compact else DEFAULT_SEPARATORS
+        self._encode = make_row_encoder(separators)
+        self._values_encoder(separators)
+
+    def write_row(self, row):
+        self.file.write(self._encode(self._prepare(row)))
+        self.file.write('\n')
+
+    def write_values(self, values):
+        self.file.write(self._encode_tuple(values))
+        self.file.write('\n')
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'json': JSONWriter,
+    'ndjson': NDJSONWriter
+}
+
+
+def get_writer(to, file, field_names, date_fields=(), compact=False):
+    '''Creates the writer for a given output format.
+
+    Args:
+        to (str): The output format, one of WRITERS.
+        file (file object): The text file object to write to.
+        field_names (list): The targets of the rules, in order.
+        date_fields (list): The targets that hold datetimes.
+        compact (bool): Whether to leave out optional whitespace.
+
+    Returns:
+        The writer instance.
+
+    Raises:
+        ValueError: If `to` is not a known output format.
+    '''
+    if to not in WRITERS:
+        raise ValueError('Unknown output format: {}'.format(to))
+
+    return WRITERS[to](file, field_names, date_fields, compact)
+
+
+def open_output(path):
+    '''Opens an outfile for writing text, compressed if its extension is
+    `.gz`, `.bz2`, `.xz`, or `.zst`.
+
+    Args:
+        path (str): The file path of the outfile.
+
+    Returns:
+        file object: The text file, with newline=''.
+    '''
+    compression = compression_from_path(path)
+    if compression is None:
+        return open(path, 'w', newline='', buffering=WRITE_BUFFER_SIZE)
+
+    # the compressor gets large writes instead of TextIOWrapper's chunks
+    file = io.BufferedWriter(
+        open_compressed(path, compression, 'wb'), WRITE_BUFFER_SIZE
+    )
+    return io.TextIOWrapper(file, newline='')
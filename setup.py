@@ -17,11 +17,15 @@ setup(
     author='Winslow DiBona',
     license='MIT',
     install_requires=['pyyaml', 'Click'],
+    extras_require={
+        'numpy': ['numpy'], 'zstd': ['zstandard'], 'arrow': ['pyarrow']
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest==4.4.1'],
     test_suite='tests',
     entry_points='''
         [console_scripts]
         csv-etl=csv_etl.cli:main
+        csv-etl-batch=csv_etl.cli:batch
     '''
 )
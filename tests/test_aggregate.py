@@ -0,0 +1,239 @@
+import os
+import random
+import pytest
+from datetime import datetime
+from csv_etl import (
+    CSVConverter,
+    Aggregation,
+    AggregateField,
+    ErrorSink,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType,
+    load_config_from_yaml,
+    load_rules_from_yaml
+)
+
+CWD = os.path.dirname(__file__)
+
+TEST_AGGREGATE_YAML_FILE_PATH = \
+    CWD + '/../examples/config/aggregate_rule.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+FIELDS = [
+    AggregateField('Total', 'sum', 'Quantity'),
+    AggregateField('Rows', 'count'),
+    AggregateField('Counted', 'count', 'Quantity'),
+    AggregateField('Smallest', 'min', 'Quantity'),
+    AggregateField('Largest', 'max', 'Name'),
+    AggregateField('Mean', 'mean', 'Quantity'),
+    AggregateField('Names', 'distinct_count', 'Name'),
+]
+
+
+def random_rows(count, seed=0):
+    rand = random.Random(seed)
+    groups = [1, 2.0, 2, 'a', 'b', '', datetime(2020, 1, 1)]
+    rows = []
+    for i in range(count):
+        quantity = rand.choice([rand.randrange(100), rand.random(), ''])
+        rows.append({
+            'Group': rand.choice(groups),
+            'Day': i % 3,
+            'Quantity': quantity,
+            'Name': 'name {}'.format(rand.randrange(20)),
+        })
+    return rows
+
+
+def expected_groups(rows, group_by):
+    '''Aggregates rows the slow way, keyed by group'''
+    groups = {}
+    for row in rows:
+        key = tuple(row[target] for target in group_by)
+        groups.setdefault(key, []).append(row)
+
+    result = {}
+    for key, members in groups.items():
+        quantities = [r['Quantity'] for r in members if r['Quantity'] != '']
+        result[key] = {
+            'Total': sum(quantities),
+            'Rows': len(members),
+            'Counted': len(quantities),
+            'Smallest': min(quantities) if quantities else '',
+            'Largest': max(r['Name'] for r in members),
+            'Mean': sum(quantities) / len(quantities) if quantities else '',
+            'Names': len({r['Name'] for r in members}),
+        }
+    return result
+
+
+def by_group(results, group_by):
+    return {
+        tuple(row[target] for target in group_by): {
+            k: v for k, v in row.items() if k not in group_by
+        }
+        for row in results
+    }
+
+
+@pytest.mark.parametrize('memory_limit', [None, 1, 20000])
+def test_aggregate(memory_limit, tmp_path):
+    rows = random_rows(3000)
+    group_by = ['Group', 'Day']
+    options = {} if memory_limit is None else {'memory_limit': memory_limit}
+    aggregation = Aggregation(
+        group_by, FIELDS, spill_dir=str(tmp_path), **options
+    )
+    results = list(aggregation.aggregate(iter(rows)))
+
+    expected = expected_groups(rows, group_by)
+    assert len(results) == len(expected) == aggregation.groups
+    result = by_group(results, group_by)
+    for key, values in expected.items():
+        assert result[key] == pytest.approx(values)
+    assert list(results[0]) == aggregation.field_names
+
+    if memory_limit is None:
+        assert aggregation.spills == 0
+    else:
+        assert aggregation.spills > 1
+    # the spill files are removed once the results are read
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_aggregate_sorted_by_group():
+    rows = [{'Group': group} for group in ['b', 3, 'a', 1.5, 3, 'b', '']]
+    aggregation = Aggregation(['Group'], [AggregateField('Rows', 'count')])
+    results = list(aggregation.aggregate(rows))
+    assert results == [
+        {'Group': 1.5, 'Rows': 1},
+        {'Group': 3, 'Rows': 2},
+        {'Group': '', 'Rows': 1},
+        {'Group': 'a', 'Rows': 1},
+        {'Group': 'b', 'Rows': 2},
+    ]
+
+
+def test_aggregate_closed_early(tmp_path):
+    aggregation = Aggregation(
+        ['Group', 'Day'], FIELDS, memory_limit=1, spill_dir=str(tmp_path)
+    )
+    results = aggregation.aggregate(iter(random_rows(500)))
+    next(results)
+    assert os.listdir(str(tmp_path)) != []
+    results.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_aggregate_field_invalid():
+    with pytest.raises(ValueError):
+        AggregateField('Median', 'median', 'Quantity')
+    with pytest.raises(ValueError):
+        AggregateField('Total', 'sum')
+    with pytest.raises(ValueError):
+        Aggregation([], FIELDS)
+
+
+@pytest.mark.parametrize('field', [
+    AggregateField('Total', 'sum', 'Missing'),
+    AggregateField('Total', 'sum', 'ProductName'),
+    AggregateField('Mean', 'mean', 'OrderDate'),
+])
+def test_aggregation_check(field):
+    rules = load_rules_from_yaml(TEST_AGGREGATE_YAML_FILE_PATH)
+    with pytest.raises(ValueError):
+        CSVConverter(rules, aggregation=Aggregation(['ProductId'], [field]))
+    with pytest.raises(ValueError):
+        CSVConverter(rules, aggregation=Aggregation(
+            ['Missing'], [AggregateField('Rows', 'count')]
+        ))
+
+
+def test_load_config_from_yaml(tmp_path):
+    rules, aggregation = load_config_from_yaml(TEST_AGGREGATE_YAML_FILE_PATH)
+    assert [rule.target for rule in rules] == \
+        ['OrderDate', 'ProductId', 'ProductName', 'Quantity']
+    assert aggregation.group_by == ['ProductId', 'OrderDate']
+    assert aggregation.field_names == [
+        'ProductId', 'OrderDate', 'Total Quantity', 'Orders',
+        'Largest Order', 'Mean Quantity', 'Names'
+    ]
+
+    # the aggregation is cached with the rules
+    cache_dir = str(tmp_path)
+    load_config_from_yaml(TEST_AGGREGATE_YAML_FILE_PATH, cache_dir=cache_dir)
+    cached_rules, cached = load_config_from_yaml(
+        TEST_AGGREGATE_YAML_FILE_PATH, cache_dir=cache_dir
+    )
+    assert cached.as_dict() == aggregation.as_dict()
+    assert load_config_from_yaml(
+        CWD + '/../examples/config/sample_config.yaml', cache_dir=cache_dir
+    )[1] is None
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    lines = [HEADER]
+    for i in range(600):
+        count = 'n/a' if i % 50 == 0 else '"{:,}.5"'.format(i * 10)
+        lines.append('{},2018,{},{},P-{},product {},{}\r\n'.format(
+            1000 + i, i % 2 + 1, i % 3 + 1, i % 4, i % 5, count
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def test_converter_aggregation(order_csv, tmp_path):
+    rules, aggregation = load_config_from_yaml(TEST_AGGREGATE_YAML_FILE_PATH)
+    converter = CSVConverter(
+        rules, aggregation=aggregation, errors=ErrorSink(max_messages=0)
+    )
+    result = converter.convert(order_csv)
+    rows = CSVConverter(rules, errors=ErrorSink(max_messages=0)).convert(
+        order_csv
+    )
+
+    # the month follows from the product, lcm(4, 3) groups
+    assert len(result) == 12
+    assert sum(row['Orders'] for row in result) == 600
+    assert sum(row['Total Quantity'] for row in result) == pytest.approx(
+        sum(row['Quantity'] for row in rows if row['Quantity'] != '')
+    )
+    assert result[0]['ProductId'] == 'P-0'
+    assert result[0]['OrderDate'] == datetime(2018, 1, 1)
+
+    # workers only convert, the parent aggregates their rows in order
+    assert converter.convert(order_csv, workers=2) == result
+
+    outfile = str(tmp_path / 'out.json')
+    assert converter.convert(order_csv, to='json', outfile=outfile) == 12
+    with open(outfile) as file:
+        assert '"OrderDate": "2018-01-01"' in file.read()
+
+    with pytest.raises(ValueError):
+        converter.convert_incremental(order_csv, str(tmp_path / 'out.csv'))
+
+
+def test_converter_aggregation_filters(order_csv):
+    rules, aggregation = load_config_from_yaml(TEST_AGGREGATE_YAML_FILE_PATH)
+    rules.append(Rule(
+        source='Product Name', target='Product 0', type=RuleType.Filter,
+        operations=['s == "product 0"']
+    ))
+    rules.append(Rule(
+        source='Order Number', target='OrderId', type=RuleType.Calculation,
+        input_type=InputType.Integer, output_type=OutputType.Integer
+    ))
+    aggregation.fields.append(AggregateField('First', 'min', 'OrderId'))
+    converter = CSVConverter(
+        rules, aggregation=aggregation, errors=ErrorSink(max_messages=0)
+    )
+    result = converter.convert(order_csv)
+    assert sum(row['Orders'] for row in result) == 120
+    assert {row['ProductId'] for row in result} == {'P-0', 'P-1', 'P-2',
+                                                    'P-3'}
+    assert min(row['First'] for row in result) == 1000
@@ -0,0 +1,112 @@
+import os
+import gzip
+import pytest
+from csv_etl import CSVConverter, load_rules_from_yaml
+from csv_etl.batch import expand_paths, iter_convert_batch, output_path
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+@pytest.fixture()
+def converter():
+    return CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+
+
+@pytest.fixture()
+def order_dir(tmp_path):
+    directory = tmp_path / 'orders'
+    directory.mkdir()
+    for n in range(5):
+        lines = [HEADER]
+        for i in range(20 * (n + 1)):
+            lines.append('{},2018,{},{},P-{},product {},"{}.5"\r\n'.format(
+                1000 + i, i % 12 + 1, i % 28 + 1, i, i, i * 10
+            ))
+        path = directory / 'day-{}.csv'.format(n)
+        path.write_text(''.join(lines))
+    return directory
+
+
+def test_expand_paths(order_dir):
+    pattern = str(order_dir / 'day-*.csv')
+    missing = str(order_dir / 'missing.csv')
+    paths = expand_paths([pattern, str(order_dir / 'day-0.csv'), missing])
+    assert [os.path.basename(p) for p in paths[:5]] == [
+        'day-{}.csv'.format(n) for n in range(5)
+    ]
+    assert paths[5:] == [missing]
+
+
+@pytest.mark.parametrize('path, to, expected', [
+    ('in/orders.csv', 'json', 'out/orders.json'),
+    ('in/orders.csv.gz', 'ndjson', 'out/orders.ndjson'),
+    ('in/orders.txt', 'csv', 'out/orders.txt.csv'),
+])
+def test_output_path(path, to, expected):
+    assert output_path(path, 'out', to) == os.path.join(*expected.split('/'))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_batch(converter, order_dir, tmp_path, workers):
+    outdir = str(tmp_path / 'out')
+    results = converter.convert_batch(
+        [str(order_dir / '*.csv')], outdir, to='ndjson', workers=workers
+    )
+    assert [result.rows for result in results] == [20, 40, 60, 80, 100]
+    for result in results:
+        assert result.ok
+        assert result.errors['total'] == 0
+        with open(result.outfile) as file:
+            assert file.read() == converter.convert(result.path, 'ndjson')
+
+
+def test_failures_are_reported(converter, order_dir, tmp_path):
+    bad = order_dir / 'bad.csv'
+    bad.write_bytes(gzip.compress(b'x')[:-4])
+    outdir = str(tmp_path / 'out')
+
+    paths = [bad, order_dir / 'missing.csv', order_dir / 'day-0.csv']
+
+    results = list(iter_convert_batch(
+        converter,
+        [str(path) for path in paths],
+        outdir,
+        workers=2,
+        max_pending=1
+    ))
+    assert [result.ok for result in results] == [False, False, True]
+    assert results[1].failure.startswith('FileNotFoundError')
+    assert not os.path.exists(results[0].outfile)
+    assert os.path.exists(results[2].outfile)
+
+
+def test_rule_errors_written_per_file(
+    converter, order_dir, tmp_path, capsys
+):
+    with open(order_dir / 'day-0.csv', 'a') as file:
+        file.write('x,2018,1,1,P-1,product,1\r\n')
+    error_dir = str(tmp_path / 'errors')
+
+    results = converter.convert_batch(
+        [str(order_dir / 'day-0.csv'), str(order_dir / 'day-1.csv')],
+        str(tmp_path / 'out'),
+        error_dir=error_dir
+    )
+    assert [result.errors['total'] for result in results] == [1, 0]
+    # the counts are in the results, nothing is printed
+    assert capsys.readouterr().out == ''
+    with open(os.path.join(error_dir, 'day-0.json.errors.ndjson')) as file:
+        assert len(file.readlines()) == 1
+    assert converter.errors.max_messages != 0
+
+
+def test_duplicate_outfiles(converter, order_dir, tmp_path):
+    with pytest.raises(ValueError):
+        converter.convert_batch(
+            [str(order_dir / 'day-0.csv'), str(order_dir / 'day-0.csv.gz')],
+            str(tmp_path / 'out')
+        )
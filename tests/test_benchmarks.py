@@ -0,0 +1,98 @@
+import csv
+import json
+import pytest
+from benchmarks import bench_convert, compare
+from benchmarks.generators import (
+    BAD_NUMBERS,
+    ORDER_COLUMNS,
+    filler_columns,
+    write_csv
+)
+from benchmarks.rulesets import WIDE, load_ruleset, ruleset_names
+
+
+@pytest.fixture()
+def bench_csv(tmp_path):
+    path = str(tmp_path / 'bench.csv')
+    write_csv(path, 2000, extra_columns=10, error_rate=0.1, seed=1)
+    return path
+
+
+def test_filler_columns_mix():
+    columns = filler_columns(10, {'numeric': 1, 'string': 1, 'date': 3})
+    kinds = [kind for _, kind in columns]
+    assert kinds.count('numeric') == 2
+    assert kinds.count('date') == 6
+    assert len(columns) == 10
+
+
+def test_write_csv(bench_csv):
+    with open(bench_csv, newline='') as file:
+        rows = list(csv.reader(file))
+
+    assert rows[0][:len(ORDER_COLUMNS)] == ORDER_COLUMNS
+    assert len(rows[0]) == len(ORDER_COLUMNS) + 10
+    assert len(rows) == 2001
+    assert all(len(row) == len(rows[0]) for row in rows)
+
+    bad = sum(1 for row in rows[1:] if set(row[3:7:3]) & set(BAD_NUMBERS))
+    assert 100 < bad < 300
+
+
+def test_write_csv_is_seeded(tmp_path, bench_csv):
+    path = str(tmp_path / 'again.csv')
+    write_csv(path, 2000, extra_columns=10, error_rate=0.1, seed=1)
+    with open(path) as again, open(bench_csv) as first:
+        assert again.read() == first.read()
+
+
+def test_rulesets(bench_csv):
+    with open(bench_csv, newline='') as file:
+        header = next(csv.reader(file))
+    assert 'sample_config' in ruleset_names()
+    assert len(load_ruleset(WIDE, header)) == 7 + 10
+    with pytest.raises(ValueError):
+        load_ruleset('missing', header)
+
+
+@pytest.mark.parametrize('to', bench_convert.FORMATS)
+def test_run_case(bench_csv, to):
+    result = bench_convert.run_case({
+        'csv': bench_csv, 'ruleset': WIDE, 'format': to, 'rows': 2000
+    })
+    assert result['name'] == 'wide/' + to
+    assert result['converted'] == 2000
+    assert result['errors'] > 0
+    assert result['rows_per_sec'] > 0
+    assert result['peak_rss_kb'] > 0
+    assert 0 < result['time_to_first_row'] < result['seconds']
+
+
+def results(rows_per_sec, peak_rss_kb=1000, time_to_first_row=0.1):
+    return {'results': [{
+        'name': 'wide/csv', 'rows': 1000, 'rows_per_sec': rows_per_sec,
+        'peak_rss_kb': peak_rss_kb, 'time_to_first_row': time_to_first_row
+    }]}
+
+
+def test_compare():
+    changes = compare.compare(results(1000), results(850, 1050, 0.101))
+    assert [change[1] for change in changes] == list(compare.METRICS)
+    failed = compare.regressions(changes)
+    assert [(change[1], round(change[4], 2)) for change in failed] == [
+        ('rows_per_sec', 0.15)
+    ]
+    # times that only change by a few ms are noise
+    assert changes[2][4] == 0
+
+
+def test_compare_main(tmp_path):
+    paths = []
+    for i, suite in enumerate([results(1000), results(500), results(990)]):
+        paths.append(str(tmp_path / '{}.json'.format(i)))
+        with open(paths[-1], 'w') as file:
+            json.dump(suite, file)
+
+    assert compare.main([paths[0], paths[1]]) == 1
+    assert compare.main([paths[0], paths[2]]) == 0
+    assert compare.main([paths[0], paths[1], '0.6']) == 0
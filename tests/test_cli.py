@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import pytest
 from click.testing import CliRunner
 from csv_etl import cli
@@ -24,6 +25,13 @@ def runner():
     return CliRunner()
 
 
+@pytest.fixture(autouse=True)
+def rule_cache_dir(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'rule-cache')
+    monkeypatch.setenv('CSV_ETL_CACHE_DIR', cache_dir)
+    return cache_dir
+
+
 def test_cli_default(runner, expected_json):
     result = runner.invoke(cli.main, [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH])
     assert result.exit_code == 0
@@ -44,3 +52,179 @@ def test_cli_outfile(runner, expected_json):
     assert os.path.exists(TEST_OUTFILE_PATH)
 
     os.remove(TEST_OUTFILE_PATH)
+
+
+def test_cli_workers(runner, expected_json):
+    result = runner.invoke(
+        cli.main,
+        [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--workers=2']
+    )
+    assert result.exit_code == 0
+    assert result.stdout == expected_json
+
+
+def test_cli_missing_source_fail(runner):
+    result = runner.invoke(
+        cli.main,
+        [
+            CWD + '/../examples/config/sample_config.yaml',
+            TEST_CSV_FILE_PATH,
+            '--missing-source=fail'
+        ]
+    )
+    assert result.exit_code != 0
+
+
+def test_cli_error_file(runner, tmp_path):
+    error_file = str(tmp_path / 'errors.ndjson')
+    result = runner.invoke(
+        cli.main,
+        [
+            CWD + '/../examples/config/sample_config.yaml',
+            TEST_CSV_FILE_PATH,
+            '--error-file={}'.format(error_file),
+            '--max-error-messages=0'
+        ]
+    )
+    assert result.exit_code == 0
+    assert 'Error executing' not in result.stdout
+    with open(error_file) as file:
+        assert len(file.readlines()) == 6
+
+
+def test_cli_explain(runner):
+    result = runner.invoke(
+        cli.main, [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--explain']
+    )
+    assert result.exit_code == 0
+    assert result.stdout.startswith('Fetched and cast once per row:\n')
+    assert 'Rules:\n' in result.stdout
+
+
+def test_cli_incremental(runner, tmp_path):
+    outfile = str(tmp_path / 'out.ndjson')
+    args = [
+        TEST_YAML_FILE_PATH,
+        TEST_CSV_FILE_PATH,
+        '--incremental',
+        '--format=ndjson',
+        '--outfile={}'.format(outfile)
+    ]
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 0
+    assert os.path.exists(outfile + '.checkpoint')
+
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 0
+    assert result.stdout.endswith('Done, 0 new row(s)\n')
+
+
+def test_cli_incremental_requires_outfile(runner):
+    result = runner.invoke(
+        cli.main, [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--incremental']
+    )
+    assert result.exit_code != 0
+
+
+def test_cli_incremental_requires_appendable_format(runner, tmp_path):
+    outfile = str(tmp_path / 'out.json')
+    # --format is json by default
+    result = runner.invoke(cli.main, [
+        TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--incremental',
+        '--outfile={}'.format(outfile)
+    ])
+    assert result.exit_code == 2
+    assert '--incremental requires --format csv or ndjson, not json' in \
+        result.output
+    assert not os.path.exists(outfile)
+
+
+def test_cli_batch(runner, tmp_path):
+    outdir = str(tmp_path / 'out')
+    result = runner.invoke(
+        cli.batch,
+        [
+            TEST_YAML_FILE_PATH,
+            TEST_CSV_FILE_PATH,
+            str(tmp_path / 'missing.csv'),
+            '--outdir={}'.format(outdir),
+            '--workers=1'
+        ]
+    )
+    assert result.exit_code == 1
+    assert result.stdout.startswith('ok      ')
+    assert '\nfailed  ' in result.stdout
+    assert result.stdout.endswith('1 converted, 1 failed\n')
+    assert os.listdir(outdir) == ['test_csv_data.json']
+
+
+def test_cli_rule_cache(runner, rule_cache_dir, expected_json):
+    args = [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH]
+    assert runner.invoke(cli.main, args + ['--no-rule-cache']).exit_code == 0
+    assert not os.path.exists(rule_cache_dir)
+
+    for _ in range(2):
+        result = runner.invoke(cli.main, args)
+        assert result.exit_code == 0
+        assert result.stdout == expected_json
+    assert len(os.listdir(rule_cache_dir)) == 1
+
+
+def test_cli_stats(runner, expected_json):
+    result = runner.invoke(
+        cli.main, [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--stats']
+    )
+    assert result.exit_code == 0
+    assert result.stdout == expected_json
+    assert result.stderr.startswith('1 rows in ')
+    # the rules are converted compiled, without being timed one by one
+    assert 'TestTarget' not in result.stderr
+
+    result = runner.invoke(
+        cli.main,
+        [TEST_YAML_FILE_PATH, TEST_CSV_FILE_PATH, '--profile-rules']
+    )
+    assert result.exit_code == 0
+    assert result.stdout == expected_json
+    assert result.stderr.startswith('1 rows in ')
+    assert 'TestTarget' in result.stderr
+
+
+def test_cli_aggregate():
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        CWD + '/../examples/config/aggregate_rule.yaml',
+        CWD + '/../examples/order_data/test_data.csv',
+        '--format', 'csv'
+    ])
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert lines[0] == \
+        'ProductId,OrderDate,Total Quantity,Orders,Largest Order,' \
+        'Mean Quantity,Names'
+    assert lines[1].startswith('P-10001,')
+
+
+def test_cli_sqlite(tmp_path):
+    runner = CliRunner()
+    database = str(tmp_path / 'orders.db')
+    result = runner.invoke(cli.main, [
+        CWD + '/../examples/config/sample_config.yaml',
+        CWD + '/../examples/order_data/test_data.csv',
+        '--format', 'sqlite', '--outfile', database,
+        '--table', 'orders', '--index', 'OrderDate,ProductId'
+    ])
+    assert result.exit_code == 0
+    assert result.stdout == 'Done, 2 row(s) loaded\n'
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute(
+            'SELECT OrderId, OrderDate FROM orders'
+        ).fetchall() == [(1000, '2018-01-01'), (1001, '2017-12-12')]
+
+    result = runner.invoke(cli.main, [
+        CWD + '/../examples/config/sample_config.yaml',
+        CWD + '/../examples/order_data/test_data.csv',
+        '--format', 'sqlite'
+    ])
+    assert result.exit_code == 2
@@ -0,0 +1,207 @@
+import os
+import importlib.util
+from datetime import date
+import pytest
+from click.testing import CliRunner
+from csv_etl import (
+    CSVConverter,
+    ErrorSink,
+    InputType,
+    OutputType,
+    Rule,
+    RuleType,
+    load_config_from_yaml
+)
+from csv_etl.cli import main
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+TEST_AGGREGATE_YAML_FILE_PATH = \
+    CWD + '/../examples/config/aggregate_rule.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+needs_pyarrow = pytest.mark.skipif(
+    not HAS_PYARROW, reason='pyarrow is not installed'
+)
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    lines = [HEADER]
+    for i in range(500):
+        count = 'n/a' if i % 100 == 0 else '"{:,}.5"'.format(i * 10)
+        lines.append('{},2018,{},{},P-{},product {},{}\r\n'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i % 5, i % 5, count
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def converter_for(path=TEST_ORDER_YAML_FILE_PATH):
+    rules, aggregation = load_config_from_yaml(path)
+    return CSVConverter(
+        rules, errors=ErrorSink(max_messages=0), aggregation=aggregation
+    )
+
+
+def read_table(path, to):
+    import pyarrow
+    if to == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(path)
+
+    import pyarrow.ipc
+    with pyarrow.ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+@needs_pyarrow
+@pytest.mark.parametrize('to', ['parquet', 'arrow'])
+def test_convert_to_columnar(order_csv, tmp_path, to):
+    outfile = str(tmp_path / 'orders.{}'.format(to))
+    converter = converter_for()
+    assert converter.convert_to_columnar(order_csv, outfile, to=to) == 500
+
+    table = read_table(outfile, to)
+    assert [(field.name, str(field.type)) for field in table.schema] == [
+        ('OrderId', 'int64'),
+        ('OrderDate', 'date32[day]'),
+        ('ProductId', 'string'),
+        ('ProductName', 'string'),
+        ('Quantity', 'double'),
+        ('Unit', 'string'),
+        ('Quantity ^2', 'double'),
+    ]
+    rows = table.to_pylist()
+    assert rows[1] == {
+        'OrderId': 1001, 'OrderDate': date(2018, 2, 2), 'ProductId': 'P-1',
+        'ProductName': 'Product 1', 'Quantity': 10.5, 'Unit': 'kg',
+        'Quantity ^2': 110.25,
+    }
+    # failed conversions are nulls
+    assert rows[0]['Quantity'] is None
+    assert len(rows) == 500
+
+
+@needs_pyarrow
+@pytest.mark.parametrize('to', ['parquet', 'arrow'])
+def test_columnar_empty_strings(tmp_path, to):
+    csv_file = tmp_path / 'orders.csv'
+    csv_file.write_bytes(HEADER.encode() + (
+        '1000,2018,1,2,P-1,product 1,5\r\n'
+        '1001,2018,1,2,P-2,,n/a\r\n'
+    ).encode())
+    outfile = str(tmp_path / 'orders.{}'.format(to))
+    converter_for().convert_to_columnar(str(csv_file), outfile, to=to)
+
+    rows = read_table(outfile, to).to_pylist()
+    # an empty String value stays '', a failed Decimal cast is null
+    assert rows[1]['ProductName'] == ''
+    assert rows[1]['Quantity'] is None
+
+
+@needs_pyarrow
+def test_columnar_row_groups(order_csv, tmp_path):
+    import pyarrow.parquet
+
+    outfile = str(tmp_path / 'orders.parquet')
+    converter = converter_for()
+    converter.convert_to_columnar(order_csv, outfile, batch_size=64)
+    metadata = pyarrow.parquet.ParquetFile(outfile).metadata
+    assert metadata.num_row_groups == 8
+    assert metadata.num_rows == 500
+
+    # the same rows with a worker pool, or through convert
+    second = str(tmp_path / 'second.parquet')
+    assert converter.convert(
+        order_csv, to='parquet', outfile=second, workers=2
+    ) == 500
+    assert read_table(second, 'parquet').equals(
+        read_table(outfile, 'parquet')
+    )
+
+
+@needs_pyarrow
+@pytest.mark.parametrize('to', ['parquet', 'arrow'])
+def test_columnar_failure_removes_outfile(order_csv, tmp_path, to):
+    # raises on order 1150, after two batches have been written
+    rule = Rule(
+        source='Order Number', target='Ratio', type=RuleType.Calculation,
+        input_type=InputType.Integer, output_type=OutputType.Decimal,
+        operations=['1 / (s - 1150)']
+    )
+    outfile = str(tmp_path / 'orders.{}'.format(to))
+    with pytest.raises(ZeroDivisionError):
+        CSVConverter([rule]).convert_to_columnar(
+            order_csv, outfile, to=to, batch_size=64
+        )
+    assert os.listdir(str(tmp_path)) == ['orders.csv']
+
+    # an earlier complete file is left as it was
+    converter_for().convert_to_columnar(order_csv, outfile, to=to)
+    with pytest.raises(ZeroDivisionError):
+        CSVConverter([rule]).convert_to_columnar(
+            order_csv, outfile, to=to, batch_size=64
+        )
+    assert read_table(outfile, to).num_rows == 500
+    assert sorted(os.listdir(str(tmp_path))) == [
+        'orders.csv', 'orders.{}'.format(to)
+    ]
+
+
+@needs_pyarrow
+def test_columnar_aggregation(order_csv, tmp_path):
+    outfile = str(tmp_path / 'groups.arrow')
+    converter = converter_for(TEST_AGGREGATE_YAML_FILE_PATH)
+    groups = converter.convert_to_columnar(order_csv, outfile, to='arrow')
+    table = read_table(outfile, 'arrow')
+    assert table.num_rows == groups
+    assert sum(table.column('Orders').to_pylist()) == 500
+
+
+@needs_pyarrow
+def test_cli_parquet(order_csv, tmp_path):
+    outfile = str(tmp_path / 'orders.parquet')
+    result = CliRunner().invoke(main, [
+        TEST_ORDER_YAML_FILE_PATH, order_csv, '--format', 'parquet',
+        '--outfile', outfile, '--no-rule-cache'
+    ])
+    assert result.exit_code == 0, result.output
+    assert 'Done, 500 row(s) written' in result.output
+    assert read_table(outfile, 'parquet').num_rows == 500
+
+
+def test_columnar_needs_outfile(order_csv):
+    with pytest.raises(ValueError):
+        converter_for().convert(order_csv, to='parquet')
+
+    result = CliRunner().invoke(main, [
+        TEST_ORDER_YAML_FILE_PATH, order_csv, '--format', 'arrow'
+    ])
+    assert result.exit_code != 0
+    assert '--format arrow requires --outfile' in result.output
+
+
+@pytest.mark.skipif(HAS_PYARROW, reason='pyarrow is installed')
+def test_columnar_without_pyarrow(order_csv, tmp_path):
+    outfile = str(tmp_path / 'orders.parquet')
+    converter = converter_for()
+    with pytest.raises(ImportError, match='pip install csv-etl\\[arrow\\]'):
+        converter.convert(order_csv, to='parquet', outfile=outfile)
+    # nothing was converted or written
+    assert converter.errors.total == 0
+    assert not os.path.exists(outfile)
+
+    # the CLI fails before loading the config
+    result = CliRunner().invoke(main, [
+        TEST_ORDER_YAML_FILE_PATH, order_csv, '--format', 'parquet',
+        '--outfile', outfile, '--no-rule-cache'
+    ])
+    assert result.exit_code == 1
+    assert 'parquet output requires pyarrow' in result.output
+    assert not os.path.exists(outfile)
@@ -0,0 +1,148 @@
+import io
+import os
+import bz2
+import gzip
+import lzma
+import pytest
+from click.testing import CliRunner
+from csv_etl import CSVConverter, load_rules_from_yaml, cli
+from csv_etl.compression import (
+    ThreadedReader,
+    detect_compression,
+    open_compressed
+)
+from csv_etl.sources import CSVSource
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_CSV_FILE_PATH = CWD + '/../examples/order_data/test_data.csv'
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+COMPRESSORS = {
+    'gzip': ('.gz', gzip.compress),
+    'bz2': ('.bz2', bz2.compress),
+    'xz': ('.xz', lzma.compress),
+}
+
+
+@pytest.fixture()
+def order_bytes():
+    with open(TEST_ORDER_CSV_FILE_PATH, 'rb') as file:
+        return file.read()
+
+
+@pytest.fixture()
+def converter():
+    return CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+
+
+@pytest.mark.parametrize('compression', sorted(COMPRESSORS))
+def test_detect_compression(compression, order_bytes):
+    extension, compress = COMPRESSORS[compression]
+    file = io.BufferedReader(io.BytesIO(compress(order_bytes)))
+    assert detect_compression(file) == compression
+    assert file.tell() == 0
+    assert detect_compression(io.BytesIO(order_bytes)) is None
+    assert detect_compression(io.BytesIO(), 'data.csv' + extension) == \
+        compression
+
+
+def test_detect_compression_plain_bzh(converter):
+    # a plain csv can start with bz2's 'BZh'
+    data = b'BZh Code,Order Number\r\nA,1000\r\n'
+    assert detect_compression(io.BytesIO(data)) is None
+    assert detect_compression(io.BytesIO(data), 'data.csv') is None
+    assert detect_compression(io.BytesIO(bz2.compress(b''))) == 'bz2'
+    assert len(converter.convert(data)) == 1
+
+
+@pytest.mark.parametrize('compression', sorted(COMPRESSORS))
+def test_open_compressed_round_trip(compression, tmp_path, order_bytes):
+    path = str(tmp_path / 'data')
+    with open_compressed(path, compression, 'wb') as file:
+        file.write(order_bytes)
+    with open_compressed(path, compression) as file:
+        assert file.read() == order_bytes
+
+
+def test_open_compressed_zstd(tmp_path, order_bytes):
+    pytest.importorskip('zstandard')
+    path = str(tmp_path / 'data.zst')
+    with open_compressed(path, 'zstd', 'wb') as file:
+        file.write(order_bytes)
+    with open(path, 'rb') as file:
+        assert detect_compression(file) == 'zstd'
+
+
+def test_threaded_reader(order_bytes):
+    reader = ThreadedReader(io.BytesIO(order_bytes * 100), chunk_size=100)
+    assert reader.read() == order_bytes * 100
+    reader.close()
+
+
+def test_threaded_reader_raises_read_errors():
+    reader = ThreadedReader(gzip.GzipFile(fileobj=io.BytesIO(b'not gzip')))
+    with pytest.raises(gzip.BadGzipFile):
+        reader.read()
+    reader.close()
+
+
+def test_threaded_reader_close_early():
+    file = io.BytesIO(b'x' * 1000)
+    reader = ThreadedReader(file, chunk_size=1, chunks=2)
+    assert reader.read(1) == b'x'
+    reader.close()
+    assert file.closed
+    assert not reader._thread.is_alive()
+
+
+@pytest.mark.parametrize('threaded', [True, False])
+@pytest.mark.parametrize('compression', sorted(COMPRESSORS))
+def test_convert_compressed_file(
+    compression, threaded, tmp_path, converter, order_bytes
+):
+    extension, compress = COMPRESSORS[compression]
+    # no extension, found by the magic bytes
+    path = tmp_path / 'data'
+    path.write_bytes(compress(order_bytes))
+    expected = converter.convert(TEST_ORDER_CSV_FILE_PATH)
+    source = CSVSource(str(path), threaded=threaded)
+    assert converter.convert(source) == expected
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_compressed_buffer(workers, converter, order_bytes):
+    expected = converter.convert(TEST_ORDER_CSV_FILE_PATH)
+    data = gzip.compress(order_bytes)
+    assert converter.convert(data, workers=workers) == expected
+    assert converter.convert(io.BytesIO(data), workers=workers) == expected
+
+
+@pytest.mark.parametrize('compression', sorted(COMPRESSORS))
+def test_convert_compressed_outfile(compression, tmp_path, converter):
+    extension, compress = COMPRESSORS[compression]
+    path = str(tmp_path / ('out.ndjson' + extension))
+    assert converter.convert(
+        TEST_ORDER_CSV_FILE_PATH, to='ndjson', outfile=path
+    ) == 2
+    with open_compressed(path, compression) as file:
+        assert file.read().decode() == converter.convert(
+            TEST_ORDER_CSV_FILE_PATH, to='ndjson'
+        )
+
+
+def test_cli_compressed(tmp_path, converter, order_bytes):
+    csv_path = tmp_path / 'data.csv.gz'
+    csv_path.write_bytes(gzip.compress(order_bytes))
+    outfile = str(tmp_path / 'out.csv.gz')
+    result = CliRunner().invoke(cli.main, [
+        TEST_ORDER_YAML_FILE_PATH,
+        str(csv_path),
+        '--format=csv',
+        '--outfile={}'.format(outfile)
+    ])
+    assert result.exit_code == 0
+    with gzip.open(outfile, 'rt', newline='') as file:
+        assert file.read() == converter.convert(
+            TEST_ORDER_CSV_FILE_PATH, to='csv'
+        )
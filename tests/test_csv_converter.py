@@ -1,11 +1,15 @@
 import os
 import json
+import types
 import pytest
 from datetime import datetime
 from csv_etl import (
     CSVConverter,
+    ErrorSink,
     Rule,
     load_rules_from_yaml,
+    MissingSourcePolicy,
+    SourceNotFound,
     RuleType,
     InputType,
     OutputType
@@ -19,6 +23,8 @@ TEST_CSV_FILE_PATH = CWD + '/resources/test_csv_data.csv'
 TEST_CSV_CONVERTED_FILE_PATH = CWD + '/resources/test_csv_data_converted.csv'
 TEST_JSON_CONVERTED_FILE_PATH = CWD + '/resources/test_json_data_converted.txt'
 TEST_YAML_FILE_PATH = CWD + '/resources/test_config.yaml'
+TEST_ORDER_CSV_FILE_PATH = CWD + '/../examples/order_data/test_data.csv'
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
 TEST_OUTFILE_PATH = CWD + '/resources/test_outfile.txt'
 
 
@@ -66,6 +72,55 @@ def test_csv_converter_convert_write_outfile(csv_converter):
     os.remove(TEST_OUTFILE_PATH)
 
 
+def test_csv_converter_iter_convert(csv_converter):
+    result = csv_converter.iter_convert(TEST_CSV_FILE_PATH)
+    assert isinstance(result, types.GeneratorType)
+    assert list(result) == [{'TestTarget': 'Test Value'}]
+
+
+@pytest.mark.parametrize('to', ['csv', 'json', 'ndjson'])
+@pytest.mark.parametrize('compact', [False, True])
+def test_csv_converter_convert_stream_outfile(to, compact):
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    expected = converter.convert(
+        TEST_ORDER_CSV_FILE_PATH,
+        to=to,
+        compact=compact
+    )
+    count = converter.convert(
+        TEST_ORDER_CSV_FILE_PATH,
+        to=to,
+        outfile=TEST_OUTFILE_PATH,
+        compact=compact
+    )
+    file = open(TEST_OUTFILE_PATH, newline='')
+    result = file.read()
+    file.close()
+    os.remove(TEST_OUTFILE_PATH)
+    assert count == 2
+    assert result == expected
+
+
+def test_csv_converter_convert_ndjson():
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    result = converter.convert(TEST_ORDER_CSV_FILE_PATH, to='ndjson')
+    rows = [json.loads(line) for line in result.splitlines()]
+    assert rows == json.loads(
+        converter.convert(TEST_ORDER_CSV_FILE_PATH, to='json')
+    )
+    assert rows[0]['OrderDate'] == '2018-01-01'
+
+
+def test_csv_converter_convert_outfile_unknown_format(csv_converter):
+    with pytest.raises(ValueError):
+        csv_converter.convert(
+            TEST_CSV_FILE_PATH,
+            to='xml',
+            outfile=TEST_OUTFILE_PATH
+        )
+    assert not os.path.exists(TEST_OUTFILE_PATH)
+
+
 def test_csv_converter_convert_raise_source_error():
     expected = [
         {
@@ -108,8 +163,230 @@ def test_csv_converter_convert_raise_value_error():
     assert result == expected
 
 
+def missing_source_converter(missing_source):
+    rules = load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH)
+    rules[0].source = 'Order Id'
+    return CSVConverter(rules, missing_source=missing_source)
+
+
+def test_csv_converter_missing_source_fail():
+    converter = missing_source_converter(MissingSourcePolicy.Fail)
+    with pytest.raises(SourceNotFound):
+        converter.convert(TEST_ORDER_CSV_FILE_PATH)
+
+
+def test_csv_converter_missing_source_blank(capsys):
+    converter = missing_source_converter('blank')
+    result = converter.convert(TEST_ORDER_CSV_FILE_PATH)
+    assert [row['OrderId'] for row in result] == ['', '']
+    assert capsys.readouterr().out == ''
+
+
+def test_csv_converter_missing_source_warn_once(capsys):
+    converter = missing_source_converter('warn')
+    result = converter.convert(TEST_ORDER_CSV_FILE_PATH)
+    assert [row['OrderId'] for row in result] == ['', '']
+    assert capsys.readouterr().out.count('Error executing') == 1
+
+
+def test_csv_converter_short_row(tmp_path):
+    path = tmp_path / 'short.csv'
+    path.write_text('a,b\n1\n\n2,3\n')
+    rules = [
+        Rule(source='a', target='a', type=RuleType.Calculation),
+        Rule(source='b', target='b', type=RuleType.Calculation)
+    ]
+    result = CSVConverter(rules).convert(str(path))
+    assert result == [{'a': '1', 'b': 'None'}, {'a': '2', 'b': '3'}]
+
+
 def test_custom_encoder_date():
     expected = '{"date": "2020-01-01"}'
     date = datetime(2020, 1, 1)
     result = json.dumps({'date': date}, cls=CustomEncoder)
     assert result == expected
+
+
+def test_csv_converter_cache_stats(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('Name\nkale\nleek\nkale\nkale\n')
+    rules = [
+        Rule(
+            source='Name',
+            target='Name',
+            type=RuleType.Calculation,
+            operations=['s.title()'],
+            cache_size=10
+        ),
+        Rule(source='kg', target='Unit')
+    ]
+    converter = CSVConverter(rules)
+    result = converter.convert(str(path))
+    assert [row['Name'] for row in result] == ['Kale', 'Leek', 'Kale', 'Kale']
+    assert converter.cache_stats() == {
+        'Name': {
+            'hits': 2, 'misses': 2, 'evictions': 0, 'size': 2, 'maxsize': 10
+        }
+    }
+
+
+def test_csv_converter_folds_constants(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('Name,Count\nkale,1\nleek,x\n')
+    rules = [
+        Rule(source='kg', target='Unit', operations=['s.upper()']),
+        Rule(
+            source='Name',
+            target='Label',
+            type=RuleType.Calculation,
+            operations=['"item"']
+        ),
+        Rule(
+            source='Count',
+            target='Count',
+            type=RuleType.Calculation,
+            input_type=InputType.Integer,
+            output_type=OutputType.Integer,
+            operations=['5']
+        ),
+        Rule(source='kg', target='Bad', output_type=OutputType.Integer)
+    ]
+    for compiled in (True, False):
+        converter = CSVConverter(rules, compiled=compiled)
+        assert sorted(converter._constants) == [0, 1]
+        assert converter.convert(str(path)) == [
+            {'Unit': 'KG', 'Label': 'item', 'Count': 5, 'Bad': ''},
+            {'Unit': 'KG', 'Label': 'item', 'Count': '', 'Bad': ''},
+        ]
+        assert converter.errors.summary()['by_target'] == {
+            'Count': 1, 'Bad': 2
+        }
+
+
+def test_csv_converter_constant_operation_error():
+    rules = [
+        Rule(
+            source='Name',
+            target='Label',
+            type=RuleType.Calculation,
+            operations=['undefined_name']
+        )
+    ]
+    # raised once, rather than hidden and raised again on every row
+    for compiled in (True, False):
+        with pytest.raises(NameError):
+            CSVConverter(rules, compiled=compiled)
+
+
+def test_csv_converter_explain():
+    rules = load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH)
+    rules.append(Rule(source='Missing', target='M', type=RuleType.Calculation))
+    converter = CSVConverter(rules, missing_source='blank')
+    header = ['Order Number', 'Year', 'Month', 'Day', 'Product Number',
+              'Product Name', 'Count']
+    lines = converter.explain(header).splitlines()
+    assert "    'Count' as Decimal, 3 read(s) by 'Quantity', " \
+        "'Quantity ^2'" in lines
+    assert "    'Unit': constant 'kg'" in lines
+    assert "    'Quantity ^2': reads 'Count', 'Count'" in lines
+    assert "    'M': missing source, left blank" in lines
+
+
+TEST_FILTER_YAML_FILE_PATH = CWD + '/../examples/config/filter_rule.yaml'
+
+
+@pytest.fixture()
+def filter_csv(tmp_path):
+    # wide enough for only the columns read to be parsed
+    header = ['Order Number', 'Product Name', 'Count'] + \
+        ['Extra {}'.format(i) for i in range(10)]
+    lines = [','.join(header)]
+    for i in range(300):
+        count = 'n/a' if i % 25 == 0 else '"{:,}.5"'.format(i * 100)
+        lines.append(','.join(
+            [str(1000 + i), 'item {}'.format(i), count] + ['x'] * 10
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'compiled': False},
+    {'workers': 2},
+    {'vectorize': True},
+])
+def test_csv_converter_filters(filter_csv, options):
+    if options.get('vectorize'):
+        pytest.importorskip('numpy')
+    workers = options.pop('workers', 1)
+    rules = load_rules_from_yaml(TEST_FILTER_YAML_FILE_PATH)
+    converter = CSVConverter(rules, **options)
+    assert [rule.target for rule in converter.filters] == ['Large Orders']
+    assert converter.field_names == ['OrderId', 'ProductName', 'Quantity']
+
+    result = converter.convert(filter_csv, workers=workers)
+    unfiltered = CSVConverter(rules[1:]).convert(filter_csv)
+    expected = [
+        row for row in unfiltered
+        if row['Quantity'] != '' and row['Quantity'] >= 9000
+    ]
+    assert result == expected
+    assert converter.dropped_rows() == {'Large Orders': 300 - len(expected)}
+    # the n/a counts are reported by the filter, on their own lines
+    summary = converter.errors.summary()
+    assert summary['by_target'] == {'Large Orders': 12}
+
+
+def test_csv_converter_filter_error_lines(filter_csv, tmp_path):
+    pytest.importorskip('numpy')
+    lines = {}
+    for vectorize in (False, True):
+        sidecar = str(tmp_path / 'errors-{}.ndjson'.format(vectorize))
+        CSVConverter(
+            load_rules_from_yaml(TEST_FILTER_YAML_FILE_PATH),
+            vectorize=vectorize, batch_size=7,
+            errors=ErrorSink(max_messages=0, sidecar=sidecar)
+        ).convert(filter_csv)
+        with open(sidecar) as file:
+            lines[vectorize] = [json.loads(line)['line'] for line in file]
+    assert lines[False] == [2 + i for i in range(0, 300, 25)]
+    assert lines[True] == lines[False]
+
+
+def test_csv_converter_filter_missing_source(filter_csv):
+    rule = Rule(source='Missing', target='F', type=RuleType.Filter)
+    converter = CSVConverter(
+        [rule, Rule(source='kg', target='Unit')], missing_source='blank'
+    )
+    with pytest.raises(SourceNotFound):
+        converter.convert(filter_csv)
+
+
+def test_csv_converter_filters_chain(filter_csv):
+    rules = [
+        Rule(
+            source='Product Name', target='Odd', type=RuleType.Filter,
+            operations=['int(s.split()[1]) % 2']
+        ),
+        Rule(
+            source='Order Number', target='Below 1100', type=RuleType.Filter,
+            input_type=InputType.Integer, operations=['s < 1100']
+        ),
+        Rule(
+            source='Order Number', target='OrderId',
+            type=RuleType.Calculation
+        )
+    ]
+    converter = CSVConverter(rules)
+    result = converter.convert(filter_csv)
+    assert [row['OrderId'] for row in result] == \
+        [str(1000 + i) for i in range(1, 100, 2)]
+    # rows are counted by the first filter that drops them
+    assert converter.dropped_rows() == {'Odd': 150, 'Below 1100': 100}
+
+    lines = converter.explain(['Order Number', 'Product Name']).splitlines()
+    assert lines[0] == 'Filters, run first:'
+    assert lines[2] == "    'Below 1100': reads 'Order Number', " \
+        "keeps rows where s < 1100"
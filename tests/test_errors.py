@@ -0,0 +1,126 @@
+import json
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ErrorSink,
+    ErrorKind,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType
+)
+
+RULES = [
+    Rule(
+        source='Count',
+        target='Count',
+        type=RuleType.Calculation,
+        input_type=InputType.Integer,
+        output_type=OutputType.Integer
+    ),
+    Rule(
+        source=['Count', 'Name'],
+        target='Pair',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Decimal,
+        operations=['s[0] + s[1]']
+    ),
+    Rule(source='Missing', target='Missing', type=RuleType.Calculation),
+]
+
+
+@pytest.fixture()
+def dirty_csv(tmp_path):
+    lines = ['Count,Name']
+    for i in range(30):
+        # every other row has a bad count, row 11 has a quoted newline
+        count = 'x{}'.format(i) if i % 2 else str(i)
+        name = '"a\nb"' if i == 11 else '1'
+        lines.append('{},{}'.format(count, name))
+    path = tmp_path / 'dirty.csv'
+    path.write_text('\n'.join(lines))
+    return str(path)
+
+
+def test_error_sink_caps_messages(dirty_csv, capsys):
+    sink = ErrorSink(max_messages=3)
+    result = CSVConverter(RULES, errors=sink).convert(dirty_csv)
+    out = capsys.readouterr().out
+    assert len(result) == 30
+    assert out.count('Error executing') == 3
+    assert '28 more error(s) not shown, 31 error(s) in total' in out
+
+
+def test_error_sink_quiet(dirty_csv, capsys):
+    sink = ErrorSink(max_messages=3, quiet=True)
+    CSVConverter(RULES, errors=sink).convert(dirty_csv)
+    assert capsys.readouterr().out == ''
+    assert sink.total == 31
+    assert sink.printed == 0
+
+
+def test_error_sink_summary(dirty_csv):
+    converter = CSVConverter(RULES, errors=ErrorSink(max_messages=0))
+    converter.convert(dirty_csv)
+    assert converter.errors.summary() == {
+        'total': 31,
+        'printed': 0,
+        'by_target': {'Missing': 1, 'Count': 15, 'Pair': 15},
+        'by_kind': {'missing_source': 1, 'conversion': 30}
+    }
+
+
+def test_error_sink_resets_each_run(dirty_csv):
+    converter = CSVConverter(RULES, errors=ErrorSink(max_messages=0))
+    converter.convert(dirty_csv)
+    converter.convert(dirty_csv)
+    assert converter.errors.total == 31
+
+
+def read_sidecar(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'compiled': False},
+    {'vectorize': True, 'batch_size': 7},
+])
+def test_error_sink_sidecar(dirty_csv, tmp_path, options):
+    if options.get('vectorize'):
+        pytest.importorskip('numpy')
+    sidecar = str(tmp_path / 'errors.ndjson')
+    sink = ErrorSink(max_messages=0, sidecar=sidecar, batch_size=4)
+    CSVConverter(RULES, errors=sink, **options).convert(dirty_csv)
+
+    records = read_sidecar(sidecar)
+    assert len(records) == 31
+    assert records[0] == {
+        'line': None,
+        'target': 'Missing',
+        'value': 'Missing',
+        'kind': ErrorKind.MissingSource.value,
+        'details': 'Unable to retrieve source data from'
+    }
+    assert records[1]['line'] == 3
+    assert records[1]['target'] == 'Count'
+    assert records[1]['value'] == 'x1'
+    assert records[2]['value'] == ['x1', '1']
+    # row 11 ends a line later with its quoted newline, and so do the rest
+    assert [r['line'] for r in records[11:15]] == [14, 14, 16, 16]
+
+
+def test_error_sink_sidecar_parallel(dirty_csv, tmp_path):
+    serial = str(tmp_path / 'serial.ndjson')
+    parallel = str(tmp_path / 'parallel.ndjson')
+
+    CSVConverter(RULES, errors=ErrorSink(sidecar=serial)).convert(dirty_csv)
+    converter = CSVConverter(RULES, errors=ErrorSink(sidecar=parallel))
+    from csv_etl.parallel import iter_convert_parallel
+    converter.errors.start()
+    list(iter_convert_parallel(converter, dirty_csv, 2, chunk_size=20))
+    converter.errors.finish()
+
+    assert read_sidecar(parallel) == read_sidecar(serial)
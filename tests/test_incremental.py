@@ -0,0 +1,224 @@
+import io
+import os
+import json
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ErrorSink,
+    InputType,
+    LookupTable,
+    OutputType,
+    Rule,
+    RuleType,
+    load_rules_from_yaml
+)
+from csv_etl.incremental import (
+    Checkpoint,
+    complete_rows_end,
+    convert_incremental
+)
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+def order_lines(start, stop):
+    lines = []
+    for i in range(start, stop):
+        # every third product name has a quoted newline and escaped quotes
+        name = 'product {}'.format(i)
+        if i % 3 == 0:
+            name = '"product\n""{}"""'.format(i)
+        lines.append('{},2018,{},{},P-{},{},"{:,}.5"\r\n'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i, name, i * 1000
+        ))
+    return ''.join(lines)
+
+
+@pytest.fixture()
+def converter():
+    return CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+
+
+@pytest.fixture()
+def paths(tmp_path):
+    return str(tmp_path / 'orders.csv'), str(tmp_path / 'orders.ndjson')
+
+
+def append(path, text):
+    with open(path, 'ab') as file:
+        file.write(text.encode())
+
+
+def full_conversion(converter, csv_file, tmp_path, to='ndjson'):
+    outfile = str(tmp_path / 'full')
+    converter.convert(csv_file, to=to, outfile=outfile)
+    with open(outfile, newline='') as file:
+        return file.read()
+
+
+def read(path):
+    with open(path, newline='') as file:
+        return file.read()
+
+
+def test_complete_rows_end_skips_partial_row():
+    data = b'a,b\n1,"x\ny"\n2,"partial\n'
+    assert complete_rows_end(io.BytesIO(data), 4) == 12
+
+
+@pytest.mark.parametrize('to', ['csv', 'ndjson'])
+def test_appended_rows(converter, paths, tmp_path, to):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 100))
+
+    assert converter.convert_incremental(csv_file, outfile, to=to) == 100
+    append(csv_file, order_lines(100, 250))
+    assert converter.convert_incremental(csv_file, outfile, to=to) == 150
+    assert converter.convert_incremental(csv_file, outfile, to=to) == 0
+
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path, to)
+
+    checkpoint = Checkpoint.load(outfile + '.checkpoint')
+    assert checkpoint.rows == 250
+    assert checkpoint.offset == os.path.getsize(csv_file)
+    assert checkpoint.output_offset == os.path.getsize(outfile)
+
+
+def test_partial_row_left_for_next_run(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    rows = order_lines(0, 10)
+    append(csv_file, HEADER + rows[:-20])
+
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 9
+    append(csv_file, rows[-20:])
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 1
+
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+
+
+def test_resumes_after_crash(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 300))
+
+    # stop part way through, after some checkpoints were saved
+    original = converter.plan
+
+    def crash_later(header, indexes=None):
+        plan = original(header, indexes)
+        convert_row = plan.convert_row
+        calls = []
+
+        def convert(row):
+            calls.append(row)
+            if len(calls) > 200:
+                raise KeyboardInterrupt
+            return convert_row(row)
+
+        plan.convert_row = convert
+        return plan
+
+    converter.plan = crash_later
+    with pytest.raises(KeyboardInterrupt):
+        convert_incremental(converter, csv_file, outfile, 'ndjson',
+                            chunk_size=1000)
+    converter.plan = original
+    converter._plans = {}
+
+    checkpoint = Checkpoint.load(outfile + '.checkpoint')
+    assert 0 < checkpoint.rows < 200
+
+    written = convert_incremental(
+        converter, csv_file, outfile, 'ndjson', chunk_size=1000
+    )
+    assert written == 300 - checkpoint.rows
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+
+
+def test_rules_changed_rebuilds(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 50))
+    converter.convert_incremental(csv_file, outfile, 'ndjson')
+
+    converter = CSVConverter(converter.rules[:-1])
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 50
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+
+
+def test_lookup_changed_rebuilds(paths, tmp_path):
+    csv_file, outfile = paths
+    products = tmp_path / 'products.csv'
+    products.write_text('Product Number,Category\n' + ''.join(
+        'P-{},old {}\n'.format(i, i) for i in range(100)
+    ))
+
+    def lookup_converter():
+        # a new table, the same as a later run loading the config again
+        table = LookupTable(str(products), 'Product Number', 'Category')
+        return CSVConverter([Rule(
+            source='Product Number', target='Category',
+            type=RuleType.Lookup, input_type=InputType.String,
+            output_type=OutputType.String, lookup=table
+        )], errors=ErrorSink(max_messages=0))
+
+    append(csv_file, HEADER + order_lines(0, 50))
+    lookup_converter().convert_incremental(csv_file, outfile, 'ndjson')
+
+    products.write_text(products.read_text().replace('old', 'new'))
+    os.utime(str(products), ns=(0, 0))
+    append(csv_file, order_lines(50, 60))
+    converter = lookup_converter()
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 60
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+    assert '"old' not in read(outfile)
+
+
+def test_rewritten_csv_rebuilds(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 50))
+    converter.convert_incremental(csv_file, outfile, 'ndjson')
+
+    with open(csv_file, 'wb') as file:
+        file.write((HEADER + order_lines(10, 70)).encode())
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 60
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+
+
+def test_header_changed_rebuilds(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 50))
+    converter.convert_incremental(csv_file, outfile, 'csv')
+
+    with open(csv_file, 'wb') as file:
+        file.write((HEADER.replace('Count', 'Count ') +
+                    order_lines(0, 50)).encode())
+    assert converter.convert_incremental(csv_file, outfile, 'csv') == 50
+    assert read(outfile) == full_conversion(
+        converter, csv_file, tmp_path, 'csv'
+    )
+
+
+def test_invalid_checkpoint_rebuilds(converter, paths, tmp_path):
+    csv_file, outfile = paths
+    append(csv_file, HEADER + order_lines(0, 20))
+    with open(outfile, 'w') as file:
+        file.write('stale output\n')
+    with open(outfile + '.checkpoint', 'w') as file:
+        json.dump(['not', 'a', 'checkpoint'], file)
+
+    assert converter.convert_incremental(csv_file, outfile, 'ndjson') == 20
+    assert read(outfile) == full_conversion(converter, csv_file, tmp_path)
+
+
+@pytest.mark.parametrize('to, outfile', [
+    ('json', 'orders.json'),
+    ('ndjson', 'orders.ndjson.gz'),
+])
+def test_not_appendable(converter, paths, tmp_path, to, outfile):
+    csv_file, _ = paths
+    append(csv_file, HEADER)
+    with pytest.raises(ValueError):
+        converter.convert_incremental(csv_file, str(tmp_path / outfile), to)
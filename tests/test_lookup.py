@@ -0,0 +1,248 @@
+import os
+import pickle
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ConversionStats,
+    ErrorSink,
+    LookupTable,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType,
+    SourceNotFound,
+    load_rules_from_yaml
+)
+from csv_etl.rules import NOT_FOUND
+
+CWD = os.path.dirname(__file__)
+
+TEST_LOOKUP_YAML_FILE_PATH = CWD + '/../examples/config/lookup_rule.yaml'
+
+HEADER = 'Order Number,Product Number,Region,Count\r\n'
+
+
+@pytest.fixture()
+def products_csv(tmp_path):
+    lines = ['Product Number,Region,Category\r\n']
+    for i in range(500):
+        lines.append('P-{},{},category {}\r\n'.format(i, i % 2, i % 7))
+    path = tmp_path / 'products.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+@pytest.fixture()
+def orders_csv(tmp_path):
+    lines = [HEADER]
+    # products P-500 to P-549 aren't in products.csv
+    for i in range(2000):
+        product = i % 550
+        lines.append('{},P-{},{},{}\r\n'.format(
+            1000 + i, product, product % 2, i
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def lookup_rule(table, **options):
+    return Rule(
+        source='Product Number', target='Category', type=RuleType.Lookup,
+        input_type=InputType.String, output_type=OutputType.String,
+        lookup=table, **options
+    )
+
+
+def expected_categories(count=2000):
+    categories = []
+    for i in range(count):
+        product = i % 550
+        categories.append(
+            'category {}'.format(product % 7) if product < 500 else ''
+        )
+    return categories
+
+
+def convert(rules, orders_csv, **options):
+    converter = CSVConverter(
+        rules, errors=ErrorSink(max_messages=0), **options
+    )
+    return converter, converter.convert(orders_csv)
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+def test_lookup_in_memory(products_csv, orders_csv, compiled):
+    table = LookupTable(products_csv, 'Product Number', 'Category')
+    converter, result = convert(
+        [lookup_rule(table)], orders_csv, compiled=compiled
+    )
+    assert [row['Category'] for row in result] == expected_categories()
+
+    # keys without a match are conversion errors
+    assert converter.errors.total == 150
+    stats = converter.lookup_stats()['Category']
+    assert stats['backend'] == 'memory'
+    assert stats['rows'] == 500
+    assert stats['lookups'] == 2000
+    assert stats['hits'] == 2000 - converter.errors.total
+    assert stats['hit_rate'] == pytest.approx(stats['hits'] / 2000)
+    assert stats['build_seconds'] > 0
+    assert 'cache' not in stats
+
+
+def test_lookup_sqlite(products_csv, orders_csv, tmp_path):
+    table = LookupTable(
+        products_csv, 'Product Number', 'Category', memory_limit=1000,
+        cache_size=100
+    )
+    converter, result = convert([lookup_rule(table)], orders_csv)
+    assert [row['Category'] for row in result] == expected_categories()
+
+    stats = converter.lookup_stats()['Category']
+    assert stats['backend'] == 'sqlite'
+    assert stats['rows'] == 500
+    assert stats['lookups'] == 2000
+    assert stats['cache']['misses'] == 2000
+    assert stats['cache']['evictions'] > 0
+
+    directory = os.path.dirname(table._db_path)
+    assert os.path.exists(table._db_path)
+    table.close()
+    assert not os.path.exists(directory)
+
+
+def test_lookup_default_and_keys(products_csv, orders_csv):
+    table = LookupTable(
+        products_csv, ['Product Number', 'Region'], 'Category',
+        default='none', memory_limit=1000
+    )
+    rule = lookup_rule(table)
+    rule.source = ['Product Number', 'Region']
+    # the key is compared as strings, after the operations
+    rule.operations = ['[s[0], int(s[1])]']
+
+    converter, result = convert([rule], orders_csv)
+    assert converter.errors.total == 0
+    expected = [value or 'none' for value in expected_categories()]
+    assert [row['Category'] for row in result] == expected
+
+
+def test_lookup_index_dir(products_csv, tmp_path):
+    index_dir = str(tmp_path / 'indexes')
+    table = LookupTable(
+        products_csv, 'Product Number', 'Category', memory_limit=1,
+        index_dir=index_dir
+    )
+    assert table.get('P-3') == 'category 3'
+    assert table.get('P-999') is NOT_FOUND
+    path = table._db_path
+    assert os.listdir(index_dir) == [os.path.basename(path)]
+
+    # reused while products.csv is unchanged
+    reused = LookupTable(
+        products_csv, 'Product Number', 'Category', memory_limit=1,
+        index_dir=index_dir
+    )
+    reused.load()
+    assert reused._db_path == path
+    assert reused.rows == 500
+    assert reused.get('P-3') == 'category 3'
+
+    with open(products_csv, 'a') as file:
+        file.write('P-999,1,new\r\n')
+    os.utime(products_csv, ns=(0, 0))
+    changed = LookupTable(
+        products_csv, 'Product Number', 'Category', memory_limit=1,
+        index_dir=index_dir
+    )
+    assert changed.get('P-999') == 'new'
+    assert changed._db_path != path
+    table.close()
+    assert os.path.exists(path)
+
+
+@pytest.mark.parametrize('memory_limit', [None, 1000])
+def test_lookup_workers(products_csv, orders_csv, memory_limit):
+    options = {} if memory_limit is None else {'memory_limit': memory_limit}
+    table = LookupTable(products_csv, 'Product Number', 'Category', **options)
+    converter = CSVConverter(
+        [lookup_rule(table)], errors=ErrorSink(max_messages=0)
+    )
+    result = converter.convert(orders_csv, workers=2)
+    assert [row['Category'] for row in result] == expected_categories()
+    stats = converter.lookup_stats()['Category']
+    assert stats['lookups'] == 2000
+    assert stats['hits'] == 2000 - converter.errors.total
+
+
+@pytest.mark.parametrize('profile_rules', [False, True])
+def test_lookup_cached_rule(products_csv, tmp_path, profile_rules):
+    # every row has the same key
+    csv_file = tmp_path / 'repeated.csv'
+    csv_file.write_bytes((HEADER + '1000,P-3,1,1\r\n' * 20).encode())
+    table = LookupTable(products_csv, 'Product Number', 'Category')
+    stats = ConversionStats(profile_rules=profile_rules)
+    converter, result = convert(
+        [lookup_rule(table, cache_size=1000)], str(csv_file), stats=stats
+    )
+    assert [row['Category'] for row in result] == ['category 3'] * 20
+    # the rule's cache is skipped, so each row is counted
+    assert 'Category' not in converter.cache_stats()
+    assert table.lookups == 20
+    assert table.hits == 20
+    assert stats.lookups['Category']['lookups'] == 20
+
+
+def test_lookup_missing_column(products_csv, orders_csv):
+    table = LookupTable(products_csv, 'Product Number', 'Missing')
+    with pytest.raises(SourceNotFound):
+        convert([lookup_rule(table)], orders_csv)
+
+
+def test_lookup_pickle(products_csv):
+    table = LookupTable(
+        products_csv, 'Product Number', 'Category', memory_limit=1
+    )
+    table.load()
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy._connection is None
+    assert copy.get('P-1') == 'category 1'
+    assert copy.get('P-999') is NOT_FOUND
+    assert pickle.loads(pickle.dumps(NOT_FOUND)) is NOT_FOUND
+    table.close()
+
+
+def test_lookup_stats(products_csv, orders_csv):
+    table = LookupTable(products_csv, 'Product Number', 'Category')
+    expected = expected_categories()
+    for profile_rules in (False, True):
+        stats = ConversionStats(profile_rules=profile_rules)
+        _, result = convert([lookup_rule(table)], orders_csv, stats=stats)
+        assert [row['Category'] for row in result] == expected
+        assert stats.lookups['Category']['lookups'] == 2000
+        assert "lookup 'Category' 2,000 lookup(s)" in stats.format()
+
+
+def test_load_lookup_rule_from_yaml(tmp_path):
+    rules = load_rules_from_yaml(TEST_LOOKUP_YAML_FILE_PATH)
+    table = rules[2].lookup
+    assert rules[2].type == RuleType.Lookup
+    assert table.path == os.path.normpath(
+        CWD + '/../examples/order_data/product_categories.csv'
+    )
+    assert table.default == 'Uncategorized'
+    assert rules[0].lookup is None
+
+    cache_dir = str(tmp_path)
+    load_rules_from_yaml(TEST_LOOKUP_YAML_FILE_PATH, cache_dir=cache_dir)
+    cached = load_rules_from_yaml(
+        TEST_LOOKUP_YAML_FILE_PATH, cache_dir=cache_dir
+    )
+    assert [rule.as_dict() for rule in cached] == \
+        [rule.as_dict() for rule in rules]
+
+    result = CSVConverter(cached).convert(
+        CWD + '/../examples/order_data/test_data.csv'
+    )
+    assert [row['Category'] for row in result] == ['Leafy greens', 'Lettuce']
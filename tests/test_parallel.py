@@ -0,0 +1,85 @@
+import io
+import os
+import pytest
+from csv_etl import CSVConverter, load_rules_from_yaml
+from csv_etl.parallel import (
+    iter_convert_parallel,
+    iter_row_ranges,
+    read_header
+)
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    lines = [HEADER]
+    for i in range(500):
+        # every third product name has a quoted newline and escaped quotes
+        name = 'product {}'.format(i)
+        if i % 3 == 0:
+            name = '"product\n""{}"""'.format(i)
+        lines.append('{},2018,{},{},P-{},{},"{:,}.5"\r\n'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i, name, i * 1000
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def test_read_header_quoted_newline():
+    file = io.BytesIO(b'"a\nb",c\n1,2\n')
+    header, start, lines = read_header(file)
+    assert header == ['a\nb', 'c']
+    assert start == 8
+    assert lines == 2
+
+
+def test_read_header_empty():
+    header, start, lines = read_header(io.BytesIO(b''))
+    assert header is None
+
+
+def test_iter_row_ranges_quoted_newlines():
+    data = b'1,"x\ny\n"",z"\n2,b\n3,"\n"\n'
+    ranges = list(iter_row_ranges(io.BytesIO(data), 0, chunk_size=3))
+    assert ranges == [(0, 13), (13, 17), (17, len(data))]
+
+
+def test_iter_row_ranges_cover_file(order_csv):
+    with open(order_csv, 'rb') as file:
+        _, start, _ = read_header(file)
+        ranges = list(iter_row_ranges(file, start, chunk_size=1000))
+    assert len(ranges) > 1
+    assert ranges[0][0] == start
+    assert ranges[-1][1] == os.path.getsize(order_csv)
+    for previous, current in zip(ranges, ranges[1:]):
+        assert previous[1] == current[0]
+
+
+def test_iter_convert_parallel_matches_serial(order_csv):
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    expected = list(converter.iter_convert(order_csv))
+    result = list(
+        iter_convert_parallel(converter, order_csv, 3, chunk_size=1000)
+    )
+    assert len(result) == 500
+    assert result == expected
+
+
+@pytest.mark.parametrize('to', ['csv', 'json'])
+def test_convert_workers(order_csv, to):
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    expected = converter.convert(order_csv, to=to)
+    assert converter.convert(order_csv, to=to, workers=2) == expected
+
+
+def test_iter_convert_parallel_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_bytes(b'')
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    assert list(iter_convert_parallel(converter, str(path), 2)) == []
@@ -0,0 +1,293 @@
+import os
+import pytest
+from csv_etl import (
+    CSVConverter,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType,
+    ConversionError,
+    load_rules_from_yaml
+)
+from csv_etl.csv_etl import MISSING
+from csv_etl.plan import RowPlan, FilterPlan, Constant
+
+CWD = os.path.dirname(__file__)
+
+TEST_CONFIG_DIR = CWD + '/../examples/config/'
+
+HEADER = ['Order Number', 'Year', 'Month', 'Day', 'Product Name', 'Count']
+
+ROWS = [
+    ['1000', '2018', '1', '1', 'arugola', '5,250.50'],
+    ['1001', '2017', '12', '12', 'iceberg lettuce', '500.00'],
+    ['x', '2017', '12', '12', '', 'five'],
+    ['1002.5', '', '13', '1', 'kale', '-1'],
+    ['1003', '2020', '2', '30', 'kale', '1e3'],
+]
+
+RULES = [
+    Rule(source='Count', target='Count', type=RuleType.Calculation),
+    Rule(
+        source='Order Number',
+        target='OrderId',
+        type=RuleType.Calculation,
+        input_type=InputType.Integer,
+        output_type=OutputType.Integer
+    ),
+    Rule(
+        source='Count',
+        target='Whole',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Integer,
+        operations=['s * 2', 's - 1']
+    ),
+    Rule(
+        source=['Count'],
+        target='Listed',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.String,
+        operations=['s[0]']
+    ),
+    Rule(
+        source='Product Name',
+        target='Initials',
+        type=RuleType.Calculation,
+        operations=['"".join([w[:1] for w in s.split()]).upper()']
+    ),
+    Rule(
+        source='kg',
+        target='Unit',
+        type=RuleType.Static,
+        operations=['s.upper()']
+    ),
+    Rule(
+        source=10,
+        target='Ten',
+        type=RuleType.Static,
+        output_type=OutputType.Decimal
+    ),
+    Rule(
+        source='Count',
+        target='Count',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Decimal
+    ),
+]
+
+
+def expected_rows(rules, header, rows):
+    '''Converts rows one rule at a time through Rule.execute'''
+    result = []
+    for row in rows:
+        data = dict(zip(header, row))
+        row_result = {}
+        for rule in rules:
+            try:
+                k, v = rule.execute(data)
+                row_result[k] = v
+            except ConversionError:
+                row_result[rule.target] = ''
+        result.append(row_result)
+    return result
+
+
+def build_plan(rules, header, errors=None):
+    indexes = [rule.resolve_source(header) for rule in rules]
+
+    def on_error(rule, row, error, i):
+        if errors is not None:
+            errors.append((rule.target, error.custom_message))
+
+    return RowPlan(rules, indexes, on_error, MISSING)
+
+
+def test_plan_matches_rule_execute():
+    plan = build_plan(RULES, HEADER)
+    result = [plan.convert_row(row) for row in ROWS]
+    assert result == expected_rows(RULES, HEADER, ROWS)
+
+
+def test_plan_result_types_match():
+    plan = build_plan(RULES, HEADER)
+    for row, expected in zip(ROWS, expected_rows(RULES, HEADER, ROWS)):
+        result = plan.convert_row(row)
+        assert list(result) == list(expected)
+        for key in expected:
+            assert type(result[key]) is type(expected[key])
+
+
+def test_plan_reports_same_errors():
+    errors = []
+    plan = build_plan(RULES, HEADER, errors)
+    plan.convert_row(ROWS[2])
+
+    expected = []
+    data = dict(zip(HEADER, ROWS[2]))
+    for rule in RULES:
+        try:
+            rule.execute(data)
+        except ConversionError as e:
+            expected.append((rule.target, e.custom_message))
+
+    assert errors == expected
+    assert len(errors) == 4
+
+
+@pytest.mark.parametrize('operation', [
+    'datetime(2020, 1, 1)',
+    '_c_row',
+    '_c_on_error',
+])
+def test_plan_uninlinable_operations_raise_like_rule(operation):
+    rule = Rule(
+        source='Count',
+        target='Target',
+        type=RuleType.Calculation,
+        operations=[operation]
+    )
+    plan = build_plan([rule], HEADER)
+    with pytest.raises(NameError):
+        rule.execute(dict(zip(HEADER, ROWS[0])))
+    with pytest.raises(NameError):
+        plan.convert_row(ROWS[0])
+
+
+def test_plan_date_operations():
+    rule = Rule(
+        source=['Day', 'Month', 'Year'],
+        target='OrderDate',
+        type=RuleType.Calculation,
+        input_type=InputType.Integer,
+        output_type=OutputType.Date,
+        operations=['datetime(s[2], s[1], s[0])']
+    )
+    plan = build_plan([rule], HEADER)
+    expected = expected_rows([rule], HEADER, ROWS[:1])
+    assert plan.convert_row(ROWS[0]) == expected[0]
+    with pytest.raises(ValueError):
+        plan.convert_row(ROWS[4])
+
+
+def test_plan_missing_source():
+    plan = RowPlan(RULES[:2], [MISSING, 0], None, MISSING)
+    assert plan.convert_row(ROWS[0]) == {'Count': '', 'OrderId': 1000}
+
+
+@pytest.mark.parametrize('config', sorted(os.listdir(TEST_CONFIG_DIR)))
+def test_converter_compiled_matches_interpreted(config, tmp_path, capsys):
+    path = tmp_path / 'data.csv'
+    lines = ['Order Number,Year,Month,Day,Product Number,Product Name,Count']
+    for i in range(50):
+        count = '"{:,}.25"'.format(i * 1000) if i % 7 else 'n/a'
+        lines.append('{},2019,{},{},P-{},item {},{}'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i, i, count
+        ))
+    path.write_text('\n'.join(lines))
+    rules = load_rules_from_yaml(TEST_CONFIG_DIR + config)
+
+    interpreted = CSVConverter(rules, compiled=False).convert(str(path))
+    interpreted_errors = capsys.readouterr().out
+    compiled = CSVConverter(rules).convert(str(path))
+    compiled_errors = capsys.readouterr().out
+
+    assert compiled == interpreted
+    assert compiled_errors == interpreted_errors
+
+
+def test_plan_cached_rules():
+    rules = [
+        Rule(
+            source=rule.source,
+            target=rule.target,
+            type=rule.type,
+            input_type=rule.input_type,
+            output_type=rule.output_type,
+            operations=rule.operations,
+            cache_size=2
+        )
+        for rule in RULES
+    ]
+    rows = ROWS + ROWS[::-1]
+    expected_errors = []
+    plan = build_plan(RULES, HEADER, expected_errors)
+    expected = [plan.convert_row(row) for row in rows]
+
+    errors = []
+    plan = build_plan(rules, HEADER, errors)
+    assert [plan.convert_row(row) for row in rows] == expected
+    assert errors == expected_errors
+    assert sum(rule.cache.hits for rule in rules if rule.cache) > 0
+
+
+def test_plan_constant():
+    plan = RowPlan(RULES[:2], [Constant('x'), 0], None, MISSING)
+    assert plan.convert_row(ROWS[0]) == {'Count': 'x', 'OrderId': 1000}
+
+
+def test_plan_shared_casts():
+    plan = build_plan(RULES, HEADER)
+    shared = {
+        (HEADER[position], input_type.value): targets
+        for position, input_type, targets in plan.shared
+    }
+    assert shared[('Count', 'String')] == ['Count']
+    assert shared[('Count', 'Decimal')] == ['Whole', 'Listed', 'Count']
+    assert plan.source.count('_c_row[5]') == 2
+
+
+def test_plan_shared_cast_errors():
+    rules = [
+        Rule(
+            source=source,
+            target=target,
+            type=RuleType.Calculation,
+            input_type=InputType.Decimal,
+            output_type=OutputType.Decimal
+        )
+        for source, target in [
+            ('Count', 'A'), (['Count', 'Count'], 'B'), ('Count', 'C')
+        ]
+    ]
+    errors = []
+    plan = build_plan(rules, HEADER, errors)
+    assert plan.convert_row(ROWS[2]) == {'A': '', 'B': '', 'C': ''}
+    assert [target for target, message in errors] == ['A', 'B', 'C']
+    assert all('value: five' in message for target, message in errors)
+
+
+def test_filter_plan():
+    filters = [
+        Rule(
+            source='Count', target='Numeric', type=RuleType.Filter,
+            input_type=InputType.Decimal, operations=['s > 0']
+        ),
+        Rule(
+            source=['Year', 'Product Name'], target='Kale 2020',
+            type=RuleType.Filter, operations=['s != ["2020", "kale"]']
+        ),
+    ]
+    indexes = [filter.resolve_source(HEADER) for filter in filters]
+    errors = []
+    dropped = [0, 0]
+    plan = FilterPlan(
+        filters, indexes,
+        lambda rule, row, error, i: errors.append((rule.target, row[0])),
+        dropped
+    )
+
+    kept = [row[0] for row in ROWS if plan.keep(row)]
+    assert kept == ['1000', '1001']
+    assert errors == [('Numeric', 'x')]
+    # each row is counted by the first filter that drops it
+    assert dropped == [2, 1]
+
+
+def test_filter_plan_no_operations():
+    rule = Rule(source='Product Name', target='Named', type=RuleType.Filter)
+    plan = FilterPlan([rule], [4], None, [0])
+    assert [row[0] for row in ROWS if plan.keep(row)] == \
+        ['1000', '1001', '1002.5', '1003']
@@ -0,0 +1,110 @@
+import io
+import os
+import csv
+import pytest
+from csv_etl import CSVConverter, Rule, RuleType, load_rules_from_yaml
+from csv_etl import readers
+from csv_etl.readers import ProjectedReader, project
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+DATA = (
+    'a,b,c,d,e\r\n'
+    '1,2,3,4,5\r\n'
+    '\r\n'
+    '1,"two\r\nlines",3,"4,5",6\r\n'
+    '1,2\n'
+    ',,,,\r'
+    '"x""y",2,3,4,5\n'
+    '1,2,3,4,5,6,7'
+)
+
+
+def csv_rows(data, positions):
+    '''The rows csv.reader reads, projected and padded'''
+    reader = csv.reader(io.StringIO(data, newline=''))
+    rows = []
+    for row in reader:
+        if not row:
+            rows.append(([], reader.line_num))
+            continue
+        row = row + [None] * (positions[-1] + 1 - len(row))
+        rows.append((tuple(row[p] for p in positions), reader.line_num))
+    return rows
+
+
+@pytest.mark.parametrize('positions', [[0], [1], [4], [0, 2], [1, 3, 4]])
+def test_projected_reader_matches_csv_reader(positions):
+    reader = ProjectedReader(io.StringIO(DATA, newline=''), positions)
+    rows = [(row, reader.line_num) for row in reader]
+    assert rows == csv_rows(DATA, positions)
+
+
+def test_projected_reader_line_num_offset():
+    file = io.StringIO(DATA, newline='')
+    header = csv.reader(file)
+    next(header)
+    reader = ProjectedReader(file, [1], header.line_num)
+    rows = list(reader)
+    assert rows[0] == ('2',)
+    assert reader.line_num == 9
+
+
+def test_project():
+    header = ['a', 'b', 'c', 'd', 'e', 'f']
+    positions, header, indexes = project(header, [4, None, [1, 4], 'x'])
+    assert positions == [1, 4]
+    assert header == ['b', 'e']
+    assert indexes == [1, None, [0, 1], 'x']
+
+
+def test_project_most_columns():
+    header = ['a', 'b', 'c']
+    assert project(header, [0, 1]) == (None, header, [0, 1])
+    assert project(header, [None]) == (None, header, [None])
+
+
+@pytest.fixture()
+def wide_csv(tmp_path):
+    header = ['Column {}'.format(i) for i in range(40)]
+    header[3] = 'Count'
+    header[10] = 'Product Name'
+    header[25] = 'Order Number'
+    header[30:33] = ['Day', 'Month', 'Year']
+    header[38] = 'Product Number'
+    lines = [','.join(header)]
+    for i in range(300):
+        values = [str(i * j) for j in range(40)]
+        values[3] = '"{:,}.5"'.format(i * 1000) if i % 3 else 'n/a'
+        values[10] = 'item {}'.format(i)
+        values[30:33] = [str(i % 28 + 1), str(i % 12 + 1), '2019']
+        if i % 7 == 0:
+            values = values[:34]
+        lines.append(','.join(values))
+    path = tmp_path / 'wide.csv'
+    path.write_text('\n'.join(lines))
+    return str(path)
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'compiled': False}, {'workers': 2},
+])
+def test_converter_projection_matches_full_read(
+    wide_csv, options, monkeypatch, capsys
+):
+    rules = load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH)
+    rules.append(Rule(source='Column 39', target='Last',
+                      type=RuleType.Calculation))
+    workers = options.pop('workers', 1)
+
+    projected = CSVConverter(rules, **options)
+    result = projected.convert(wide_csv, workers=workers)
+    summary = projected.errors.summary()
+
+    monkeypatch.setattr(readers, 'PROJECTION_MAX_FRACTION', 0)
+    full = CSVConverter(rules, **options)
+    assert result == full.convert(wide_csv, workers=workers)
+    assert summary == full.errors.summary()
+    assert summary['total'] > 0
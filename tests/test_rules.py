@@ -1,16 +1,24 @@
 import os
+import pickle
 import pytest
 from csv_etl import (
     Rule,
     load_rules_from_yaml,
     SourceNotFound,
+    InvalidOperation,
+    ConversionError,
     RuleType,
     InputType,
     OutputType
 )
 from datetime import datetime
 
-TEST_YAML_FILE_PATH = os.path.dirname(__file__) + '/resources/test_config.yaml'
+CWD = os.path.dirname(__file__)
+
+TEST_YAML_FILE_PATH = CWD + '/resources/test_config.yaml'
+TEST_INVALID_YAML_FILE_PATH = CWD + '/resources/test_invalid_operation.yaml'
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+TEST_FILTER_YAML_FILE_PATH = CWD + '/../examples/config/filter_rule.yaml'
 
 
 def test_static_rule():
@@ -155,3 +163,313 @@ def test_load_rules_from_yaml():
         'source': 'Test Source',
         'operations': []
     }
+
+
+def test_calculation_rule_multiple_operations():
+    test_data = {'Count': '20'}
+    rule = Rule(
+        source='Count',
+        target='Target',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Decimal,
+        operations=['s / 2', 's + 5']
+    )
+    t, v = rule.execute(test_data)
+    assert t == 'Target'
+    assert v == float(15)
+
+
+def test_rule_operations_reassigned():
+    rule = Rule(
+        source='test',
+        target='Target',
+        type=RuleType.Calculation,
+        operations=['s.title()']
+    )
+    rule.operations = ['s.upper()']
+    t, v = rule.execute({'test': 'test value'})
+    assert v == 'TEST VALUE'
+
+
+def test_rule_datetime_only_for_date_output():
+    rule = Rule(
+        source=['day', 'month', 'year'],
+        target='Target',
+        type=RuleType.Calculation,
+        input_type=InputType.Integer,
+        output_type=OutputType.String,
+        operations=['datetime(s[2], s[1], s[0])']
+    )
+    with pytest.raises(NameError):
+        rule.execute({'day': '1', 'month': '1', 'year': '2020'})
+
+
+def test_rule_raise_invalid_operation():
+    with pytest.raises(InvalidOperation) as e:
+        Rule(
+            source='test',
+            target='Target',
+            type=RuleType.Calculation,
+            operations=['s.title()', 's +']
+        )
+    assert e.value.target == 'Target'
+    assert e.value.operation == 's +'
+
+
+def test_load_rules_from_yaml_raise_invalid_operation():
+    with pytest.raises(InvalidOperation):
+        load_rules_from_yaml(TEST_INVALID_YAML_FILE_PATH)
+
+
+def test_rule_pickle():
+    rule = Rule(
+        source='Count',
+        target='Target',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Decimal,
+        operations=['s / 2', 's + 5']
+    )
+    rule = pickle.loads(pickle.dumps(rule))
+    t, v = rule.execute({'Count': '20'})
+    assert v == float(15)
+
+
+def test_rule_resolve_source():
+    header = ['Day', 'Month', 'Year', 'Count']
+    single = Rule(source='Count', target='T', type=RuleType.Calculation)
+    multiple = Rule(
+        source=['Day', 'Month', 'Year'],
+        target='T',
+        type=RuleType.Calculation
+    )
+    static = Rule(source='kg', target='T', type=RuleType.Static)
+    assert single.resolve_source(header) == 3
+    assert multiple.resolve_source(header) == [0, 1, 2]
+    assert static.resolve_source(header) is None
+
+
+def test_rule_resolve_source_raise_source_not_found():
+    rule = Rule(
+        source=['day', 'month', 'year'],
+        target='Target',
+        type=RuleType.Calculation
+    )
+    with pytest.raises(SourceNotFound):
+        rule.resolve_source(['day', 'm', 'y'])
+
+
+def test_rule_execute_row():
+    rule = Rule(
+        source=['num1', 'num2'],
+        target='Target',
+        type=RuleType.Calculation,
+        input_type=InputType.Decimal,
+        output_type=OutputType.Decimal,
+        operations=['s[0] * s[1]']
+    )
+    index = rule.resolve_source(['num2', 'num1'])
+    t, v = rule.execute_row(['6,123', '2'], index)
+    assert t == 'Target'
+    assert v == float(12246)
+
+
+def test_rule_cache():
+    rule = Rule(
+        source='name',
+        target='Target',
+        type=RuleType.Calculation,
+        operations=['s.title()'],
+        cache_size=2
+    )
+    for value in ['kale', 'kale', 'leek', 'okra', 'kale']:
+        t, v = rule.execute_row([value], 0)
+        assert v == value.title()
+    t, v = rule.execute({'name': 'okra'})
+    assert v == 'Okra'
+    assert rule.cache.stats() == {
+        'hits': 2, 'misses': 4, 'evictions': 2, 'size': 2, 'maxsize': 2
+    }
+
+
+def test_rule_cache_skips_errors():
+    rule = Rule(
+        source=['a', 'b'],
+        target='Target',
+        type=RuleType.Calculation,
+        input_type=InputType.Integer,
+        output_type=OutputType.Integer,
+        operations=['s[0] + s[1]'],
+        cache_size=10
+    )
+    for _ in range(2):
+        with pytest.raises(ConversionError):
+            rule.execute_row(['x', '1'], [0, 1])
+    assert rule.execute_row(['1', '1'], [0, 1]) == ('Target', 2)
+    assert rule.execute_row(['1', '1'], [0, 1]) == ('Target', 2)
+    assert rule.cache.stats()['hits'] == 1
+    assert len(rule.cache) == 1
+
+
+def test_rule_cache_off():
+    static = Rule(source='kg', target='Unit', cache_size=10)
+    calculation = Rule(
+        source='name', target='T', type=RuleType.Calculation, cache_size=0
+    )
+    assert static.cache is None
+    assert calculation.cache is None
+    assert 'cache_size' not in calculation.as_dict()
+
+
+def test_rule_cache_pickle():
+    rule = Rule(
+        source='name', target='T', type=RuleType.Calculation, cache_size=5
+    )
+    rule.execute_row(['kale'], 0)
+    rule = pickle.loads(pickle.dumps(rule))
+    assert rule.cache.stats()['size'] == 0
+    assert rule.cache.maxsize == 5
+
+
+def test_load_rules_from_yaml_cache_size(tmp_path):
+    path = tmp_path / 'config.yaml'
+    path.write_text('\n'.join([
+        'cache_size: 100',
+        'rules:',
+        '  - {target: A, type: Calculation, input_type: String,',
+        '     output_type: String, source: a}',
+        '  - {target: B, type: Calculation, input_type: String,',
+        '     output_type: String, source: b, cache_size: 5}',
+        '  - {target: C, type: Calculation, input_type: String,',
+        '     output_type: String, source: c, cache_size: 0}',
+    ]))
+    rules = load_rules_from_yaml(str(path))
+    assert [rule.cache_size for rule in rules] == [100, 5, 0]
+    assert rules[0].as_dict()['cache_size'] == 100
+    assert rules[2].cache is None
+
+
+@pytest.mark.parametrize('rule, expected', [
+    (Rule(source='kg', target='T'), True),
+    (Rule(source='kg', target='T', operations=['s.upper()']), True),
+    (Rule(source='a', target='T', type=RuleType.Calculation), False),
+    (Rule(
+        source='a', target='T', type=RuleType.Calculation,
+        operations=['s.upper()']
+    ), False),
+    (Rule(
+        source='a', target='T', type=RuleType.Calculation,
+        operations=['"x".upper()', 's * 2']
+    ), True),
+    (Rule(
+        source='a', target='T', type=RuleType.Calculation,
+        operations=['[c for c in s]']
+    ), False),
+    (Rule(
+        source='a', target='T', type=RuleType.Calculation,
+        input_type=InputType.Integer, operations=['5']
+    ), False),
+])
+def test_rule_is_constant(rule, expected):
+    assert rule.is_constant() is expected
+
+
+def test_rule_constant_value():
+    static = Rule(
+        source='5', target='T', output_type=OutputType.Integer,
+        operations=['s + "0"']
+    )
+    calculation = Rule(
+        source='a', target='T', type=RuleType.Calculation,
+        output_type=OutputType.Date, operations=['datetime(2020, 1, 2)']
+    )
+    assert static.constant_value() == 50
+    assert calculation.constant_value() == datetime(2020, 1, 2)
+
+
+def test_load_rules_from_yaml_rule_cache(tmp_path, monkeypatch):
+    import yaml
+    cache_dir = str(tmp_path / 'cache')
+    rules = load_rules_from_yaml(
+        TEST_ORDER_YAML_FILE_PATH, cache_dir=cache_dir
+    )
+    assert len(os.listdir(cache_dir)) == 1
+
+    def parse(*args, **kwargs):
+        raise AssertionError('parsed the cached config')
+
+    monkeypatch.setattr(yaml, 'load', parse)
+    cached = load_rules_from_yaml(
+        TEST_ORDER_YAML_FILE_PATH, cache_dir=cache_dir
+    )
+    assert [rule.as_dict() for rule in cached] == \
+        [rule.as_dict() for rule in rules]
+    assert [rule.cache_size for rule in cached] == \
+        [rule.cache_size for rule in rules]
+
+    row = {'Order Number': '1000', 'Year': '2018', 'Month': '1', 'Day': '1',
+           'Product Number': 'P-1', 'Product Name': 'kale', 'Count': '5.5'}
+    for rule, cached_rule in zip(rules, cached):
+        assert cached_rule.execute(row) == rule.execute(row)
+
+
+def test_rule_cache_invalidated_by_changes(tmp_path):
+    path = tmp_path / 'config.yaml'
+    cache_dir = str(tmp_path / 'cache')
+    config = '\n'.join([
+        'rules:',
+        '  - {target: A, type: Calculation, input_type: String,',
+        '     output_type: String, source: a, operations: ["s.upper()"]}',
+    ])
+    path.write_text(config)
+    load_rules_from_yaml(str(path), cache_dir=cache_dir)
+
+    path.write_text(config.replace('upper', 'lower'))
+    rules = load_rules_from_yaml(str(path), cache_dir=cache_dir)
+    assert rules[0].execute({'a': 'Kale'}) == ('A', 'kale')
+
+
+def test_rule_cache_unusable(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    load_rules_from_yaml(
+        TEST_ORDER_YAML_FILE_PATH, cache_dir=str(cache_dir)
+    )
+    for name in os.listdir(str(cache_dir)):
+        (cache_dir / name).write_bytes(b'not marshal')
+    rules = load_rules_from_yaml(
+        TEST_ORDER_YAML_FILE_PATH, cache_dir=str(cache_dir)
+    )
+    assert rules[0].target == 'OrderId'
+
+    # a cache_dir that can't be created is skipped
+    not_a_dir = tmp_path / 'file'
+    not_a_dir.write_text('')
+    rules = load_rules_from_yaml(
+        TEST_ORDER_YAML_FILE_PATH, cache_dir=str(not_a_dir)
+    )
+    assert rules[0].target == 'OrderId'
+
+
+def test_filter_rule():
+    rule = Rule(
+        source=['Year', 'Month'],
+        target='Recent',
+        type=RuleType.Filter,
+        input_type=InputType.Integer,
+        operations=['s[0] * 100 + s[1]', 's >= 201806']
+    )
+    assert rule.execute({'Year': '2018', 'Month': '7'}) == ('Recent', True)
+    assert rule.execute({'Year': '2018', 'Month': '1'}) == ('Recent', False)
+    assert rule.execute_row(['2019', '1'], [0, 1]) == ('Recent', True)
+    # filters never memoize
+    rule.cache_size = 10
+    assert rule.cache is None
+
+
+def test_load_rules_from_yaml_filter():
+    rules = load_rules_from_yaml(TEST_FILTER_YAML_FILE_PATH)
+    assert rules[0].type == RuleType.Filter
+    assert rules[0].target == 'Large Orders'
+    assert rules[0].execute({'Count': '9,000.5'}) == ('Large Orders', True)
+    assert rules[0].execute({'Count': '8,999'}) == ('Large Orders', False)
@@ -0,0 +1,119 @@
+import io
+import os
+import mmap
+import pytest
+from csv_etl import CSVConverter, Rule, RuleType, load_rules_from_yaml
+from csv_etl import sources
+from csv_etl.sources import CSVSource, text_reader
+from csv_etl.writers import Writer
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_CSV_FILE_PATH = CWD + '/../examples/order_data/test_data.csv'
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+DATA = b'a,b\r\n1,"x\r\ny"\r\n3,4\r\n'
+
+
+def test_text_reader_range():
+    assert text_reader(DATA).read() == DATA.decode()
+    assert text_reader(DATA, 5, 15).read() == '1,"x\r\ny"\r\n'
+    assert text_reader(memoryview(DATA), 15).read() == '3,4\r\n'
+
+
+def test_text_reader_seek():
+    text = text_reader(DATA)
+    file = text.buffer
+    file.seek(5)
+    assert file.read(3) == b'1,"'
+    file.seek(-5, io.SEEK_END)
+    assert file.read() == b'3,4\r\n'
+
+
+@pytest.mark.parametrize('source', [
+    DATA, bytearray(DATA), memoryview(DATA), io.BytesIO(DATA),
+    io.StringIO(DATA.decode(), newline=''),
+])
+def test_csv_source_open(source):
+    with CSVSource(source).open() as file:
+        assert file.read() == DATA.decode()
+    if hasattr(source, 'closed'):
+        assert not source.closed
+
+
+def test_csv_source_open_path(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_bytes(DATA)
+    with CSVSource(path).open() as file:
+        assert file.read() == DATA.decode()
+    assert file.closed
+
+
+def test_csv_source_open_buffer_maps_files(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_bytes(DATA)
+    with CSVSource(str(path)).open_buffer() as file:
+        assert isinstance(file, mmap.mmap)
+        assert file.read() == DATA
+    assert file.closed
+
+
+def test_csv_source_raise_type_error():
+    with pytest.raises(TypeError):
+        CSVSource(10)
+
+
+@pytest.fixture()
+def order_bytes():
+    with open(TEST_ORDER_CSV_FILE_PATH, 'rb') as file:
+        return file.read()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('wrap', [bytes, memoryview, io.BytesIO])
+def test_convert_buffer(order_bytes, wrap, workers):
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    expected = converter.convert(TEST_ORDER_CSV_FILE_PATH)
+    assert converter.convert(wrap(order_bytes), workers=workers) == expected
+
+
+@pytest.fixture()
+def opened(monkeypatch):
+    files = []
+
+    def recording_open(*args, **kwargs):
+        file = open(*args, **kwargs)
+        files.append(file)
+        return file
+
+    monkeypatch.setattr(sources, 'open', recording_open, raising=False)
+    return files
+
+
+def test_convert_closes_input_when_rule_raises(opened):
+    rule = Rule(
+        source='Count',
+        target='T',
+        type=RuleType.Calculation,
+        operations=['s + undefined_name']
+    )
+    with pytest.raises(NameError):
+        CSVConverter([rule]).convert(TEST_ORDER_CSV_FILE_PATH)
+    assert len(opened) == 1
+    assert opened[0].closed
+
+
+def test_convert_closes_input_when_writer_raises(opened, tmp_path):
+    class FailingWriter(Writer):
+        def write_row(self, row):
+            raise OSError('disk full')
+
+    converter = CSVConverter(load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH))
+    converter._writer = lambda to, file, compact: FailingWriter(
+        file, converter.field_names
+    )
+    with pytest.raises(OSError):
+        converter.convert(
+            TEST_ORDER_CSV_FILE_PATH, outfile=str(tmp_path / 'out.json')
+        )
+    assert opened[0].closed
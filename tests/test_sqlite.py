@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ErrorSink,
+    SourceNotFound,
+    load_config_from_yaml,
+    load_rules_from_yaml
+)
+from csv_etl.sqlite import SQLiteWriter, connect, table_name
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+TEST_AGGREGATE_YAML_FILE_PATH = \
+    CWD + '/../examples/config/aggregate_rule.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    lines = [HEADER]
+    for i in range(500):
+        count = 'n/a' if i % 100 == 0 else '"{:,}.5"'.format(i * 10)
+        lines.append('{},2018,{},{},P-{},product {},{}\r\n'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i % 5, i % 5, count
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def converter_for(path=TEST_ORDER_YAML_FILE_PATH, **options):
+    rules, aggregation = load_config_from_yaml(path)
+    return CSVConverter(
+        rules, errors=ErrorSink(max_messages=0), aggregation=aggregation,
+        **options
+    )
+
+
+def read_table(database, table):
+    with sqlite3.connect(database) as connection:
+        columns = connection.execute(
+            'PRAGMA table_info("{}")'.format(table)
+        ).fetchall()
+        rows = connection.execute(
+            'SELECT * FROM "{}" ORDER BY rowid'.format(table)
+        ).fetchall()
+    return [(column[1], column[2]) for column in columns], rows
+
+
+def test_convert_to_sqlite(order_csv, tmp_path):
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for()
+    assert converter.convert_to_sqlite(order_csv, database) == 500
+
+    columns, rows = read_table(database, 'orders')
+    assert columns == [
+        ('OrderId', 'INTEGER'),
+        ('OrderDate', 'TEXT'),
+        ('ProductId', 'TEXT'),
+        ('ProductName', 'TEXT'),
+        ('Quantity', 'REAL'),
+        ('Unit', 'TEXT'),
+        ('Quantity ^2', 'REAL'),
+    ]
+    assert rows[1] == (
+        1001, '2018-02-02', 'P-1', 'Product 1', 10.5, 'kg', 110.25
+    )
+    # failed conversions are NULL
+    assert rows[0][4] is None
+    assert len(rows) == 500
+
+    # the rows match the other outputs
+    expected = converter.convert(order_csv)
+    names = converter.field_names
+    assert rows[1] == tuple(
+        value.date().isoformat() if name == 'OrderDate' else value
+        for name, value in zip(names, (expected[1][n] for n in names))
+    )
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 10000])
+def test_sqlite_batches(order_csv, tmp_path, batch_size):
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for()
+    converter.convert_to_sqlite(
+        order_csv, database, table='loaded', batch_size=batch_size
+    )
+    _, rows = read_table(database, 'loaded')
+    assert [row[0] for row in rows] == list(range(1000, 1500))
+
+
+def test_sqlite_indexes(order_csv, tmp_path):
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for()
+    converter.convert_to_sqlite(
+        order_csv, database, indexes=['ProductId', ['OrderDate', 'OrderId']]
+    )
+    with sqlite3.connect(database) as connection:
+        indexes = connection.execute(
+            'SELECT name FROM sqlite_master WHERE type = \'index\' '
+            'ORDER BY name'
+        ).fetchall()
+    assert indexes == [('orders_OrderDate_OrderId',), ('orders_ProductId',)]
+
+    with pytest.raises(ValueError):
+        converter.convert_to_sqlite(
+            order_csv, database, indexes=['Missing']
+        )
+
+
+def test_sqlite_replaces_table(order_csv, tmp_path):
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for()
+    converter.convert_to_sqlite(order_csv, database)
+    assert converter.convert(order_csv, to='sqlite', outfile=database) == 500
+    _, rows = read_table(database, 'orders')
+    assert len(rows) == 500
+
+    with pytest.raises(ValueError):
+        converter.convert(order_csv, to='sqlite')
+
+
+def test_sqlite_rolled_back(order_csv, tmp_path):
+    database = str(tmp_path / 'orders.db')
+    converter_for().convert_to_sqlite(order_csv, database)
+
+    # the load fails once the header is read, leaving the table as it was
+    rules = load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH)
+    rules[0].source = 'Missing'
+    converter = CSVConverter(rules, missing_source='fail')
+    with pytest.raises(SourceNotFound):
+        converter.convert_to_sqlite(order_csv, database)
+    _, rows = read_table(database, 'orders')
+    assert len(rows) == 500
+
+
+def test_sqlite_workers(order_csv, tmp_path):
+    converter = converter_for()
+    first = str(tmp_path / 'first.db')
+    second = str(tmp_path / 'second.db')
+    converter.convert_to_sqlite(order_csv, first)
+    converter.convert_to_sqlite(order_csv, second, workers=2)
+    assert read_table(first, 'orders') == read_table(second, 'orders')
+
+
+def test_sqlite_aggregation(order_csv, tmp_path):
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for(TEST_AGGREGATE_YAML_FILE_PATH)
+    groups = converter.convert_to_sqlite(order_csv, database, table='groups')
+    columns, rows = read_table(database, 'groups')
+    assert columns == [
+        ('ProductId', 'TEXT'),
+        ('OrderDate', 'TEXT'),
+        ('Total Quantity', 'REAL'),
+        ('Orders', 'INTEGER'),
+        ('Largest Order', 'REAL'),
+        ('Mean Quantity', 'REAL'),
+        ('Names', 'INTEGER'),
+    ]
+    assert len(rows) == groups
+    assert sum(row[3] for row in rows) == 500
+
+
+def test_sqlite_writer_single_field(tmp_path):
+    connection = connect(str(tmp_path / 'single.db'))
+    writer = SQLiteWriter(connection, ['Name"'], table='names')
+    writer.write_header()
+    writer.write_row({'Name"': 'a'})
+    writer.write_row({'Name"': ''})
+    writer.write_footer()
+    # without a type the column is TEXT, which keeps empty strings
+    assert connection.execute('SELECT * FROM names').fetchall() == \
+        [('a',), ('',)]
+    connection.close()
+
+
+def test_sqlite_empty_strings(tmp_path):
+    csv_file = tmp_path / 'orders.csv'
+    csv_file.write_bytes(HEADER.encode() + (
+        '1000,2018,1,2,P-1,product 1,5\r\n'
+        '1001,2018,1,2,P-2,,n/a\r\n'
+    ).encode())
+    database = str(tmp_path / 'orders.db')
+    converter = converter_for()
+    converter.convert_to_sqlite(str(csv_file), database)
+
+    _, rows = read_table(database, 'orders')
+    # an empty String value stays '', a failed Decimal cast is NULL
+    assert rows[1][3] == ''
+    assert rows[1][4] is None
+    assert converter.convert(str(csv_file))[1]['ProductName'] == ''
+
+
+def test_table_name():
+    assert table_name('data/orders.csv.gz') == 'orders'
+    assert table_name(b'a,b\n') == 'rows'
@@ -0,0 +1,85 @@
+import json
+import subprocess
+import pytest
+from benchmarks.bench_startup import (
+    COMMAND,
+    CONFIG_PATH,
+    CSV_PATH,
+    cli_env,
+    median_time_to_first_row
+)
+
+# Generous, csv-etl starts in ~0.1s, but it used to import numpy and
+# multiprocessing on every run
+STARTUP_BUDGET = 1.0
+
+# Modules a plain conversion shouldn't need to import
+DEFERRED_MODULES = [
+    'numpy', 'multiprocessing', 'gzip', 'bz2', 'lzma', 'zstandard', 'yaml',
+    'sqlite3', 'pyarrow',
+]
+
+# The modules of the package's lazy exports
+DEFERRED_PACKAGE_MODULES = [
+    'csv_etl.stats', 'csv_etl.aggregate', 'csv_etl.lookup', 'csv_etl.table',
+]
+
+# Converts like csv-etl, then prints which DEFERRED_MODULES were imported
+REPORT_MODULES = '''
+import sys, json
+from csv_etl.cli import main
+main(sys.argv[1:], standalone_mode=False)
+print(json.dumps(sorted(set(sys.modules) & set({}))))
+'''
+
+# Imports the package, then prints which modules were imported
+REPORT_PACKAGE_MODULES = '''
+import sys, json
+import csv_etl
+print(json.dumps(sorted(set(sys.modules) & set({}))))
+'''
+
+
+@pytest.fixture()
+def env(tmp_path):
+    return cli_env(str(tmp_path))
+
+
+def deferred_imports(env):
+    script = REPORT_MODULES.format(DEFERRED_MODULES + DEFERRED_PACKAGE_MODULES)
+    output = subprocess.run(
+        COMMAND[:2] + [script, CONFIG_PATH, CSV_PATH, '--format=ndjson'],
+        env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_first_row_imports(env):
+    # the first run parses the config, and caches the rules for the next
+    assert deferred_imports(env) == ['yaml']
+    assert deferred_imports(env) == []
+
+
+def test_package_imports(env):
+    script = REPORT_PACKAGE_MODULES.format(
+        DEFERRED_MODULES + DEFERRED_PACKAGE_MODULES
+    )
+    output = subprocess.run(
+        COMMAND[:2] + [script], env=env, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    assert json.loads(output) == []
+
+
+def test_lazy_exports():
+    import csv_etl
+    from csv_etl.table import RowTable
+    assert csv_etl.RowTable is RowTable
+    assert 'LookupTable' in dir(csv_etl)
+    with pytest.raises(AttributeError):
+        csv_etl.Missing
+
+
+def test_time_to_first_row(env):
+    args = [CONFIG_PATH, CSV_PATH, '--format=ndjson']
+    assert median_time_to_first_row(args, env, 3) < STARTUP_BUDGET
@@ -0,0 +1,248 @@
+import os
+import gzip
+import pickle
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ConversionStats,
+    ErrorSink,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType,
+    load_rules_from_yaml
+)
+from csv_etl.stats import PHASES, RULE_SAMPLE_SIZE, RuleStats
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+def order_text(count, bad_every=0):
+    lines = [HEADER]
+    for i in range(count):
+        day = i % 28 + 1
+        if bad_every and i % bad_every == 0:
+            day = 'n/a'
+        lines.append('{},2018,{},{},P-{},product {},"{:,}.5"\r\n'.format(
+            1000 + i, i % 12 + 1, day, i, i, i * 1000
+        ))
+    return ''.join(lines)
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(order_text(3000, bad_every=10).encode())
+    return str(path)
+
+
+def converter_with(stats, **options):
+    return CSVConverter(
+        load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH),
+        errors=ErrorSink(max_messages=0),
+        stats=stats,
+        **options
+    )
+
+
+def test_stats_off_by_default(order_csv):
+    converter = converter_with(None)
+    assert converter.stats is None
+    assert len(converter.convert(order_csv)) == 3000
+
+
+def test_conversion_stats(order_csv, tmp_path):
+    stats = ConversionStats()
+    converter = converter_with(stats)
+    outfile = str(tmp_path / 'out.csv')
+    assert converter.convert(order_csv, to='csv', outfile=outfile) == 3000
+
+    assert stats.rows == 3000
+    assert stats.total_bytes == os.path.getsize(order_csv)
+    assert stats.bytes_read == stats.total_bytes
+    assert stats.seconds > 0
+    assert stats.read_seconds > 0
+    assert stats.write_seconds > 0
+    assert stats.transform_seconds >= 0
+    assert stats.rows_per_sec > 0
+    # rules are only timed with profile_rules
+    assert stats.rules == {}
+
+
+def test_profile_rules_matches_output(order_csv):
+    expected = converter_with(None).convert(order_csv, to='json')
+    stats = ConversionStats(profile_rules=True)
+    converter = converter_with(stats)
+    assert converter.convert(order_csv, to='json') == expected
+    assert converter.errors.total == 300
+
+    rules = stats.rules
+    assert set(rules) == set(converter.field_names)
+    order_date = rules['OrderDate']
+    assert order_date.calls == 3000
+    assert order_date.errors == {'ConversionError': 300}
+    assert order_date.seconds > 0
+    assert set(order_date.phases) == set(PHASES)
+    assert order_date.percentiles()['p50'] <= \
+        order_date.percentiles()['p99']
+
+    text = stats.format()
+    assert text.startswith('3,000 rows in ')
+    assert 'OrderDate' in text
+
+
+def test_profile_rules_vectorized(order_csv):
+    pytest.importorskip('numpy')
+    expected = converter_with(None).convert(order_csv)
+    stats = ConversionStats(profile_rules=True)
+    converter = converter_with(stats, vectorize=True)
+    # profiling times rules one at a time, instead of by column
+    assert converter.convert(order_csv) == expected
+    assert stats.rules['OrderDate'].calls == 3000
+
+
+def test_profile_rules_cached():
+    rule = Rule(
+        source='Name', target='Name', type=RuleType.Calculation,
+        operations=['s.upper()'], cache_size=10
+    )
+    stats = ConversionStats(profile_rules=True)
+    converter = CSVConverter([rule], stats=stats)
+    result = converter.convert(b'Name\na\nb\na\na\n')
+    assert result == [{'Name': v} for v in ['A', 'B', 'A', 'A']]
+    assert stats.rules['Name'].calls == 4
+    assert stats.rules['Name'].cache_hits == 2
+    assert rule.cache.stats()['hits'] == 2
+
+
+def test_progress_callback(order_csv):
+    calls = []
+    stats = ConversionStats(
+        progress=lambda s: calls.append((s.bytes_read, s.rows)),
+        progress_bytes=10000
+    )
+    converter_with(stats).convert(order_csv)
+
+    size = os.path.getsize(order_csv)
+    assert len(calls) >= 2
+    assert calls[-1] == (size, 3000)
+    reads = [bytes_read for bytes_read, _ in calls]
+    assert reads == sorted(reads)
+
+
+def test_progress_compressed(tmp_path):
+    path = tmp_path / 'orders.csv.gz'
+    path.write_bytes(gzip.compress(order_text(100).encode()))
+    calls = []
+    stats = ConversionStats(progress=calls.append)
+    assert len(converter_with(stats).convert(str(path))) == 100
+    assert stats.total_bytes is None
+    assert calls == [stats]
+
+
+def test_stats_workers(order_csv):
+    expected = converter_with(None).convert(order_csv)
+    calls = []
+    stats = ConversionStats(
+        profile_rules=True, progress=calls.append, progress_bytes=1
+    )
+    converter = converter_with(stats)
+    assert converter.convert(order_csv, workers=2) == expected
+
+    assert stats.rows == 3000
+    assert stats.bytes_read == os.path.getsize(order_csv)
+    assert len(calls) >= 2
+    assert stats.rules['OrderDate'].calls == 3000
+    assert stats.rules['OrderDate'].errors == {'ConversionError': 300}
+
+
+def test_stats_incremental(order_csv, tmp_path):
+    stats = ConversionStats(profile_rules=True)
+    converter = converter_with(stats)
+    outfile = str(tmp_path / 'out.ndjson')
+    assert converter.convert_incremental(order_csv, outfile, 'ndjson') == 3000
+    assert stats.rows == 3000
+    assert stats.rules['OrderDate'].calls == 3000
+
+
+def test_stats_restart_each_conversion(order_csv):
+    stats = ConversionStats(profile_rules=True)
+    converter = converter_with(stats)
+    converter.convert(order_csv)
+    converter.convert(order_csv)
+    assert stats.rows == 3000
+    assert stats.rules['OrderDate'].calls == 3000
+
+
+def test_stats_pickle_drops_progress():
+    stats = ConversionStats(progress=print)
+    assert pickle.loads(pickle.dumps(stats)).progress is None
+
+
+def test_rule_stats_samples_bounded():
+    stats = RuleStats('Target')
+    for i in range(RULE_SAMPLE_SIZE + 500):
+        stats._record(float(i))
+    assert stats.calls == RULE_SAMPLE_SIZE + 500
+    assert len(stats.samples) == RULE_SAMPLE_SIZE
+
+    other = RuleStats('Target')
+    other._record(1.0)
+    other.errors['ConversionError'] = 2
+    stats.merge(other)
+    assert stats.calls == RULE_SAMPLE_SIZE + 501
+    assert stats.errors == {'ConversionError': 2}
+    assert len(stats.samples) == RULE_SAMPLE_SIZE
+
+
+def test_rule_stats_as_dict():
+    rule = Rule(
+        source='Count', target='Count', type=RuleType.Calculation,
+        input_type=InputType.Integer, output_type=OutputType.Integer,
+        operations=['s * 2']
+    )
+    stats = RuleStats('Count')
+    assert stats.execute_row(rule, ['21'], 0) == 42
+    result = stats.as_dict()
+    assert result['calls'] == 1
+    assert result['p50'] == result['p99'] == result['seconds']
+
+
+def test_stats_filters(order_csv):
+    rules = [
+        Rule(
+            source='Month', target='First Half', type=RuleType.Filter,
+            input_type=InputType.Integer, operations=['s <= 6']
+        )
+    ] + load_rules_from_yaml(TEST_ORDER_YAML_FILE_PATH)
+    expected = CSVConverter(rules, errors=ErrorSink(max_messages=0)).convert(
+        order_csv
+    )
+    stats = ConversionStats(profile_rules=True)
+    converter = CSVConverter(
+        rules, errors=ErrorSink(max_messages=0), stats=stats
+    )
+    assert converter.convert(order_csv) == expected
+    assert stats.rows == 1500
+    assert stats.dropped == {'First Half': 1500}
+    assert stats.rules['First Half'].calls == 3000
+    assert stats.rules['OrderDate'].calls == 1500
+    assert "filter 'First Half' dropped 1,500 row(s)" in stats.format()
+
+
+def test_stats_projected_columns(order_csv):
+    # only some columns are read, through a ProjectedReader
+    rule = Rule(
+        source='Order Number', target='OrderId', type=RuleType.Calculation,
+        input_type=InputType.Integer, output_type=OutputType.Integer
+    )
+    stats = ConversionStats()
+    converter = CSVConverter([rule], stats=stats)
+    result = converter.convert(order_csv)
+    assert result[0] == {'OrderId': 1000}
+    assert stats.rows == 3000
+    assert stats.bytes_read == os.path.getsize(order_csv)
@@ -0,0 +1,143 @@
+import os
+import gzip
+import pickle
+import pytest
+from csv_etl import (
+    CSVConverter,
+    ErrorSink,
+    RowTable,
+    load_config_from_yaml
+)
+from csv_etl.sqlite import SQLiteWriter, connect
+
+CWD = os.path.dirname(__file__)
+
+TEST_ORDER_YAML_FILE_PATH = CWD + '/../examples/config/sample_config.yaml'
+TEST_AGGREGATE_YAML_FILE_PATH = \
+    CWD + '/../examples/config/aggregate_rule.yaml'
+
+HEADER = 'Order Number,Year,Month,Day,Product Number,Product Name,Count\r\n'
+
+
+@pytest.fixture()
+def order_csv(tmp_path):
+    lines = [HEADER]
+    for i in range(200):
+        count = 'n/a' if i % 50 == 0 else '"{:,}.5"'.format(i * 10)
+        lines.append('{},2018,{},{},P-{},product {},{}\r\n'.format(
+            1000 + i, i % 12 + 1, i % 28 + 1, i % 5, i % 5, count
+        ))
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(''.join(lines).encode())
+    return str(path)
+
+
+def converter_for(path=TEST_ORDER_YAML_FILE_PATH):
+    rules, aggregation = load_config_from_yaml(path)
+    return CSVConverter(
+        rules, errors=ErrorSink(max_messages=0), aggregation=aggregation
+    )
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_to_table(order_csv, workers):
+    converter = converter_for()
+    table = converter.convert(order_csv, to='table', workers=workers)
+    rows = converter.convert(order_csv)
+
+    assert isinstance(table, RowTable)
+    assert len(table) == 200
+    assert table.field_names == converter.field_names
+    assert type(table.rows[0]) is tuple
+    assert table == rows
+    assert list(table) == rows
+    assert table.to_dicts() == rows
+
+
+def test_table_indexing(order_csv):
+    converter = converter_for()
+    table = converter.convert(order_csv, to='table')
+    rows = converter.convert(order_csv)
+
+    assert table[1] == rows[1]
+    assert table[-1] == rows[-1]
+    with pytest.raises(IndexError):
+        table[200]
+
+    assert table['OrderId'] == list(range(1000, 1200))
+    with pytest.raises(KeyError):
+        table['Missing']
+
+    sliced = table[10:20]
+    assert isinstance(sliced, RowTable)
+    assert sliced == rows[10:20]
+
+    selected = table[['Quantity', 'OrderId']]
+    assert selected.field_names == ['Quantity', 'OrderId']
+    assert selected[1] == {'Quantity': 10.5, 'OrderId': 1001}
+    assert table.select(['OrderId']).rows[0] == (1000,)
+    assert selected.date_fields == []
+    assert table.select(['OrderDate']).date_fields == ['OrderDate']
+
+
+@pytest.mark.parametrize('to', ['csv', 'json', 'ndjson'])
+@pytest.mark.parametrize('compact', [True, False])
+def test_table_write(order_csv, tmp_path, to, compact):
+    converter = converter_for()
+    table = converter.convert(order_csv, to='table')
+    expected = converter.convert(order_csv, to=to, compact=compact)
+    assert table.write(to, compact=compact) == expected
+
+    outfile = str(tmp_path / 'orders.{}.gz'.format(to))
+    assert table.write(to, outfile, compact=compact) == 200
+    with gzip.open(outfile, 'rt', newline='') as file:
+        assert file.read() == expected
+
+    with pytest.raises(ValueError):
+        table.write('xml')
+
+
+def test_table_write_to_sqlite(order_csv, tmp_path):
+    converter = converter_for()
+    table = converter.convert(order_csv, to='table')
+    connection = connect(str(tmp_path / 'orders.db'))
+    writer = SQLiteWriter(
+        connection, table.field_names, table.date_fields,
+        table='orders', field_types=converter.field_types
+    )
+    assert table.write_to(writer) == 200
+    rows = connection.execute('SELECT OrderId, OrderDate FROM orders')
+    assert rows.fetchone() == (1000, '2018-01-01')
+    connection.close()
+
+
+def test_table_aggregation(order_csv):
+    converter = converter_for(TEST_AGGREGATE_YAML_FILE_PATH)
+    table = converter.convert(order_csv, to='table')
+    assert table == converter.convert(order_csv)
+    assert sum(table['Orders']) == 200
+
+
+def test_table_repeated_target():
+    table = RowTable(['a', 'b', 'a'], [(1, 2, 1), (3, 4, 3)])
+    assert table[0] == {'a': 1, 'b': 2}
+    assert table['a'] == [1, 3]
+    assert table.write('csv') == 'a,b,a\r\n1,2,1\r\n3,4,3\r\n'
+
+
+def test_table_pickle(order_csv):
+    table = converter_for().convert(order_csv, to='table')
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy == table
+    assert copy['OrderId'] == table['OrderId']
+    assert repr(copy) == '<RowTable 200 row(s) x 7 field(s)>'
+
+
+def test_empty_table(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_bytes(HEADER.encode())
+    table = converter_for().convert(str(path), to='table')
+    assert len(table) == 0
+    assert table == []
+    assert table.write('json') == '[]'
+    assert table['OrderId'] == []
@@ -0,0 +1,158 @@
+import os
+import random
+import pytest
+from csv_etl import (
+    CSVConverter,
+    Rule,
+    RuleType,
+    InputType,
+    OutputType,
+    load_rules_from_yaml
+)
+from csv_etl.vectorized import parse_operations
+
+numpy = pytest.importorskip('numpy')
+
+CWD = os.path.dirname(__file__)
+
+TEST_CONFIG_DIR = CWD + '/../examples/config/'
+
+HEADER = ['A', 'B', 'Name', 'Day', 'Month', 'Year', 'Count']
+
+VALUES = [
+    '0', '-0', '1', '-1', '7', '3.5', '-2.25', '1,000', '"1,234.5"', '1e3',
+    '', 'n/a', '9007199254740993', '1' + '0' * 30, '1e300', 'nan', '-0.0',
+    '0.1', ' 42 ', '1_000',
+]
+
+
+def calculation(source, target, input_type, output_type, operations):
+    return Rule(
+        source=source,
+        target=target,
+        type=RuleType.Calculation,
+        input_type=input_type,
+        output_type=output_type,
+        operations=operations
+    )
+
+
+RULES = [
+    calculation('A', 'A int', InputType.Integer, OutputType.Integer, []),
+    calculation('A', 'A dec', InputType.Decimal, OutputType.Decimal, []),
+    calculation('A', 'A trunc', InputType.Decimal, OutputType.Integer, []),
+    calculation(
+        ['A', 'B'], 'Product', InputType.Decimal, OutputType.Decimal,
+        ['s[0] * s[1]']
+    ),
+    calculation(
+        ['A', 'B'], 'Mixed', InputType.Integer, OutputType.Decimal,
+        ['-s[0] * 2 - s[-1] / 4', 's + 0.5', '-s']
+    ),
+    calculation(
+        'B', 'Negated', InputType.Integer, OutputType.Decimal,
+        ['-s', 's * 1.5']
+    ),
+    calculation(
+        'B', 'Chain', InputType.Integer, OutputType.Integer,
+        ['s / 2', 's + 5']
+    ),
+    calculation(
+        'B', 'Squared', InputType.Integer, OutputType.Integer, ['s * s * s']
+    ),
+    calculation('Name', 'Name', InputType.String, OutputType.String,
+                ['s.title()']),
+    Rule(source='kg', target='Unit', type=RuleType.Static),
+]
+
+
+def write_csv(path, rows):
+    lines = [','.join(HEADER)]
+    for row in rows:
+        lines.append(','.join(row))
+    path.write_text('\n'.join(lines))
+    return str(path)
+
+
+@pytest.fixture()
+def random_csv(tmp_path):
+    generator = random.Random(6)
+    rows = []
+    for i in range(400):
+        rows.append([
+            generator.choice(VALUES),
+            generator.choice(VALUES[:10]),
+            'item {}'.format(i),
+            str(i % 28 + 1), str(i % 12 + 1), '2020',
+            '"{:,}.5"'.format(generator.randint(0, 10 ** 6)),
+        ])
+    return write_csv(tmp_path / 'random.csv', rows)
+
+
+def test_vectorized_matches_scalar(random_csv, capsys):
+    expected = CSVConverter(RULES).convert(random_csv, to='json')
+    expected_errors = capsys.readouterr().out
+    converter = CSVConverter(RULES, vectorize=True, batch_size=64)
+    result = converter.convert(random_csv, to='json')
+    assert result == expected
+    assert capsys.readouterr().out == expected_errors
+
+
+def test_vectorized_rules_selected(random_csv):
+    converter = CSVConverter(RULES, vectorize=True)
+    plan = converter.batch_plan(HEADER)
+    vectorized = [rule.rule.target for rule in plan.vector_rules]
+    assert vectorized == [rule.target for rule in RULES[:8]]
+
+
+@pytest.mark.parametrize('value', ['inf', '1e400'])
+def test_vectorized_infinite_to_integer_raises(tmp_path, value):
+    path = write_csv(tmp_path / 'inf.csv', [[value, '', '', '', '', '', '']])
+    rules = [RULES[2]]
+    with pytest.raises(OverflowError):
+        CSVConverter(rules).convert(path)
+    with pytest.raises(OverflowError):
+        CSVConverter(rules, vectorize=True).convert(path)
+
+
+def test_vectorized_division_by_zero_raises(tmp_path):
+    path = write_csv(tmp_path / 'zero.csv', [['1', '0', 'x', '', '', '', '']])
+    rules = [calculation(
+        ['A', 'B'], 'Ratio', InputType.Decimal, OutputType.Decimal,
+        ['s[0] / s[1]']
+    )]
+    with pytest.raises(ZeroDivisionError):
+        CSVConverter(rules, vectorize=True).convert(path)
+
+
+@pytest.mark.parametrize('operation', [
+    's ** 2', 's // 2', 's % 2', 'abs(s)', 's[0]', 's > 1', 'x', '2 ** 60',
+])
+def test_parse_operations_unsupported(operation):
+    rule = calculation(
+        'A', 'T', InputType.Decimal, OutputType.Decimal, [operation]
+    )
+    assert parse_operations(rule, 0) is None
+
+
+def test_parse_operations_list_source_needs_subscript():
+    rule = calculation(
+        ['A', 'B'], 'T', InputType.Decimal, OutputType.Decimal, ['s * 2']
+    )
+    assert parse_operations(rule, [0, 1]) is None
+    rule.operations = []
+    assert parse_operations(rule, [0, 1]) is None
+
+
+@pytest.mark.parametrize('config', sorted(os.listdir(TEST_CONFIG_DIR)))
+def test_vectorized_example_configs(config, random_csv):
+    rules = load_rules_from_yaml(TEST_CONFIG_DIR + config)
+    for rule in rules:
+        # point the example sources at numeric columns of the random csv
+        if rule.source == 'Product Number':
+            rule.source = 'Name'
+    expected = CSVConverter(rules).convert(random_csv)
+    result = CSVConverter(rules, vectorize=True, batch_size=50).convert(
+        random_csv
+    )
+    assert result == expected
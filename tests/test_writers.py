@@ -0,0 +1,133 @@
+import io
+import json
+from datetime import datetime
+from csv_etl.writers import (
+    CustomEncoder,
+    CSVWriter,
+    JSONWriter,
+    NDJSONWriter,
+    COMPACT_SEPARATORS,
+    format_date,
+    get_writer
+)
+
+import pytest
+
+FIELD_NAMES = ['Name', 'Date', 'Count']
+
+ROWS = [
+    {'Name': 'Arugola', 'Date': datetime(2018, 1, 1), 'Count': 5250.5},
+    {'Name': 'Iceberg\nLettuce', 'Date': datetime(2017, 12, 12), 'Count': 1},
+]
+
+
+def write(writer_class, rows, **options):
+    result = io.StringIO()
+    writer = writer_class(result, FIELD_NAMES, **options)
+    writer.write_header()
+    for row in rows:
+        writer.write_row(row)
+    writer.write_footer()
+    return result.getvalue()
+
+
+def test_json_writer_matches_json_dumps():
+    expected = json.dumps(ROWS, indent=4, cls=CustomEncoder)
+    assert write(JSONWriter, ROWS) == expected
+
+
+def test_json_writer_date_fields_match_json_dumps():
+    expected = json.dumps(ROWS, indent=4, cls=CustomEncoder)
+    assert write(JSONWriter, ROWS, date_fields=['Date']) == expected
+
+
+def test_json_writer_compact():
+    expected = json.dumps(
+        ROWS, separators=COMPACT_SEPARATORS, cls=CustomEncoder
+    )
+    result = write(JSONWriter, ROWS, date_fields=['Date'], compact=True)
+    assert result == expected
+    assert write(JSONWriter, [], compact=True) == '[]'
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_ndjson_writer(compact):
+    result = write(
+        NDJSONWriter, ROWS, date_fields=['Date'], compact=compact
+    )
+    lines = result.split('\n')
+    assert lines[-1] == ''
+    assert [json.loads(line) for line in lines[:-1]] == [
+        {'Name': 'Arugola', 'Date': '2018-01-01', 'Count': 5250.5},
+        {'Name': 'Iceberg\nLettuce', 'Date': '2017-12-12', 'Count': 1},
+    ]
+    assert (' ' not in result) == compact
+
+
+def test_json_writer_date_fields_not_mutated():
+    row = dict(ROWS[0])
+    write(NDJSONWriter, [row], date_fields=['Date', 'Missing'])
+    assert row == ROWS[0]
+
+
+@pytest.mark.parametrize('date', [
+    datetime(2018, 1, 1, 12, 30), datetime(999, 12, 31), datetime(1, 1, 1)
+])
+def test_format_date_matches_strftime(date):
+    assert format_date(date) == date.strftime('%Y-%m-%d')
+
+
+def test_json_writer_empty():
+    assert write(JSONWriter, []) == json.dumps([], indent=4)
+
+
+def test_csv_writer():
+    result = write(CSVWriter, ROWS)
+    assert result.startswith('Name,Date,Count\r\n')
+    assert '"Iceberg\nLettuce"' in result
+
+
+def test_get_writer_unknown_format():
+    with pytest.raises(ValueError):
+        get_writer('xml', io.StringIO(), FIELD_NAMES)
+
+
+def write_values(writer_class, field_names, rows, **options):
+    result = io.StringIO()
+    writer = writer_class(result, field_names, **options)
+    writer.write_header()
+    for row in rows:
+        writer.write_values(tuple(row[name] for name in field_names))
+    writer.write_footer()
+    return result.getvalue()
+
+
+@pytest.mark.parametrize('writer_class', [JSONWriter, NDJSONWriter])
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('date_fields', [[], ['Date']])
+def test_json_write_values_matches_write_row(
+    writer_class, compact, date_fields
+):
+    rows = ROWS + [
+        {'Name': 'café "quoted"', 'Date': '', 'Count': float('nan')},
+        {'Name': None, 'Date': datetime(999, 1, 1), 'Count': float('-inf')},
+        {'Name': True, 'Date': False, 'Count': -12},
+        # not a scalar, so the row is encoded from a dict
+        {'Name': ['a', 1], 'Date': {'b': 2.5}, 'Count': 0.1},
+    ]
+    options = {'compact': compact, 'date_fields': date_fields}
+    assert write_values(writer_class, FIELD_NAMES, rows, **options) == \
+        write(writer_class, rows, **options)
+
+
+@pytest.mark.parametrize('field_names', [[], ['Name'], ['Name', 'Name']])
+def test_json_write_values_field_names(field_names):
+    rows = [{'Name': 'a'}, {'Name': ''}]
+    expected = json.dumps(
+        [{name: row[name] for name in field_names} for row in rows], indent=4
+    )
+    assert write_values(JSONWriter, field_names, rows) == expected
+
+
+def test_csv_write_values():
+    assert write_values(CSVWriter, FIELD_NAMES, ROWS) == write(CSVWriter, ROWS)